@@ -1,5 +1,4 @@
 import os
-import torch
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,18 +9,144 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data", "images").replace("\\", "/") # Adjust if your folder name differs
 INDEX_DIR = os.path.join(BASE_DIR, "indexes")
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+THUMB_DIR = os.path.join(BASE_DIR, "thumbnails")
 
 # Ensure dirs exist
 os.makedirs(INDEX_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(THUMB_DIR, exist_ok=True)
 
-# Device
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Device (resolved lazily: importing torch just to read this costs seconds of cold start)
+_device = os.getenv("DEVICE")
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = "cuda" if torch.cuda.is_available() else "cpu"
+    return _device
+
+def __getattr__(name):
+    # Keeps `from backend.config import DEVICE` working (it imports torch at that point)
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # API Keys
 API_KEY = os.getenv("OPENAI_API_KEY")
 BASE_URL = os.getenv("OPENAI_BASE_URL")
 LLM_MODEL = "gpt-4.1-nano" # Or your specific model name
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16)) # In-flight LLM calls per process
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2)) # Extra attempts on 429/5xx/connection errors, within the call's timeout
+LLM_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", 0)) # >0: send a second identical request if the first is this slow
 
 # Constants
-TOP_K = 30
\ No newline at end of file
+TOP_K = 30
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", 200)) # Upper bound for caller-supplied top_k
+
+# Thumbnails (pre-generated tiers for result grids)
+THUMB_SIZES = (128, 256, 512)
+THUMB_GRID_SIZE = 256 # Size linked from SearchResult.thumbnail_url
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp") # "webp" or "jpeg"
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", os.cpu_count() or 4))
+
+# Perceptual-hash query caches (re-uploaded photos / near-identical sketches)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 512))
+QUERY_CACHE_MAX_DISTANCE = int(os.getenv("QUERY_CACHE_MAX_DISTANCE", 6)) # Hamming bits out of 64 (photos)
+# Thresholded line drawings are mostly white, so unrelated sketches hash close together:
+# sketch caches only reuse an entry for the same hash unless this is raised
+SKETCH_CACHE_MAX_DISTANCE = int(os.getenv("SKETCH_CACHE_MAX_DISTANCE", 0))
+
+# CLIP image preprocessing
+FAST_PREPROCESS = os.getenv("FAST_PREPROCESS", "1") == "1" # Vectorized path instead of CLIPProcessor
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", min(8, os.cpu_count() or 4)))
+
+# Sampling profiler (/debug/profile is 404 unless enabled)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN") # If set, callers must send X-Profiler-Token
+PROFILE_STARTUP_SECONDS = float(os.getenv("PROFILE_STARTUP_SECONDS", 0)) # >0 profiles the boot
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
+
+# Request tracing (per-stage spans, Server-Timing header, slow-request log)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+SLOW_LOG_PATH = os.getenv("SLOW_LOG_PATH", os.path.join(BASE_DIR, "slow_requests.jsonl"))
+
+# Models warmed in a background thread after startup (others load on first use)
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "clip,reranker").split(",") if m.strip()]
+
+# Index manifest (lets startup skip the catalogue scan when nothing changed)
+MANIFEST_PATH = os.path.join(INDEX_DIR, "manifest.json")
+MANIFEST_VERIFY_CHECKSUMS = os.getenv("MANIFEST_VERIFY_CHECKSUMS", "0") == "1" # Also sha256 the index files on boot
+FORCE_REINDEX = os.getenv("FORCE_REINDEX", "0") == "1"
+
+# Index hot-swap (/admin/reload; manifest watcher picks up external builds)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") # If set, /admin/* callers must send X-Admin-Token
+INDEX_WATCH_SECONDS = float(os.getenv("INDEX_WATCH_SECONDS", 0)) # >0 polls manifest.json and reloads on change
+
+# Live ingestion (POST /items, optional DATA_DIR watcher)
+EMBED_DIM = 512 # CLIP ViT-B/32 projection size
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 16))
+# POST /items writes into DATA_DIR: it needs ADMIN_TOKEN, unless anonymous uploads are explicitly allowed
+INGEST_ALLOW_ANONYMOUS = os.getenv("INGEST_ALLOW_ANONYMOUS", "0") == "1"
+INGEST_MAX_UPLOAD_MB = float(os.getenv("INGEST_MAX_UPLOAD_MB", 20))
+INGEST_WATCH_SECONDS = float(os.getenv("INGEST_WATCH_SECONDS", 0)) # >0 polls DATA_DIR for new images
+
+# "More like this" (/similar/{item_id}): neighbours precomputed per item at index build
+NEIGHBORS_K = int(os.getenv("NEIGHBORS_K", 32))
+
+# Sharded index builds (python -m backend.search.sharded_build)
+SHARD_DIR = os.path.join(INDEX_DIR, "shards")
+
+# Scatter-gather serving: "off", "local" (in-process shards) or "process" (one worker per shard file)
+SHARDED_SEARCH = os.getenv("SHARDED_SEARCH", "off").lower()
+SEARCH_SHARDS = int(os.getenv("SEARCH_SHARDS", 4)) # "process" needs this many shards in SHARD_DIR
+SHARD_THREADS = int(os.getenv("SHARD_THREADS", 1)) # faiss OpenMP threads per shard worker
+
+# Out-of-process inference: model families listed here run in their own worker
+# process (clip, reranker, trocr, whisper); empty = everything in the API process
+INFERENCE_WORKERS = [m.strip() for m in os.getenv("INFERENCE_WORKERS", "").split(",") if m.strip()]
+# Torch threads per worker, e.g. "clip=4,reranker=2"; unlisted families get 1
+INFERENCE_THREADS = {k.strip(): int(v) for k, v in
+                     (p.split("=") for p in os.getenv("INFERENCE_THREADS", "clip=4,reranker=2,trocr=2,whisper=2").split(",") if "=" in p)}
+
+# Admission control: per-endpoint-class concurrency limits + bounded priority queues
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", max(8, os.cpu_count() or 4))) # all classes together
+# class -> max concurrent, e.g. "visual=8,sketch=2"; waiting requests get a queue of 8x that
+ADMISSION_LIMITS = {k.strip(): int(v) for k, v in
+                    (p.split("=") for p in os.getenv("ADMISSION_LIMITS", "visual=8,text=4,sketch=2,ocr=2,voice=2").split(",") if "=" in p)}
+# class -> seconds a request may wait for a slot before a 503
+ADMISSION_WAIT_S = {k.strip(): float(v) for k, v in
+                    (p.split("=") for p in os.getenv("ADMISSION_WAIT_S", "visual=2,text=3,sketch=10,ocr=10,voice=10").split(",") if "=" in p)}
+
+# Request deadlines: per admission class, in ms (X-Request-Deadline-Ms overrides, up to the max)
+REQUEST_DEADLINE_MS = {k.strip(): float(v) for k, v in
+                       (p.split("=") for p in os.getenv("REQUEST_DEADLINE_MS", "text=5000,sketch=15000,ocr=12000,voice=20000").split(",") if "=" in p)}
+MAX_REQUEST_DEADLINE_MS = float(os.getenv("MAX_REQUEST_DEADLINE_MS", 60000))
+# Budget a stage needs to be worth starting; with less left it's skipped and the response degrades
+DEADLINE_STAGE_S = {k.strip(): float(v) for k, v in
+                    (p.split("=") for p in os.getenv("DEADLINE_STAGE_S", "rerank=0.5,sketch_llm=3,llm_refine=1.5,llm_vision=4,trocr=1.5").split(",") if "=" in p)}
+VISION_OCR_TIMEOUT_S = float(os.getenv("VISION_OCR_TIMEOUT_S", 15))
+
+# Persistent LLM response cache (sqlite, shared by every worker process on the machine)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm_cache.sqlite3"))
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", 30 * 86400))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", 64))
+
+# Voice: energy-based speech detection before Whisper
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", 12)) # Frames this far above the noise floor count as speech
+VAD_MIN_SPEECH_DB = float(os.getenv("VAD_MIN_SPEECH_DB", -45)) # ...and at least this loud (dBFS)
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", 8))
+
+# Streaming voice search (/ws/voice)
+VOICE_STREAM_STEP_S = float(os.getenv("VOICE_STREAM_STEP_S", 1.0)) # Re-transcribe after this much new audio
+VOICE_STREAM_WINDOW_S = float(os.getenv("VOICE_STREAM_WINDOW_S", 15)) # Longer windows are finalised up to their last pause
+# A session ends after this much audio. Compressed (webm/opus) streams are re-decoded
+# whole on every step, so their ffmpeg work grows with the square of this (60 s ~ 30 min decoded)
+VOICE_STREAM_MAX_S = float(os.getenv("VOICE_STREAM_MAX_S", 60))
+
+# Live sketch search (/ws/sketch)
+SKETCH_DEBOUNCE_MS = float(os.getenv("SKETCH_DEBOUNCE_MS", 150)) # Shape search once strokes stop arriving this long
+SKETCH_PAUSE_MS = float(os.getenv("SKETCH_PAUSE_MS", 1200)) # LLM interpretation + rerank after a pause this long
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import sys
@@ -6,10 +7,12 @@ import os
 import shutil
 import json
 import numpy as np
-import faiss
 from PIL import Image
-from typing import List
+from typing import List, Optional
 from contextlib import asynccontextmanager
+import asyncio
+import uuid
+from io import BytesIO
 
 # --- DEBUG LOGGING ---
 import os
@@ -42,161 +45,62 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 from backend.schemas import SearchResult, TextSearchRequest, OCRResponse, TextSearchResponse
-from backend.config import DATA_DIR, INDEX_DIR
-from backend.models.clip import get_image_embedding
-from backend.search import image_search, sketch_search
+from backend.config import DATA_DIR, THUMB_DIR, FORCE_REINDEX, ADMIN_TOKEN, INDEX_WATCH_SECONDS
+from backend.config import INGEST_WATCH_SECONDS, REQUEST_DEADLINE_MS, MAX_REQUEST_DEADLINE_MS
+from backend.config import INGEST_ALLOW_ANONYMOUS, INGEST_MAX_UPLOAD_MB
+from backend.config import PROFILER_ENABLED, PROFILER_TOKEN, PROFILE_STARTUP_SECONDS, PROFILE_DIR
+from backend.utils.profiler import SamplingProfiler, profile_lock, profile_startup
+
+# Start sampling before the heavy imports so model loading shows up in the profile
+if PROFILE_STARTUP_SECONDS > 0:
+    profile_startup(PROFILE_STARTUP_SECONDS, PROFILE_DIR)
+from backend.search import image_search, sketch_search, index_builder, index_store, ingest
+from backend.search.manifest import load_manifest, check_manifest
 from backend.ocr.ocr_pipeline import extract_text_from_image, llm_refine_ocr_text
-from backend.utils.captioning import generate_caption
-from backend.utils.captioning import generate_caption
-from backend.utils.sketch_utils import photo_to_sketch_database
 from backend.voice.transcriber import transcribe_audio
-from tqdm import tqdm
+from backend.voice.streaming import VoiceStream, PCM_FORMATS
+from backend.utils.thumbnails import rel_data_path, thumbnail_url
+from backend.utils.query_cache import all_cache_stats
+from backend.utils import metrics, admission, deadline, llm_client, llm_cache, wire
+from backend.utils.metrics import timed
+from backend.utils import tracing
+from backend.config import TRACING_ENABLED, SLOW_REQUEST_MS, SLOW_LOG_PATH, PRELOAD_MODELS
+from backend.config import SKETCH_DEBOUNCE_MS, SKETCH_PAUSE_MS, MAX_TOP_K
+from backend.models.preload import preload_in_background, loaded_models
+from backend.models import workers
 
 # --- LIFESPAN MANAGER (Replaces initialize_system) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Starting System Initialization...")
     
-    METADATA_JSON = os.path.join(INDEX_DIR, "metadata_with_captions.json")
-    
-    # 1. LOAD / BUILD METADATA
-    if os.path.exists(METADATA_JSON):
-        with open(METADATA_JSON, 'r') as f:
-            existing_meta = json.load(f)
-    else:
-        existing_meta = {}
-
-    new_meta = {}
-    
-    # Only scan if data directory exists
+    # 1. VALIDATE MANIFEST / SCAN + BUILD
+    # The manifest from the last build is checked in O(directories); the full
+    # catalogue walk (and any index rebuild) only runs when something changed.
     if os.path.exists(DATA_DIR):
-        for category in os.listdir(DATA_DIR):
-            cat_path = os.path.join(DATA_DIR, category)
-            if not os.path.isdir(cat_path): continue
-            
-            for img_name in os.listdir(cat_path):
-                if img_name.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    full_path = os.path.join(cat_path, img_name)
-                    
-                    if img_name in existing_meta:
-                        caption = existing_meta[img_name]['caption']
-                    else:
-                        # minimal fallback or lazy generation could be better here
-                        # but keeping original logic for consistency
-                        try:
-                            img = Image.open(full_path).convert("RGB")
-                            caption = generate_caption(img, category_name=category)
-                        except:
-                            caption = f"a {category} made of gold or silver"
-                    
-                    new_meta[img_name] = {
-                        "image_path": full_path, 
-                        "category": category, 
-                        "id": img_name,
-                        "caption": caption
-                    }
-
-        # Save metadata if changed
-        if new_meta != existing_meta:
-            print("Updates detected (paths or content). Saving new metadata...")
-            with open(METADATA_JSON, 'w') as f:
-                json.dump(new_meta, f, indent=4)
-        
-        # 2. BUILD VISUAL INDEX
-        img_idx_path = os.path.join(INDEX_DIR, "faiss_image.index")
-        meta_npy_path = os.path.join(INDEX_DIR, "metadata.npy")
-        
-        # Force rebuild if metadata changed or index missing
-        # We check if meta_npy exists and if it matches new_meta
-        should_rebuild_index = False
-        if not os.path.exists(img_idx_path):
-             should_rebuild_index = True
-        elif new_meta != existing_meta:
-             should_rebuild_index = True
-             
-        if should_rebuild_index:
-            print("Building Visual Index...")
-            embeddings = []
-            meta_list = list(new_meta.values())
-            
-            batch_size = 32
-            image_batch = []
-            
-            print(f"Processing {len(meta_list)} images in batches of {batch_size}...")
-            
-            for i in tqdm(range(0, len(meta_list), batch_size)):
-                batch_items = meta_list[i:i+batch_size]
-                current_batch_imgs = []
-                for item in batch_items:
-                    try:
-                        img = Image.open(item['image_path']).convert("RGB")
-                        current_batch_imgs.append(img)
-                    except Exception as e:
-                        print(f"Error loading {item['image_path']}: {e}")
-                        # Black placeholder
-                        current_batch_imgs.append(Image.new("RGB", (224, 224)))
-                
-                if current_batch_imgs:
-                    batch_embs = get_image_embedding(current_batch_imgs)
-                    embeddings.append(batch_embs)
-            
-            if embeddings:
-                embeddings = np.vstack(embeddings).astype('float32')
-                faiss.normalize_L2(embeddings)
-                index = faiss.IndexFlatIP(embeddings.shape[1])
-                index.add(embeddings)
-                faiss.write_index(index, img_idx_path)
-                np.save(meta_npy_path, meta_list)
-        
-        # 3. BUILD SKETCH INDEX
-        sketch_idx_path = os.path.join(INDEX_DIR, "faiss_sketch.index")
-        
-        if not os.path.exists(sketch_idx_path) or should_rebuild_index:
-            print("🎨 Building Artistic Sketch Index (Batched)...")
-            embeddings = []
-            
-            # For sketch, we need to process one by one because photo_to_sketch is complex/slow typically?
-            # actually photo_to_sketch_database might be CPU bound opencv.
-            # But we can still batch the *embedding* part.
-            
-            sketch_batch_imgs = []
-            valid_indices = [] # To keep track if we skip any
-            
-            for i, item in enumerate(tqdm(meta_list)):
-                try:
-                    pil_sketch = photo_to_sketch_database(item['image_path'])
-                    if pil_sketch:
-                         sketch_batch_imgs.append(pil_sketch)
-                    else:
-                         sketch_batch_imgs.append(Image.new("RGB", (224, 224))) # Placeholder
-                except:
-                     sketch_batch_imgs.append(Image.new("RGB", (224, 224)))
-
-                if len(sketch_batch_imgs) >= 32:
-                    embeddings.append(get_image_embedding(sketch_batch_imgs))
-                    sketch_batch_imgs = []
-            
-            if sketch_batch_imgs:
-                 embeddings.append(get_image_embedding(sketch_batch_imgs))
+        reason = "FORCE_REINDEX set" if FORCE_REINDEX else check_manifest(load_manifest())
+        if reason is None:
+            print("⚡ Manifest matches catalogue and indexes, skipping scan")
+        else:
+            print(f"🔍 Scanning catalogue ({reason})...")
+            index_builder.build(force=FORCE_REINDEX)
 
-            if embeddings:
-                embeddings = np.vstack(embeddings).astype('float32')
-                
-            if embeddings:
-                embeddings = np.array(embeddings).astype('float32')
-                faiss.normalize_L2(embeddings)
-                index = faiss.IndexFlatIP(embeddings.shape[1])
-                index.add(embeddings)
-                faiss.write_index(index, sketch_idx_path)
-
-    # Load indices into memory
+    # Load indices into memory (one bundle: photo + sketch index, caption embeddings, metadata)
     image_search.load_index()
-    # Sketch index loader requires metadata to be already loaded in image_search
-    sketch_search.load_sketch_index(image_search.metadata)
+    if INDEX_WATCH_SECONDS > 0:
+        index_store.watch_manifest(INDEX_WATCH_SECONDS)
+    if INGEST_WATCH_SECONDS > 0 and os.path.exists(DATA_DIR):
+        ingest.watch_data_dir(INGEST_WATCH_SECONDS)
+
+    # Heavy models load on first use; warm the common ones without blocking startup
+    preload_in_background(PRELOAD_MODELS)
     
     print("✅ System Ready")
     yield
     print("🛑 Shutting down...")
+    index_store.close()
+    workers.shutdown()
+    llm_client.close()
 
 
 app = FastAPI(title="Jewellery Retrieval API", lifespan=lifespan)
@@ -210,13 +114,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(admission.Rejected)
+async def admission_rejected(request: Request, exc: admission.Rejected):
+    detail = "Too many queued requests" if exc.status == 429 else "Server busy, try again shortly"
+    return JSONResponse({"detail": f"{detail} ({exc.cls})", "reason": exc.reason}, status_code=exc.status,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+class ImmutableStaticFiles(StaticFiles):
+    """Thumbnail URLs are versioned (?v=mtime), so browsers/CDNs may cache them forever."""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    import time
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/similar/{item_id}), never the raw path: ids and
+        # 404 probes would each add a series. Static mounts set no route, bucket by prefix.
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
+        elif request.url.path.startswith(("/data/", "/thumbs/")):
+            path = "/" + request.url.path.split("/")[1]
+        else:
+            path = "unmatched"
+        metrics.histogram("http_request_duration_seconds", "End-to-end request latency",
+                          method=request.method, path=path, status=str(status)).observe(time.perf_counter() - t0)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not TRACING_ENABLED or request.url.path.startswith(("/data/", "/thumbs/", "/metrics")):
+        return await call_next(request)
+
+    trace, token = tracing.start_trace(f"{request.method} {request.url.path}")
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = trace.id
+        return response
+    finally:
+        tracing.end_trace(token)
+        total_ms = trace.elapsed_ms()
+        if total_ms >= SLOW_REQUEST_MS:
+            try:
+                tracing.write_slow_log(SLOW_LOG_PATH, trace.to_dict(total_ms, status=status))
+            except Exception as e:
+                print(f"⚠️ Slow-request log failed: {e}")
+
+
+# Path -> endpoint class (same names as the admission classes), for default deadlines
+ENDPOINT_CLASSES = {
+    "/search/text": "text",
+    "/search/image": "visual",
+    "/search/sketch": "sketch",
+    "/ocr/read": "ocr",
+    "/voice/transcribe": "voice",
+}
+
+@app.middleware("http")
+async def apply_deadline(request: Request, call_next):
+    """
+    Gives search/OCR/voice requests a time budget (X-Request-Deadline-Ms, else the
+    class default). Stages that don't fit are skipped; they're listed in X-Degraded-Stages.
+    """
+    cls = ENDPOINT_CLASSES.get(request.url.path)
+    if cls is None:
+        return await call_next(request)
+    budget_ms = deadline.header_budget_ms(request.headers.get("X-Request-Deadline-Ms"),
+                                          REQUEST_DEADLINE_MS.get(cls), MAX_REQUEST_DEADLINE_MS)
+    if budget_ms is None:
+        return await call_next(request)
+    with deadline.scope(budget_ms / 1000) as d:
+        response = await call_next(request)
+    if d.degraded:
+        response.headers["X-Degraded-Stages"] = ",".join(d.degraded)
+    return response
+
+
+def _cache_samples():
+    for name, s in all_cache_stats().items():
+        yield ("query_cache_hits_total", "counter", "Perceptual-hash query cache hits", {"cache": name}, s["hits"])
+        yield ("query_cache_misses_total", "counter", "Perceptual-hash query cache misses", {"cache": name}, s["misses"])
+        yield ("query_cache_entries", "gauge", "Entries currently held per query cache", {"cache": name}, s["entries"])
+
+metrics.register_collector(_cache_samples)
+
 # Serve static files (images) so frontend can display them
 # careful with security in prod, but fine for local tool
 app.mount("/data", StaticFiles(directory=DATA_DIR), name="data")
+app.mount("/thumbs", ImmutableStaticFiles(directory=THUMB_DIR), name="thumbs")
+
+
+def remove_temp(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def attach_public_urls(r):
+    """Rewrites a result's image_path to a served URL and links its grid thumbnail."""
+    import time
+    rel_path = rel_data_path(r['image_path'])
+    r['image_path'] = f"http://localhost:8000/data/{rel_path}?t={int(time.time())}"
+    r['thumbnail_url'] = thumbnail_url(rel_path)
+    return r
 
 
 @app.post("/search/text", response_model=TextSearchResponse)
 async def search_by_text(req: TextSearchRequest):
+    # Model work runs in a thread so the event loop keeps admitting (and rejecting) other requests
+    async with admission.admit("text"):
+        return await asyncio.to_thread(_search_by_text, req)
+
+def _search_by_text(req):
     try:
         print(f"🔎 SEARCH REQ: '{req.query}'")
         
@@ -238,30 +260,15 @@ async def search_by_text(req: TextSearchRequest):
             print("🚀 Raw search used (Refinement disabled).")
             
         # Enrich with valid image url for frontend
-        results = []
-        clean_data_dir = DATA_DIR.replace("\\", "/")
-        
-        for r in results_to_use:
-            clean_img_path = r['image_path'].replace("\\", "/")
-            
-            if clean_img_path.startswith(clean_data_dir):
-                 rel_path = clean_img_path[len(clean_data_dir):].strip("/")
-            else:
-                 if "data/images" in clean_img_path:
-                     rel_path = clean_img_path.split("data/images")[-1].strip("/")
-                 else:
-                     rel_path = os.path.basename(clean_img_path)
-
-            import time
-            r['image_path'] = f"http://localhost:8000/data/{rel_path}?t={int(time.time())}"
-            results.append(r)
+        results = [attach_public_urls(r) for r in results_to_use]
         
         print(f"📤 RETURNING {len(results)} RESULTS")
             
         return TextSearchResponse(
             query=req.query,
             refined_query=final_query, 
-            results=results[:req.top_k]
+            results=results[:req.top_k],
+            degraded=deadline.degraded()
         )
     except Exception as e:
         print(f"❌ CRITICAL SEARCH ERROR: {str(e)}")
@@ -269,6 +276,117 @@ async def search_by_text(req: TextSearchRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10.0, format: str = "collapsed",
+                        interval_ms: float = 5.0, skip_idle: bool = True):
+    """
+    Samples every thread of the running server for `seconds` and returns
+    a collapsed-stack file (flamegraph.pl / speedscope) or speedscope JSON.
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled (set PROFILER_ENABLED=1)")
+    if PROFILER_TOKEN and request.headers.get("X-Profiler-Token") != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid profiler token")
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    seconds = max(0.5, min(seconds, 120.0))
+    interval = max(0.001, interval_ms / 1000)
+
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    prof = None
+    try:
+        prof = SamplingProfiler(interval=interval, skip_idle=skip_idle).start()
+        await asyncio.sleep(seconds) # Event loop keeps serving requests meanwhile
+    finally:
+        # Also on client disconnect / cancellation, or the sampler thread runs forever
+        if prof is not None:
+            prof.stop()
+        profile_lock.release()
+
+    print(f"🔬 Profile done: {prof.samples} ticks over {prof.duration:.1f}s")
+    if format == "speedscope":
+        return JSONResponse(prof.speedscope(),
+                            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'})
+    return PlainTextResponse(prof.collapsed(),
+                             headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'})
+
+def require_admin(request: Request):
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload", status_code=202)
+async def admin_reload(request: Request, rebuild: bool = False):
+    """
+    Loads the indexes from disk (rebuild=true: rescans the catalogue first) in the
+    background and swaps them in atomically; requests keep using the old bundle meanwhile.
+    """
+    require_admin(request)
+    if not index_store.reload_in_background(rebuild=rebuild):
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    return {"status": "started", "reload": index_store.reload_status}
+
+@app.get("/admin/index")
+async def admin_index(request: Request):
+    require_admin(request)
+    bundle = index_store.current()
+    return {"live": bundle.info() if bundle else None, "reload": index_store.reload_status}
+
+@app.post("/items", status_code=202)
+async def add_item(request: Request, file: UploadFile = File(...), category: str = Form(...),
+                   caption: str = Form(None)):
+    """
+    Adds a product image to the catalogue. It's saved under DATA_DIR/<category>/ and
+    queued for captioning + embedding; poll /items/ingest/{job_id} until state is "done".
+    """
+    if not ADMIN_TOKEN and not INGEST_ALLOW_ANONYMOUS:
+        raise HTTPException(status_code=403, detail="Uploads are disabled: set ADMIN_TOKEN (or INGEST_ALLOW_ANONYMOUS=1)")
+    require_admin(request)
+    category = category.strip().lower()
+    if not ingest.CATEGORY_RE.match(category):
+        raise HTTPException(status_code=400, detail="category may only contain letters, digits, '_' and '-'")
+    # File copy + verify are blocking disk work: off the event loop like the other handlers
+    return await asyncio.to_thread(_add_item, file, category, caption)
+
+def _add_item(file, category, caption):
+    path = ingest.unique_path(category, ingest.safe_filename(file.filename))
+    limit = int(INGEST_MAX_UPLOAD_MB * 1024 * 1024)
+    written = 0
+    try:
+        with open(path, "wb") as buffer:
+            while chunk := file.file.read(1024 * 1024):
+                written += len(chunk)
+                if written > limit:
+                    raise HTTPException(status_code=413, detail=f"Upload larger than {INGEST_MAX_UPLOAD_MB:g} MB")
+                buffer.write(chunk)
+        with Image.open(path) as img:
+            img.verify()
+    except HTTPException:
+        remove_temp(path)
+        raise
+    except Exception as e:
+        remove_temp(path)
+        raise HTTPException(status_code=400, detail=f"Not a readable image: {e}")
+
+    job = ingest.submit(path, category, caption=(caption or "").strip() or None)
+    print(f"📥 Queued {job['id']} ({category}) as job {job['job_id']}")
+    return job
+
+@app.get("/items/ingest")
+async def ingest_status(recent: int = 20):
+    return ingest.status(recent=max(0, min(recent, 200)))
+
+@app.get("/items/ingest/{job_id}")
+async def ingest_job(job_id: str):
+    job = ingest.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
 @app.get("/debug/check")
 async def debug_check():
     try:
@@ -277,11 +395,14 @@ async def debug_check():
             "data_dir_exists": os.path.exists(DATA_DIR),
             "data_dir": DATA_DIR,
             "models": {
-                "clip": "loaded" if image_search.clip_model else "not loaded",
-                "blip": "loaded" if "blip_model" in globals() and globals()["blip_model"] else "lazy-loaded",
-                "sketch_index": "loaded" if sketch_search.sketch_index else "not loaded",
-                "image_index": "loaded" if image_search.index else "not loaded"
-            }
+                **loaded_models(),
+                "sketch_index": "loaded" if sketch_search.sketch_index is not None else "not loaded",
+                "image_index": "loaded" if image_search.index is not None else "not loaded"
+            },
+            "index_version": index_store.current().version if index_store.current() else None,
+            "admission": admission.status(),
+            "llm_cache": llm_cache.stats(),
+            "query_caches": all_cache_stats()
         }
         if os.path.exists(DATA_DIR):
              status["content_count"] = len(os.listdir(DATA_DIR))
@@ -291,84 +412,103 @@ async def debug_check():
 
 @app.post("/search/image", response_model=List[SearchResult])
 async def search_by_image(file: UploadFile = File(...)):
+    async with admission.admit("visual"):
+        return await asyncio.to_thread(_search_by_image, file)
+
+def _search_by_image(file):
     try:
-        img = Image.open(file.file).convert("RGB")
+        with timed("upload_decode"):
+            img = Image.open(file.file).convert("RGB")
         res = image_search.search_by_image(img)
         
-        results = []
-        for r in res[:30]:
-            clean_data_dir = DATA_DIR.replace("\\", "/")
-            clean_img_path = r['image_path'].replace("\\", "/")
-            if clean_img_path.startswith(clean_data_dir):
-                 rel_path = clean_img_path[len(clean_data_dir):].strip("/")
-            else:
-                 if "data/images" in clean_img_path:
-                     rel_path = clean_img_path.split("data/images")[-1].strip("/")
-                 else:
-                     rel_path = os.path.basename(clean_img_path)
-            
-            import time
-            r['image_path'] = f"http://localhost:8000/data/{rel_path}?t={int(time.time())}"
-            results.append(r)
-            
+        results = [attach_public_urls(r) for r in res[:30]]
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/search/vector", response_model=List[SearchResult])
+async def search_by_vector(request: Request, space: str = "photo", top_k: int = 30,
+                           dtype: Optional[str] = None, format: Optional[str] = None):
+    """
+    Search with an embedding the caller already has, in photo, sketch or caption space.
+    Body: the raw little-endian vector as application/octet-stream (dtype from ?dtype=
+    or the size), or JSON {"vector": "<base64>", "dtype", "space", "top_k"}.
+    ?format=orjson|msgpack (or Accept: application/msgpack) skips the response model
+    and returns the compact encoding.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            req = json.loads(body)
+            vector, dtype = req["vector"], req.get("dtype", dtype)
+            if isinstance(vector, list): # Plain JSON numbers work too, just bigger
+                vector, dtype = np.asarray(vector, dtype="<f4").tobytes(), "float32"
+            # Same check as the WebSocket controls: int(1e999) would be an OverflowError -> 500
+            space, top_k = req.get("space", space), ws_top_k(req, top_k)
+        else:
+            vector = body
+        vector = wire.decode_vector(vector, dtype)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Bad vector: {e}")
+    if space not in ("photo", "sketch", "caption"):
+        raise HTTPException(status_code=400, detail="space must be photo, sketch or caption")
+    fmt = wire.negotiate(format, request.headers.get("accept"))
+    if fmt != "json" and fmt not in wire.COMPACT_TYPES:
+        raise HTTPException(status_code=400, detail="format must be json, orjson or msgpack")
+
+    async with admission.admit("visual"):
+        results = await asyncio.to_thread(_search_by_vector, vector, space, max(1, min(top_k, MAX_TOP_K)))
+    if fmt == "json":
+        return results
+    try:
+        content, media_type = wire.encode_compact(results, fmt)
+    except ImportError:
+        raise HTTPException(status_code=406, detail=f"{fmt} responses aren't available on this server")
+    return Response(content, media_type=media_type)
+
+def _search_by_vector(vector, space, top_k):
+    try:
+        res = image_search.search_by_vector(vector, space=space, top_k=top_k)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return [attach_public_urls(r) for r in res]
+
+@app.get("/similar/{item_id}", response_model=List[SearchResult])
+async def similar_items(item_id: str, space: str = "photo", top_k: int = 12):
+    """
+    "More like this" for a product page: the item's precomputed neighbours
+    (photo or sketch space), a row lookup with no model or index search.
+    """
+    bundle = index_store.current()
+    graph = bundle.neighbors if bundle is not None else None
+    if graph is None or space not in graph.spaces:
+        raise HTTPException(status_code=503, detail=f"No '{space}' neighbour graph loaded (rebuild the index)")
+    found = graph.neighbors(item_id, space, k=max(1, min(top_k, MAX_TOP_K)))
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Unknown item '{item_id}'")
+    results = []
+    for row, score in found:
+        r = dict(bundle.metadata[row], score=score)
+        results.append(attach_public_urls(r))
+    return results
+
 @app.post("/search/sketch", response_model=List[SearchResult])
 async def search_by_sketch(file: UploadFile = File(...)):
+    async with admission.admit("sketch"):
+        return await asyncio.to_thread(_search_by_sketch, file)
+
+def _search_by_sketch(file):
     try:
         print(f"🎨 SKETCH: Received upload ({file.filename})")
-        # Save temp because sketch_search logic might expect a file path (checking app.py usage)
-        # app.py: res_visual, interpretation = sketch_search.search_by_sketch("s.jpg", top_k=20)
-        temp_path = "temp_sketch_upload.jpg"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Decoded in memory: preprocess_sketch takes images as well as paths
+        with timed("upload_decode"):
+            sketch = Image.open(file.file)
+            sketch.load()
             
-        print("🎨 SKETCH: File saved, starting visual search...")
-        # 1. Visual Match
-        res_visual, interpretation = sketch_search.search_by_sketch(temp_path, top_k=20)
-        print(f"🎨 SKETCH: Visual search done. Interpretation: '{interpretation}'")
-        
-        # 2. Text Backup (REMOVED: Handled internally by sketch_search.py now)
-        # res_text = image_search.search_by_text(interpretation, top_k=20)
-        
-        # 3. Filter
-        valid_cats = []
-        if "ring" in interpretation.lower(): valid_cats.append("ring")
-        if "necklace" in interpretation.lower(): valid_cats.append("necklace")
-        
-        if valid_cats:
-            res_visual = [r for r in res_visual if r['category'] in valid_cats]
-
-        # 4. Result Processing (Fix paths)
-        print("🎨 SKETCH: Processing results...")
-        final = []
-        seen = set()
-        
-        # Use the RERANKED results directly
-        for r in res_visual:
-            if r['id'] not in seen:
-                clean_data_dir = DATA_DIR.replace("\\", "/")
-                clean_img_path = r['image_path'].replace("\\", "/")
-                if clean_img_path.startswith(clean_data_dir):
-                     rel_path = clean_img_path[len(clean_data_dir):].strip("/")
-                else:
-                     if "data/images" in clean_img_path:
-                         rel_path = clean_img_path.split("data/images")[-1].strip("/")
-                     else:
-                         rel_path = os.path.basename(clean_img_path)
-
-                import time
-                r['image_path'] = f"http://localhost:8000/data/{rel_path}?t={int(time.time())}"
-                
-                if r.get("interpretation"):
-                    r['interpretation'] = interpretation
-                final.append(r)
-                seen.add(r['id'])
-        
-        print(f"🎨 SKETCH: Returning {len(final[:20])} results.")
-        return final[:20]
+        print("🎨 SKETCH: Upload decoded, starting visual search...")
+        final, interpretation = _sketch_results(sketch)
+        print(f"🎨 SKETCH: Returning {len(final)} results.")
+        return final
         
     except Exception as e:
         print(f"❌ SKETCH ERROR: {e}")
@@ -376,11 +516,174 @@ async def search_by_sketch(file: UploadFile = File(...)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sketch_results(sketch, top_k=20):
+    """Full sketch search (LLM interpretation + rerank), filtered and with public URLs."""
+    # 1. Visual Match
+    res_visual, interpretation = sketch_search.search_by_sketch(sketch, top_k=top_k)
+    print(f"🎨 SKETCH: Visual search done. Interpretation: '{interpretation}'")
+    
+    # 2. Text Backup (REMOVED: Handled internally by sketch_search.py now)
+    # res_text = image_search.search_by_text(interpretation, top_k=20)
+    
+    # 3. Filter
+    valid_cats = []
+    if "ring" in interpretation.lower(): valid_cats.append("ring")
+    if "necklace" in interpretation.lower(): valid_cats.append("necklace")
+    
+    if valid_cats:
+        res_visual = [r for r in res_visual if r['category'] in valid_cats]
+
+    # 4. Result Processing (Fix paths)
+    final = []
+    seen = set()
+    
+    # Use the RERANKED results directly
+    for r in res_visual:
+        if r['id'] not in seen:
+            attach_public_urls(r)
+            
+            if r.get("interpretation"):
+                r['interpretation'] = interpretation
+            final.append(r)
+            seen.add(r['id'])
+    return final[:top_k], interpretation
+
+def _shape_results(sketch, top_k):
+    results, sketch_key = sketch_search.shape_search(sketch, top_k=top_k)
+    return [attach_public_urls(r) for r in results], sketch_key
+
+def ws_top_k(control, default):
+    """top_k from a JSON control message or body, clamped to [1, MAX_TOP_K]; ValueError if it isn't an integer."""
+    value = control.get("top_k", default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("top_k must be an integer")
+    return max(1, min(value, MAX_TOP_K))
+
+@app.websocket("/ws/sketch")
+async def sketch_stream(ws: WebSocket):
+    """
+    Live sketch search. Client -> server: optional {"type": "start", "top_k": 20}, then
+    the canvas as a PNG/JPEG binary frame after each stroke, and {"type": "submit"}.
+    Server -> client: {"type": "shape", "results"} (CLIP shape matches only, debounced
+    by SKETCH_DEBOUNCE_MS and skipped when the canvas hash hasn't moved), then
+    {"type": "results", "interpretation", "results"} once the user pauses for
+    SKETCH_PAUSE_MS (LLM + rerank), and {"type": "final", ...} the same way on submit.
+    """
+    await ws.accept()
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+
+    async def read():
+        try:
+            while True:
+                msg = await ws.receive()
+                await inbox.put(msg)
+                if msg["type"] == "websocket.disconnect":
+                    return
+        except Exception:
+            await inbox.put({"type": "websocket.disconnect"})
+
+    reader = asyncio.create_task(read())
+    top_k = 20
+    canvas, dirty, changed_at = None, False, 0.0
+    shaped_key = None # phash of the canvas the last shape results were for
+    full_key, full_task = None, None # ...and of the last full (LLM) search
+
+    async def shape():
+        nonlocal dirty, shaped_key
+        dirty = False
+        async with admission.admit("visual"):
+            results, key = await asyncio.to_thread(_shape_results, canvas, top_k)
+        if key != shaped_key:
+            shaped_key = key
+            await ws.send_json({"type": "shape", "results": results})
+
+    async def full(key, kind, sketch):
+        try:
+            async with admission.admit("sketch"):
+                results, interpretation = await asyncio.to_thread(_sketch_results, sketch, top_k)
+        except admission.Rejected as e:
+            if kind == "final": # A pause search can just be missed; a submit needs an answer
+                await ws.send_json({"type": "error", "detail": f"Server busy ({e.reason})", "retry_after": e.retry_after})
+            return
+        if kind == "final" or key == shaped_key: # Drawing moved on: these are stale
+            await ws.send_json({"type": kind, "interpretation": interpretation, "results": results})
+
+    try:
+        while True:
+            if full_task is not None and full_task.done():
+                full_task.result()
+                full_task = None
+            now = loop.time()
+            if dirty:
+                timeout = max(0.0, changed_at + SKETCH_DEBOUNCE_MS / 1000 - now)
+            elif shaped_key is not None and shaped_key != full_key:
+                timeout = max(0.0, changed_at + SKETCH_PAUSE_MS / 1000 - now)
+                if full_task is not None: # A stale search is still running; look again once it's done
+                    timeout = max(timeout, 0.1)
+            else:
+                timeout = None
+            try:
+                msg = await asyncio.wait_for(inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                try:
+                    if dirty:
+                        await shape()
+                    elif full_task is None: # Paused: worth the LLM + rerank now
+                        full_key = shaped_key
+                        full_task = asyncio.create_task(full(full_key, "results", canvas))
+                except admission.Rejected:
+                    pass # Busy: the next stroke (or submit) tries again
+                continue
+
+            if msg["type"] == "websocket.disconnect":
+                return
+            if msg.get("bytes"):
+                try:
+                    canvas = Image.open(BytesIO(msg["bytes"]))
+                    canvas.load()
+                except Exception as e:
+                    await ws.send_json({"type": "error", "detail": f"Unreadable canvas image: {e}"})
+                    continue
+                dirty, changed_at = True, loop.time()
+            elif msg.get("text"):
+                try:
+                    control = json.loads(msg["text"])
+                    if control.get("type") == "start":
+                        top_k = ws_top_k(control, top_k)
+                except (ValueError, AttributeError) as e: # Bad input gets an answer, not a closed socket
+                    await ws.send_json({"type": "error", "detail": f"Bad control message: {e}"})
+                    continue
+                if control.get("type") == "submit" and canvas is not None:
+                    dirty = False # The full search covers this canvas
+                    if full_task is not None:
+                        full_task.cancel()
+                        full_task = None
+                    await full(None, "final", canvas)
+                    shaped_key = full_key = None # Nothing pending until the next stroke
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"❌ SKETCH STREAM ERROR: {e}")
+        try:
+            await ws.send_json({"type": "error", "detail": str(e)})
+            await ws.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        reader.cancel()
+        if full_task is not None:
+            full_task.cancel()
+
 @app.post("/ocr/read", response_model=OCRResponse)
 async def read_ocr(file: UploadFile = File(...), mode: str = Form("standard")):
+    async with admission.admit("ocr"):
+        return await asyncio.to_thread(_read_ocr, file, mode)
+
+def _read_ocr(file, mode):
+    temp_path = f"temp_ocr_{uuid.uuid4().hex[:8]}.jpg"
     try:
         print(f"📝 OCR: Received upload ({file.filename}) | Mode: {mode}")
-        temp_path = "temp_ocr_upload.jpg"
         with open(temp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
             
@@ -395,7 +698,7 @@ async def read_ocr(file: UploadFile = File(...), mode: str = Form("standard")):
             # For LLM mode, raw and cleaning happen together, so we can map cleaned -> raw for consistency if needed, 
             # but better to just return the main text as both or specific fields.
             # Schema expects raw_text. We'll use the same text for both if only one is returned.
-            return OCRResponse(raw_text=txt, cleaned_query=txt, detected_category=cat)
+            return OCRResponse(raw_text=txt, cleaned_query=txt, detected_category=cat, degraded=deadline.degraded())
             
         else:
             # Standard TrOCR + LLM Refine
@@ -405,7 +708,7 @@ async def read_ocr(file: UploadFile = File(...), mode: str = Form("standard")):
             
             if not txt:
                 print("⚠️ OCR: No text found in image.")
-                return OCRResponse(raw_text="", cleaned_query="", detected_category="unknown")
+                return OCRResponse(raw_text="", cleaned_query="", detected_category="unknown", degraded=deadline.degraded())
                 
             print("📝 OCR: Refining text with LLM...")
             ref = llm_refine_ocr_text(txt)
@@ -413,32 +716,30 @@ async def read_ocr(file: UploadFile = File(...), mode: str = Form("standard")):
             cat = ref.get('product_type', 'unknown')
             print(f"📝 OCR: Refined query: '{q}', Category: '{cat}'")
             
-            return OCRResponse(raw_text=txt, cleaned_query=q, detected_category=cat)
+            return OCRResponse(raw_text=txt, cleaned_query=q, detected_category=cat, degraded=deadline.degraded())
         
     except Exception as e:
         print(f"❌ OCR ERROR: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        remove_temp(temp_path)
 
 @app.post("/voice/transcribe")
 async def transcribe_voice(file: UploadFile = File(...)):
+    async with admission.admit("voice"):
+        return await asyncio.to_thread(_transcribe_voice, file)
+
+def _transcribe_voice(file):
     try:
         print(f"🎙️ VOICE: Received upload ({file.filename})")
-        # Save temp audio file
-        temp_path = f"temp_voice_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Decoded straight from memory, no temp file
+        audio = file.file.read()
             
         print("🎙️ VOICE: Transcribing...")
-        text = transcribe_audio(temp_path)
+        text = transcribe_audio(audio)
         print(f"🎙️ VOICE: Result: '{text}'")
-        
-        # Cleanup
-        try:
-            os.remove(temp_path)
-        except:
-            pass
             
         return {"text": text}
         
@@ -450,12 +751,107 @@ async def transcribe_voice(file: UploadFile = File(...)):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    except ValueError as e: # Not decodable audio
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ VOICE ERROR: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _text_results(query, top_k):
+    return [attach_public_urls(r) for r in image_search.search_by_text(query, top_k=top_k)]
+
+@app.websocket("/ws/voice")
+async def voice_stream(ws: WebSocket):
+    """
+    Streaming voice search: transcribes while the user speaks and searches on the
+    stable part of the transcript, so results are ready about when they stop.
+    Client -> server: optional {"type": "start", "format": "pcm_s16" | "pcm_f32" | "webm",
+    "sample_rate": 16000, "top_k": 12}, binary audio chunks, then {"type": "stop"}.
+    Server -> client: {"type": "partial", "partial", "stable"} as the transcript grows,
+    {"type": "results", "query", "results"} for each new stable prefix (speculative),
+    and {"type": "final", "text", "results"} after stop.
+    """
+    await ws.accept()
+    stream, top_k = VoiceStream(), 12
+    last = (None, []) # (query, results) of the latest speculative search
+    stepping = None
+
+    async def run_steps():
+        nonlocal last
+        while stream.pending():
+            try:
+                async with admission.admit("voice"):
+                    update = await asyncio.to_thread(stream.step)
+            except admission.Rejected:
+                return # Busy: skip this partial, the next chunk tries again
+            if not update:
+                continue
+            await ws.send_json({"type": "partial", **update})
+            query = update["stable"]
+            if query and query != last[0]:
+                try:
+                    async with admission.admit("text"):
+                        last = (query, await asyncio.to_thread(_text_results, query, top_k))
+                except admission.Rejected:
+                    continue
+                await ws.send_json({"type": "results", "query": query, "results": last[1]})
+
+    try:
+        while not stream.full():
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+            if msg.get("bytes"):
+                stream.feed(msg["bytes"])
+            elif msg.get("text"):
+                try:
+                    control = json.loads(msg["text"])
+                    if control.get("type") == "start" and not stream.received_s:
+                        fmt = control.get("format", "pcm_s16")
+                        rate = control.get("sample_rate", 16000) if fmt in PCM_FORMATS else 16000
+                        if isinstance(rate, bool) or not isinstance(rate, int) or not 8000 <= rate <= 192000:
+                            raise ValueError("sample_rate must be an integer between 8000 and 192000")
+                        top_k = ws_top_k(control, top_k)
+                        stream = VoiceStream(fmt, rate)
+                except (ValueError, AttributeError) as e: # Bad input gets an answer, not a closed socket
+                    await ws.send_json({"type": "error", "detail": f"Bad control message: {e}"})
+                    continue
+                if control.get("type") == "stop":
+                    break
+            if stepping is not None and stepping.done():
+                stepping.result() # Re-raises a failed step (e.g. ffmpeg missing)
+                stepping = None
+            if stream.pending() and stepping is None:
+                stepping = asyncio.create_task(run_steps())
+        if stepping is not None:
+            await stepping
+
+        async with admission.admit("voice"):
+            text = await asyncio.to_thread(stream.finish)
+        print(f"🎙️ VOICE STREAM: Final '{text}' ({stream.received_s:.1f}s)")
+        # Usually the speculative search already ran on exactly this text
+        results = last[1] if text == last[0] else []
+        if text and text != last[0]:
+            async with admission.admit("text"):
+                results = await asyncio.to_thread(_text_results, text, top_k)
+        await ws.send_json({"type": "final", "text": text, "results": results})
+        await ws.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        detail = "FFMPEG dependency missing on server" if "FFMPEG dependency missing" in str(e) else str(e)
+        print(f"❌ VOICE STREAM ERROR: {e}")
+        try:
+            await ws.send_json({"type": "error", "detail": detail})
+            await ws.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        if stepping is not None and not stepping.done():
+            stepping.cancel()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,6 +1,10 @@
-import torch
-from transformers import CLIPProcessor, CLIPModel
-from backend.config import DEVICE
+from backend.config import get_device, FAST_PREPROCESS
+from backend.models import workers
+from backend.utils.metrics import timed, timed_model_load
+
+# torch / transformers are imported on first use, so API workers that never
+# embed anything (or haven't yet) don't pay for them at import time.
+MODEL_ID = "openai/clip-vit-base-patch32"
 
 model = None
 processor = None
@@ -9,61 +13,92 @@ def load_clip():
     global model, processor
     if model is not None: return
 
+    from transformers import CLIPProcessor, CLIPModel
+    DEVICE = get_device()
     print(f"Loading CLIP on {DEVICE}...")
-    try:
-        # Try loading (will use cache if available, but checks for updates)
-        model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(DEVICE)
-        processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-    except Exception as e:
-        print(f"⚠️ Network error loading CLIP: {e}")
-        print("🔄 Attempting to load from local cache (offline mode)...")
+    with timed_model_load("clip"):
         try:
-            model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32", local_files_only=True).to(DEVICE)
-            processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", local_files_only=True)
-            print("✅ Loaded CLIP from local cache.")
-        except Exception as e2:
-            print(f"❌ Failed to load CLIP (Online & Offline): {e2}")
-            # Re-raise the original error if local also fails, or e2
-            raise e
-            
-    model.eval()
+            # Try loading (will use cache if available, but checks for updates)
+            model = CLIPModel.from_pretrained(MODEL_ID).to(DEVICE)
+            processor = CLIPProcessor.from_pretrained(MODEL_ID)
+        except Exception as e:
+            print(f"⚠️ Network error loading CLIP: {e}")
+            print("🔄 Attempting to load from local cache (offline mode)...")
+            try:
+                model = CLIPModel.from_pretrained(MODEL_ID, local_files_only=True).to(DEVICE)
+                processor = CLIPProcessor.from_pretrained(MODEL_ID, local_files_only=True)
+                print("✅ Loaded CLIP from local cache.")
+            except Exception as e2:
+                print(f"❌ Failed to load CLIP (Online & Offline): {e2}")
+                # Re-raise the original error if local also fails, or e2
+                raise e
+                
+        model.eval()
 
-@torch.no_grad()
+@timed("clip_embed_image")
 def get_image_embedding(image):
-    load_clip()
-    """Expects a PIL Image or list of PIL Images"""
+    """Expects a PIL Image or list of PIL Images (the fast path also takes file paths / bytes)"""
     # Handle list vs single
     is_batch = isinstance(image, list)
+    if workers.enabled("clip"):
+        # Decode/crop here, ship the uint8 batch through shared memory
+        from backend.models.fast_preprocess import load_uint8_batch
+        features = workers.call("clip", "backend.models.clip:embed_uint8_batch",
+                                load_uint8_batch(image if is_batch else [image]))
+        return features if is_batch else features[0]
+
+    load_clip()
+    import torch
     
-    inputs = processor(images=image, return_tensors="pt", padding=True)
-    pixel_values = inputs["pixel_values"].to(DEVICE)
-    vision_outputs = model.vision_model(pixel_values=pixel_values)
-    pooled_output = vision_outputs.pooler_output
-    image_features = model.visual_projection(pooled_output)
-    
-    # Normalize (optional but good for consistency)
-    image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+    with torch.no_grad():
+        if FAST_PREPROCESS:
+            from backend.models.fast_preprocess import preprocess_batch
+            pixel_values = preprocess_batch(image if is_batch else [image])
+        else:
+            inputs = processor(images=image, return_tensors="pt", padding=True)
+            pixel_values = inputs["pixel_values"].to(get_device())
+        vision_outputs = model.vision_model(pixel_values=pixel_values)
+        pooled_output = vision_outputs.pooler_output
+        image_features = model.visual_projection(pooled_output)
+        
+        # Normalize (optional but good for consistency)
+        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
 
     if is_batch:
         return image_features.cpu().numpy()
     else:
         return image_features[0].cpu().numpy()
 
-@torch.no_grad()
-def get_text_embedding(text):
+def embed_uint8_batch(batch):
+    """(N, 224, 224, 3) uint8 crops -> (N, 512) normalized features. Runs in the CLIP inference worker."""
     load_clip()
+    import torch
+    from backend.models.fast_preprocess import normalize_uint8
+    with torch.no_grad():
+        pooled_output = model.vision_model(pixel_values=normalize_uint8(batch)).pooler_output
+        image_features = model.visual_projection(pooled_output)
+        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+    return image_features.cpu().numpy()
+
+@timed("clip_embed_text")
+def get_text_embedding(text):
     """Expects a string or list of strings"""
+    if workers.enabled("clip"):
+        return workers.call("clip", "backend.models.clip:get_text_embedding", text)
+    load_clip()
+    import torch
     is_batch = isinstance(text, list)
     
-    inputs = processor(text=text, return_tensors="pt", padding=True, truncation=True)
-    inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
-    
-    text_outputs = model.text_model(**inputs)
-    pooled_output = text_outputs.pooler_output
-    text_features = model.text_projection(pooled_output)
-    text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
+    with torch.no_grad():
+        inputs = processor(text=text, return_tensors="pt", padding=True, truncation=True)
+        inputs = {k: v.to(get_device()) for k, v in inputs.items()}
+        
+        text_outputs = model.text_model(**inputs)
+        pooled_output = text_outputs.pooler_output
+        text_features = model.text_projection(pooled_output)
+        text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
     
     if is_batch:
         return text_features.cpu().numpy()
     else:
-        return text_features[0].cpu().numpy()
\ No newline at end of file
+        return text_features[0].cpu().numpy()
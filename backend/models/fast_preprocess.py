@@ -0,0 +1,112 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from backend.config import get_device, PREPROCESS_WORKERS
+
+# CLIP ViT-B/32 preprocessing constants (same as CLIPProcessor / CLIPImageProcessor)
+CLIP_SIZE = 224
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+# (x / 255 - mean) / std  ==  x * scale - shift  -> one fused op on the stacked batch
+_SCALE = tuple(1.0 / (255.0 * s) for s in CLIP_STD)
+_SHIFT = tuple(m / s for m, s in zip(CLIP_MEAN, CLIP_STD))
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="clip-preproc")
+    return _pool
+
+
+def decode_image(src, size=CLIP_SIZE):
+    """
+    Decodes a path / bytes / PIL image to RGB.
+    For JPEG sources, draft mode lets libjpeg downscale by 1/2..1/8 during decode,
+    which is far cheaper than decoding full size and resizing afterwards.
+    """
+    if isinstance(src, Image.Image):
+        return src if src.mode == "RGB" else src.convert("RGB")
+    if isinstance(src, (bytes, bytearray)):
+        src = io.BytesIO(src)
+    img = Image.open(src)
+    img.draft("RGB", (size, size)) # Keeps the short side >= size
+    return img.convert("RGB")
+
+
+def resize_center_crop(img, size=CLIP_SIZE):
+    """Shortest-side bicubic resize + center crop, returned as a uint8 HxWx3 array."""
+    w, h = img.size
+    if w <= h:
+        new_w, new_h = size, int(size * h / w)
+    else:
+        new_w, new_h = int(size * w / h), size
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.BICUBIC)
+    left = (new_w - size) // 2
+    top = (new_h - size) // 2
+    img = img.crop((left, top, left + size, top + size))
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _load_one(src):
+    try:
+        return resize_center_crop(decode_image(src))
+    except Exception as e:
+        print(f"⚠️ Preprocess error ({src if isinstance(src, str) else type(src).__name__}): {e}")
+        # Black placeholder, same as the index builder used to do
+        return np.zeros((CLIP_SIZE, CLIP_SIZE, 3), dtype=np.uint8)
+
+
+def preprocess_batch(images, device=None):
+    """
+    Returns CLIP pixel_values (N, 3, 224, 224) float32 on `device`.
+    Decode/resize/crop run in a thread pool (Pillow releases the GIL),
+    normalisation is a single vectorized op on the stacked uint8 batch.
+    """
+    return normalize_uint8(load_uint8_batch(images), device)
+
+
+def load_uint8_batch(images):
+    """Decode + resize + crop only: (N, 224, 224, 3) uint8, no torch needed (inference workers ship this)."""
+    if len(images) == 1:
+        return _load_one(images[0])[None]
+    return np.stack(list(_get_pool().map(_load_one, images)))
+
+
+def normalize_uint8(batch, device=None):
+    """(N, 224, 224, 3) uint8 -> CLIP pixel_values (N, 3, 224, 224) float32 on `device`."""
+    import torch
+    device = device or get_device()
+    # Move uint8 to the device first (4x less data than float32), then normalise there
+    batch = torch.from_numpy(np.ascontiguousarray(batch)).to(device)
+    batch = batch.permute(0, 3, 1, 2).float()
+    scale = torch.tensor(_SCALE, device=device).view(1, 3, 1, 1)
+    shift = torch.tensor(_SHIFT, device=device).view(1, 3, 1, 1)
+    return batch.mul_(scale).sub_(shift)
+
+
+# Drift budget vs CLIPProcessor, in normalised pixel_values units (1 grey level ~= 0.015).
+# Draft-mode JPEG decode + one bicubic pass measure ~0.005 mean on the benchmark photos;
+# single pixels on hard edges can move a lot more, so only the mean is held to a bound.
+PARITY_MEAN_TOLERANCE = 0.05
+
+
+def diff_vs_processor(images, processor):
+    """
+    Parity check: (max, mean) abs deviation of the fast path from `processor` pixel_values.
+    The reference gets a full-size decode, the fast path its usual draft-mode one,
+    so the number covers the decode shortcut as well as the resize.
+    """
+    ref_pil = []
+    for src in images:
+        if isinstance(src, (bytes, bytearray)):
+            src = io.BytesIO(src)
+        img = src if isinstance(src, Image.Image) else Image.open(src)
+        ref_pil.append(img.convert("RGB"))
+    ref = processor(images=ref_pil, return_tensors="pt")["pixel_values"]
+    diff = (ref - preprocess_batch(images, device="cpu")).abs()
+    return float(diff.max()), float(diff.mean())
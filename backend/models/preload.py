@@ -0,0 +1,52 @@
+import threading
+from backend.models import workers
+
+# name -> (module path, loader attribute, loaded-check attribute)
+# Modules are imported by name so that importing this file stays cheap.
+MODELS = {
+    "clip": ("backend.models.clip", "load_clip", "model"),
+    "reranker": ("backend.utils.reranker", "load_ranker", "reranker_model"),
+    "blip": ("backend.utils.captioning", "load_blip", "blip_model"),
+    "trocr": ("backend.ocr.ocr_pipeline", "load_trocr", "model"),
+    "whisper": ("backend.voice.transcriber", "get_transcriber", "_transcriber"),
+}
+
+
+def _module(name):
+    import importlib
+    return importlib.import_module(MODELS[name][0])
+
+
+def preload(names):
+    for name in names:
+        if name not in MODELS:
+            print(f"⚠️ Unknown model in PRELOAD_MODELS: '{name}'")
+            continue
+        try:
+            if workers.enabled(name):
+                workers.start(name) # Loads in its own process instead
+            else:
+                getattr(_module(name), MODELS[name][1])()
+        except Exception as e:
+            print(f"⚠️ Preload of {name} failed: {e}")
+
+
+def preload_in_background(names):
+    """Warms models after startup, so the API is reachable while they load."""
+    names = [n for n in names if n]
+    if not names: return None
+    print(f"🔥 Preloading models in background: {', '.join(names)}")
+    t = threading.Thread(target=preload, args=(names,), name="model-preload", daemon=True)
+    t.start()
+    return t
+
+
+def loaded_models():
+    import sys
+    status = workers.status()
+    for name, (module_path, _, attr) in MODELS.items():
+        if name in status:
+            continue
+        mod = sys.modules.get(module_path)
+        status[name] = "loaded" if mod is not None and getattr(mod, attr, None) is not None else "not loaded"
+    return status
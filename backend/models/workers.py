@@ -0,0 +1,258 @@
+import importlib
+import os
+import threading
+import time
+import numpy as np
+from backend.config import INFERENCE_WORKERS, INFERENCE_THREADS
+from backend.utils import metrics
+
+# Optional out-of-process inference (INFERENCE_WORKERS=clip,reranker,trocr,whisper).
+# Each model family gets its own spawn process with pinned torch thread counts, so
+# CLIP, the cross-encoder, TrOCR and Whisper stop fighting over cores and the GIL.
+# The public model functions stay the same and forward here when their family is
+# enabled. Array arguments/results travel through shared memory; only the small
+# call descriptor is pickled over the pipe.
+
+# family -> (module, loader) run once when the worker starts
+FAMILIES = {
+    "clip": ("backend.models.clip", "load_clip"),
+    "reranker": ("backend.utils.reranker", "load_ranker"),
+    "trocr": ("backend.ocr.ocr_pipeline", "load_trocr"),
+    "whisper": ("backend.voice.transcriber", "get_transcriber"),
+}
+
+_in_worker = False # True inside a worker process: the functions must run locally there
+_ALIGN = 64
+_MIN_SHM = 8 << 20
+
+
+def enabled(family):
+    return not _in_worker and family in INFERENCE_WORKERS
+
+
+def _round_up(n):
+    size = _MIN_SHM
+    while size < n:
+        size *= 2
+    return size
+
+
+class _Buffer:
+    """A growable shared-memory segment owned by the API process."""
+
+    def __init__(self):
+        self.shm = None
+
+    def ensure(self, nbytes):
+        from multiprocessing import shared_memory
+        if self.shm is None or self.shm.size < nbytes:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=_round_up(nbytes))
+        return self.shm
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def _pack(args, buf):
+    """Replaces ndarray args with (marker, offset, shape, dtype) after copying them into `buf`."""
+    arrays = [a for a in args if isinstance(a, np.ndarray)]
+    total = sum(-(-a.nbytes // _ALIGN) * _ALIGN for a in arrays)
+    if not arrays:
+        return list(args), None
+    shm = buf.ensure(total)
+    out, offset = [], 0
+    for a in args:
+        if isinstance(a, np.ndarray):
+            a = np.ascontiguousarray(a)
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf, offset=offset)[...] = a
+            out.append(("__shm__", offset, a.shape, a.dtype.str))
+            offset += -(-a.nbytes // _ALIGN) * _ALIGN
+        else:
+            out.append(a)
+    return out, shm.name
+
+
+class _Channel:
+    """API-side handle of one family's worker: process, pipe, shared buffers, call lock."""
+
+    def __init__(self, family):
+        self.family = family
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.inbuf = _Buffer()
+        self.outbuf = _Buffer()
+        self.out_capacity = 0
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        import multiprocessing as mp
+        ctx = mp.get_context("spawn")
+        parent, child = ctx.Pipe()
+        threads = INFERENCE_THREADS.get(self.family, 1)
+        print(f"🧵 Starting {self.family} inference worker ({threads} threads)...")
+        t0 = time.perf_counter()
+        self.process = ctx.Process(target=_worker_main, args=(self.family, child, threads),
+                                   name=f"inference-{self.family}", daemon=True)
+        self.process.start()
+        child.close()
+        self.conn = parent
+        try:
+            status, detail = self.conn.recv()
+        except (EOFError, OSError) as e: # Died (OOM kill, segfault on import) before it could report
+            self.process.join(timeout=1)
+            status, detail = "error", f"exited with code {self.process.exitcode} ({type(e).__name__})"
+        if status != "ready":
+            self.stop()
+            raise RuntimeError(f"{self.family} worker failed to start: {detail}")
+        self.outbuf.ensure(_MIN_SHM)
+        self.out_capacity = self.outbuf.shm.size
+        metrics.gauge("model_load_seconds", "Wall time of the last load of each model",
+                      model=f"{self.family}_worker").set(time.perf_counter() - t0)
+        print(f"✅ {self.family} worker ready (pid {self.process.pid})")
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        self.inbuf.release()
+        self.outbuf.release()
+
+    def call(self, func, args):
+        with self.lock:
+            if not self.alive():
+                self.stop()
+                self.start()
+            packed, in_name = _pack(args, self.inbuf)
+            try:
+                self.conn.send((func, packed, in_name, self.outbuf.shm.name, self.out_capacity))
+                status, result = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self.stop() # Crashed (OOM, segfault): restarted on the next call
+                raise RuntimeError(f"{self.family} worker died: {e}") from e
+            if status == "error":
+                raise RuntimeError(f"{self.family} worker: {result}")
+            if status == "shm":
+                shape, dtype = result
+                return np.ndarray(shape, np.dtype(dtype), buffer=self.outbuf.shm.buf).copy()
+            if status == "grow": # Result didn't fit, it came pickled; size the buffer for next time
+                nbytes, result = result
+                self.outbuf.ensure(nbytes)
+                self.out_capacity = self.outbuf.shm.size
+            return result
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def _channel(family):
+    with _channels_lock:
+        if family not in _channels:
+            _channels[family] = _Channel(family)
+        return _channels[family]
+
+
+def call(family, func, *args):
+    """Runs `func` ("module:function") in the family's worker; ndarray args/results go through shared memory."""
+    return _channel(family).call(func, args)
+
+
+def start(family):
+    ch = _channel(family)
+    with ch.lock:
+        if not ch.alive():
+            ch.start()
+
+
+def status():
+    return {family: (f"worker (pid {ch.process.pid})" if ch.alive() else "worker not started")
+            for family, ch in _channels.items()}
+
+
+def shutdown():
+    for ch in list(_channels.values()):
+        with ch.lock:
+            ch.stop()
+
+
+# --- Worker process side ---
+
+def _worker_main(family, conn, threads):
+    global _in_worker
+    _in_worker = True
+    # Before torch is imported: OpenMP/MKL size their pools from these
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    from multiprocessing import shared_memory
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+        module, loader = FAMILIES[family]
+        getattr(importlib.import_module(module), loader)()
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", os.getpid()))
+
+    attached = {}
+    def attach(name):
+        if name not in attached:
+            for old in attached.values():
+                old.close()
+            attached.clear()
+            attached[name] = shared_memory.SharedMemory(name=name)
+        return attached[name]
+
+    funcs = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        func, packed, in_name, out_name, out_capacity = msg
+        try:
+            if func not in funcs:
+                module, _, name = func.partition(":")
+                funcs[func] = getattr(importlib.import_module(module), name)
+            args = []
+            for a in packed:
+                if isinstance(a, tuple) and len(a) == 4 and a[0] == "__shm__":
+                    _, offset, shape, dtype = a
+                    args.append(np.ndarray(shape, np.dtype(dtype), buffer=attach(in_name).buf, offset=offset))
+                else:
+                    args.append(a)
+            result = funcs[func](*args)
+            del args # Drop views into the input segment before it can be replaced
+            if isinstance(result, np.ndarray):
+                if result.nbytes <= out_capacity:
+                    out = shared_memory.SharedMemory(name=out_name)
+                    np.ndarray(result.shape, result.dtype, buffer=out.buf)[...] = result
+                    out.close()
+                    conn.send(("shm", (result.shape, result.dtype.str)))
+                else:
+                    conn.send(("grow", (result.nbytes, result)))
+            else:
+                conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    for shm in attached.values():
+        shm.close()
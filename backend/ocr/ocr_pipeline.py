@@ -1,12 +1,13 @@
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
-import torch
-from openai import OpenAI
-from backend.config import DEVICE, API_KEY, BASE_URL, LLM_MODEL
+from backend.config import LLM_MODEL, VISION_OCR_TIMEOUT_S, DEADLINE_STAGE_S, get_device
+from backend.models import workers
+from backend.utils import llm_client
+from backend.utils.metrics import timed, timed_model_load, counter
+from backend.utils.tracing import span, annotate
+from backend.utils import deadline, llm_cache
 import base64
-from io import BytesIO
 
-# 1. SETUP TrOCR (Lazy Load)
+# 1. SETUP TrOCR (Lazy Load, transformers is imported inside load_trocr)
 MODEL_ID = "microsoft/trocr-base-handwritten"
 processor = None
 model = None
@@ -17,40 +18,79 @@ def load_trocr():
     
     print(f"⏳ Loading TrOCR Model ({MODEL_ID})...")
     try:
-        processor = TrOCRProcessor.from_pretrained(MODEL_ID)
-        model = VisionEncoderDecoderModel.from_pretrained(MODEL_ID).to(DEVICE)
+        with timed_model_load("trocr"):
+            from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+            processor = TrOCRProcessor.from_pretrained(MODEL_ID)
+            model = VisionEncoderDecoderModel.from_pretrained(MODEL_ID).to(get_device())
         print("✅ TrOCR (Handwriting) Model Ready")
     except Exception as e:
         print(f"⚠️ Error loading TrOCR: {e}")
         processor = None
         model = None
 
-# 2. SETUP LLM (The "Brain" - Excellent for Logic)
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+# 2. SETUP LLM (The "Brain" - Excellent for Logic): shared pooled client, llm_client.chat()
+# Bump a version whenever its prompt changes: cached answers (llm_cache) are keyed on it
+OCR_REFINE_PROMPT_VERSION = 1
+VISION_OCR_PROMPT_VERSION = 1
 
+@span("ocr.extract_text_from_image")
 def extract_text_from_image(image_path):
     """
     Step 1: Read the image using TrOCR.
     """
+    try:
+        image = Image.open(image_path).convert("RGB")
+    except Exception as e:
+        print(f"OCR Error: {e}")
+        return ""
+    if workers.enabled("trocr"):
+        # The decoded pixels go through shared memory; the worker doesn't need the file
+        import numpy as np
+        return workers.call("trocr", "backend.ocr.ocr_pipeline:recognize_array", np.asarray(image))
+    return recognize_image(image)
+
+def recognize_array(pixels):
+    """HxWx3 uint8 -> text (the TrOCR inference worker's entry point)."""
+    return recognize_image(Image.fromarray(pixels))
+
+MAX_LINES = 16 # Bounds the batched generate on pathological inputs
+
+def recognize_image(image):
+    """
+    Deskew -> split into text lines -> one batched TrOCR generate over all lines.
+    TrOCR (base-handwritten) is a single-line model; whole multi-line notes came out garbled.
+    """
     global model, processor
     load_trocr()
     if model is None: return ""
     
     try:
+        import numpy as np
         from PIL import ImageOps, ImageEnhance
-        image = Image.open(image_path).convert("RGB")
+        from backend.utils.image_utils import deskew, segment_lines, crop_columns
         
         # Preprocessing: Grayscale + Contrast
         # TrOCR works better on high contrast images
-        image = ImageOps.grayscale(image)
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(2.0) # Double contrast
-        image = image.convert("RGB")
+        with timed("ocr_preprocess"):
+            image = ImageOps.grayscale(image)
+            enhancer = ImageEnhance.Contrast(image)
+            image = enhancer.enhance(2.0) # Double contrast
+            gray = np.asarray(image)
+        with timed("ocr_deskew"):
+            gray = deskew(gray)
+        with timed("ocr_segment"):
+            spans = segment_lines(gray)[:MAX_LINES]
+            lines = [Image.fromarray(crop_columns(gray[top:bottom])).convert("RGB") for top, bottom in spans]
+        annotate(lines=len(lines))
         
-        pixel_values = processor(images=image, return_tensors="pt").pixel_values.to(DEVICE)
+        # Every line is resized to the encoder's fixed input, so they stack into one batch
+        pixel_values = processor(images=lines, return_tensors="pt").pixel_values.to(get_device())
         
-        generated_ids = model.generate(pixel_values)
-        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        with timed("trocr_generate"):
+            generated_ids = model.generate(pixel_values)
+        texts = processor.batch_decode(generated_ids, skip_special_tokens=True)
+        generated_text = " ".join(t.strip() for t in texts if t.strip())
+        annotate(chars=len(generated_text))
         
         # Memory Cleanup Removed for Performance
         # We keep the model loaded so the next request is fast.
@@ -61,12 +101,19 @@ def extract_text_from_image(image_path):
         print(f"OCR Error: {e}")
         return ""
 
+@span("ocr.llm_refine_ocr_text")
 def llm_refine_ocr_text(ocr_text):
     """
     Step 2: Understand the text using LLM.
     Fixes typos, extracts specific jewelry terms, and ignores junk.
     """
     if not ocr_text: return {"cleaned_query": "", "product_type": "jewellery"}
+    cache_key = llm_cache.key("ocr_refine", OCR_REFINE_PROMPT_VERSION, ocr_text)
+    cached = llm_cache.get(cache_key, "ocr_refine")
+    if cached is not None:
+        return cached
+    if not deadline.allows("llm_refine"):
+        return {"cleaned_query": ocr_text, "product_type": "jewellery"}
 
     prompt = f"""
     You are a jewellery search assistant. 
@@ -90,13 +137,15 @@ def llm_refine_ocr_text(ocr_text):
     """
     print(f"DEBUG: Sending prompt to LLM for text: {ocr_text}") # Debug print to prove new code is running
     try:
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0, 
-            max_tokens=80,
-            timeout=5.0 # Fails fast if internet is bad (5s)
-        )
+        with timed("llm_call"):
+            response = llm_client.chat(
+                model=LLM_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0, 
+                max_tokens=80,
+                timeout=deadline.timeout(5.0) # Fails fast if internet is bad (5s, less if the request is running out)
+            )
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="ocr_refine", outcome="ok").inc()
         # Safe JSON parsing
         import json
         content = response.choices[0].message.content
@@ -130,27 +179,45 @@ def llm_refine_ocr_text(ocr_text):
                     result["cleaned_query"] = result["cleaned_query"].strip() + " " + p_type
                     cleaned_lower = result["cleaned_query"].lower() # Update for next check
                     
+        llm_cache.put(cache_key, "ocr_refine", result)
         return result
 
     except Exception as e:
         print(f"LLM Refine Error: {e}")
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="ocr_refine", outcome="error").inc()
         # Fallback to simple python logic if LLM fails
         return {
             "cleaned_query": ocr_text, 
             "product_type": "jewellery"
         }
 
+@span("ocr.extract_text_with_llm_vision")
 def extract_text_with_llm_vision(image_path):
     """
     Directly uses the Vision LLM to extract text and intent.
     Slower but smarter than TrOCR.
     """
+    try:
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+    except OSError as e:
+        print(f"❌ VISION OCR ERROR: {e}")
+        return {"cleaned_query": "", "product_type": "jewellery"}
+    # Same image bytes -> same answer, whichever worker process asked before
+    cache_key = llm_cache.key("vision_ocr", VISION_OCR_PROMPT_VERSION, image_bytes)
+    cached = llm_cache.get(cache_key, "vision_ocr")
+    if cached is not None:
+        return cached
+
+    # Leave enough of the budget for the TrOCR fallback if the LLM fails
+    fallback = DEADLINE_STAGE_S.get("trocr", 0.0)
+    if not deadline.allows("llm_vision", reserve=fallback):
+        return extract_text_with_trocr(image_path)
     try:
         print(f"👁️ VISION OCR: Processing {image_path}...")
         
         # Encode image
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+        encoded_string = base64.b64encode(image_bytes).decode('utf-8')
             
         prompt = """
         You are an expert handwriting OCR assistant for a jewellery store.
@@ -171,23 +238,26 @@ def extract_text_with_llm_vision(image_path):
         }
         """
         
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{encoded_string}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=300,
-            temperature=0
-        )
+        with timed("llm_call"):
+            response = llm_client.chat(
+                model=LLM_MODEL,
+                messages=[
+                    {
+                        "role": "user", 
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": f"data:image/jpeg;base64,{encoded_string}"}
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=300,
+                temperature=0,
+                timeout=deadline.timeout(VISION_OCR_TIMEOUT_S, reserve=fallback)
+            )
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="vision_ocr", outcome="ok").inc()
         
         content = response.choices[0].message.content
         
@@ -199,11 +269,19 @@ def extract_text_with_llm_vision(image_path):
             content = content.split("```")[1]
             
         result = json.loads(content)
+        llm_cache.put(cache_key, "vision_ocr", result)
         return result
         
     except Exception as e:
         print(f"❌ VISION OCR ERROR: {e}")
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="vision_ocr", outcome="error").inc()
         # Fallback to standard
         print("Falling back to TrOCR...")
-        raw_text = extract_text_from_image(image_path)
-        return llm_refine_ocr_text(raw_text)
\ No newline at end of file
+        return extract_text_with_trocr(image_path)
+
+def extract_text_with_trocr(image_path):
+    """TrOCR + LLM refine, or nothing when the request has no time left for TrOCR either."""
+    if not deadline.allows("trocr"):
+        return {"cleaned_query": "", "product_type": "jewellery"}
+    raw_text = extract_text_from_image(image_path)
+    return llm_refine_ocr_text(raw_text)
\ No newline at end of file
@@ -4,6 +4,7 @@ from typing import List, Optional
 class SearchResult(BaseModel):
     id: str
     image_path: str
+    thumbnail_url: Optional[str] = None
     score: float
     category: str
     caption: Optional[str] = None
@@ -17,8 +18,10 @@ class OCRResponse(BaseModel):
     raw_text: str
     cleaned_query: str
     detected_category: str
+    degraded: List[str] = [] # Stages skipped to meet the request deadline
 
 class TextSearchResponse(BaseModel):
     query: str
     refined_query: Optional[str] = None
     results: List[SearchResult]
+    degraded: List[str] = []
@@ -1,80 +1,64 @@
-import os
 import faiss
 import numpy as np
-from backend.config import INDEX_DIR, TOP_K
+from backend.config import TOP_K
+from backend.search import index_store
 from backend.models.clip import get_image_embedding, get_text_embedding
-IMAGE_INDEX_PATH = os.path.join(INDEX_DIR, "faiss_image.index")
-METADATA_PATH = os.path.join(INDEX_DIR, "metadata.npy")
+from backend.utils.query_cache import image_embedding_cache, phash
+from backend.utils.metrics import timed
+from backend.utils.tracing import span, annotate
 
-index = None
-metadata = []
-caption_embeddings = None
+# The live indexes + metadata are one immutable bundle in index_store, swapped
+# atomically on reload. Each search reads index_store.current() once.
 
 def load_index():
-    global index, metadata, caption_embeddings
-    if os.path.exists(IMAGE_INDEX_PATH):
-        index = faiss.read_index(IMAGE_INDEX_PATH)
-        metadata = np.load(METADATA_PATH, allow_pickle=True).tolist()
-        
-        print("🧠 Pre-computing caption embeddings for Hybrid Search...")
-        captions = [m.get('caption', "") for m in metadata]
-        
-        # Batch process captions (batch size 32 to avoid OOM on small GPUs)
-        caption_embeddings = []
-        batch_size = 32
-        
-        for i in range(0, len(captions), batch_size):
-            batch = captions[i:i+batch_size]
-            # Replace empty strings with space to avoid tokenizer errors
-            batch = [c if c.strip() else " " for c in batch]
-            
-            batch_embs = get_text_embedding(batch)
-            caption_embeddings.append(batch_embs)
-            
-        if caption_embeddings:
-            caption_embeddings = np.vstack(caption_embeddings).astype('float32')
-        else:
-            caption_embeddings = np.zeros((0, 512), dtype='float32')
-            
-        # Normalize for cosine similarity (already done in model but safe to ensure)
-        norm = np.linalg.norm(caption_embeddings, axis=1, keepdims=True)
-        norm[norm == 0] = 1 
-        caption_embeddings = caption_embeddings / norm
-        
-        print(f"✅ Index Loaded: {len(caption_embeddings)} items ready.")
+    """Loads the indexes from INDEX_DIR and makes them live (blocking)."""
+    bundle = index_store.load_bundle()
+    if bundle is not None:
+        index_store.swap(bundle)
+
+def __getattr__(name):
+    # Old module globals (image_search.index / .metadata / .caption_embeddings) read from the live bundle
+    if name in ("index", "metadata", "caption_embeddings"):
+        bundle = index_store.current()
+        if bundle is None:
+            return [] if name == "metadata" else None
+        return getattr(bundle, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- RERANKING SETUP ---
-from backend.utils.reranker import reranker_model, load_ranker
+from backend.utils.reranker import predict_scores
+from backend.utils import deadline
 
 # Removed local ranker logic to prevent double-loading models
 # We now use the shared instance from backend.utils.reranker
 
-def search_by_text(query, top_k=TOP_K):
-    if index is None: return []
-    
-    # --- WEIGHT CONFIGURATION ---
-    CAPTION_WEIGHT = 0.5
-    VISUAL_WEIGHT = 1.0 - CAPTION_WEIGHT 
-    
-    # 1. Get Query Embedding
-    query_emb = get_text_embedding(query).astype("float32")
-    query_emb = query_emb / np.linalg.norm(query_emb)
-    
-    # 2. Visual Search (Fetch Candidates)
-    # Fetch top 50 visual matches
-    v_scores, v_indices = index.search(query_emb.reshape(1, -1), 50)
-    v_indices = v_indices[0]
-    v_scores = v_scores[0]
-    
+@timed("caption_fusion")
+def caption_fusion(query_emb, v_scores, v_indices, caption_weight=0.5, n_text=50, bundle=None):
+    """
+    Hybrid fusion: union of the visual candidates with the top caption matches,
+    scored as a weighted sum of visual and caption similarity.
+    """
+    bundle = bundle or index_store.current()
+    caption_embeddings, metadata = bundle.caption_embeddings, bundle.metadata
+    visual_weight = 1.0 - caption_weight
+
     # 3. Semantic Search (Caption Match)
-    c_scores_all = np.dot(caption_embeddings, query_emb.T).flatten()
-    
-    # Fetch top 50 caption matches
-    # argsort gives ascending, so we take last 50 and reverse
-    t_indices = np.argsort(c_scores_all)[-50:][::-1]
-    
-    # 4. Hybrid Fusion (Union of Candidates)
-    all_indices = set(v_indices) | set(t_indices)
+    if isinstance(caption_embeddings, np.ndarray):
+        c_scores_all = np.dot(caption_embeddings, query_emb.T).flatten()
+        
+        # Fetch top 50 caption matches
+        # argsort gives ascending, so we take last 50 and reverse
+        t_indices = np.argsort(c_scores_all)[-n_text:][::-1]
+        
+        # 4. Hybrid Fusion (Union of Candidates)
+        all_indices = set(v_indices) | set(t_indices)
+    else:
+        # Sharded caption space: top matches from every shard, then exact scores for just the union
+        _, t_indices = caption_embeddings.search(query_emb.reshape(1, -1), n_text)
+        t_indices = t_indices[0][t_indices[0] >= 0]
+        all_indices = set(v_indices) | set(t_indices)
+        all_indices = {idx for idx in all_indices if 0 <= idx < len(metadata)}
+        c_scores_all = dict(zip(all_indices, caption_embeddings.score(query_emb, list(all_indices))))
     
     candidates = []
     
@@ -87,7 +71,7 @@ def search_by_text(query, top_k=TOP_K):
             v_score = v_score_map.get(idx, 0.0) # 0.0 if only found via text
             c_score = c_scores_all[idx]
             
-            final_score = (VISUAL_WEIGHT * v_score) + (CAPTION_WEIGHT * c_score)
+            final_score = (visual_weight * v_score) + (caption_weight * c_score)
             
             item = metadata[idx].copy()
             
@@ -103,15 +87,44 @@ def search_by_text(query, top_k=TOP_K):
             item['debug'] = f"Src: {'+'.join(source)}"
             
             candidates.append(item)
+    annotate(candidates=len(candidates))
+    return candidates
+
+@span("image_search.search_by_text")
+def search_by_text(query, top_k=TOP_K):
+    bundle = index_store.current()
+    if bundle is None: return []
+    
+    # --- WEIGHT CONFIGURATION ---
+    CAPTION_WEIGHT = 0.5
+    
+    # 1. Get Query Embedding
+    query_emb = get_text_embedding(query).astype("float32")
+    query_emb = query_emb / np.linalg.norm(query_emb)
+    
+    # 2. Visual Search (Fetch Candidates)
+    # Fetch top 50 visual matches
+    with timed("faiss_search"):
+        v_scores, v_indices = bundle.index.search(query_emb.reshape(1, -1), 50)
+    v_indices = v_indices[0]
+    v_scores = v_scores[0]
+    
+    # 3 + 4. Caption match + hybrid fusion
+    candidates = caption_fusion(query_emb, v_scores, v_indices, caption_weight=CAPTION_WEIGHT, bundle=bundle)
     
     # 5. RERANKING
-    load_ranker()
-    if reranker_model:
+    # Prepare pairs for cross-encoder: (query, caption). None when the ranker isn't available
+    # (in-process, or in the reranker inference worker)
+    # Skipped when the request deadline can't afford it (candidates keep their fusion order)
+    pairs = [[query, c['caption']] for c in candidates]
+    try:
+        with timed("rerank"):
+            cross_scores = predict_scores(pairs) if pairs and deadline.allows("rerank") else None
+    except Exception as e:
+        print(f"Rerank Error: {e}")
+        cross_scores = None
+    if cross_scores is not None:
         try:
-            # Prepare pairs for cross-encoder: (query, caption)
-            pairs = [[query, c['caption']] for c in candidates]
-            cross_scores = reranker_model.predict(pairs)
-            
             for i, item in enumerate(candidates):
                 item['score'] = float(cross_scores[i])
                 item['debug'] = f"Reranked: {cross_scores[i]:.2f} (Init: {item['initial_score']:.2f})"
@@ -134,17 +147,58 @@ def search_by_text(query, top_k=TOP_K):
             
     return candidates[:top_k]
 
+@span("image_search.search_by_image")
 def search_by_image(pil_image, top_k=TOP_K):
     # Image search remains 100% Visual
-    if index is None: return []
-    emb = get_image_embedding(pil_image).astype("float32")
-    faiss.normalize_L2(emb.reshape(1, -1))
-    scores, indices = index.search(emb.reshape(1, -1), top_k)
+    bundle = index_store.current()
+    if bundle is None: return []
+    # Re-uploads of the same photo skip CLIP preprocessing + inference
+    key = phash(pil_image)
+    emb = image_embedding_cache.get(key)
+    annotate(cache_hit=emb is not None)
+    if emb is None:
+        emb = get_image_embedding(pil_image).astype("float32")
+        faiss.normalize_L2(emb.reshape(1, -1))
+        image_embedding_cache.put(key, emb)
+    with timed("faiss_search"):
+        scores, indices = bundle.index.search(emb.reshape(1, -1), top_k)
     
     results = []
     for score, idx in zip(scores[0], indices[0]):
-        if idx < len(metadata):
-            item = metadata[idx].copy()
+        if idx < len(bundle.metadata):
+            item = bundle.metadata[idx].copy()
+            item['score'] = float(score)
+            results.append(item)
+    return results
+
+@span("image_search.search_by_vector")
+def search_by_vector(vector, space="photo", top_k=TOP_K):
+    """
+    Nearest items to a caller-supplied embedding (L2-normalized float32, EMBED_DIM)
+    in one space: "photo", "sketch" or "caption". No model runs, so no rerank either.
+    """
+    bundle = index_store.current()
+    if bundle is None: return []
+    index = {"photo": bundle.index, "sketch": bundle.sketch_index, "caption": bundle.caption_embeddings}[space]
+    if index is None:
+        raise LookupError(f"No {space} index loaded")
+    query = np.ascontiguousarray(vector, dtype="float32").reshape(1, -1)
+    with timed("faiss_search"):
+        if isinstance(index, np.ndarray): # Caption embeddings are a plain matrix unless sharded
+            sims = index @ query[0]
+            k = min(top_k, len(sims))
+            if k == 0: return []
+            indices = np.argpartition(-sims, k - 1)[:k]
+            indices = indices[np.argsort(-sims[indices])]
+            scores = sims[indices]
+        else:
+            scores, indices = index.search(query, top_k)
+            scores, indices = scores[0], indices[0]
+
+    results = []
+    for score, idx in zip(scores, indices):
+        if 0 <= idx < len(bundle.metadata):
+            item = bundle.metadata[idx].copy()
             item['score'] = float(score)
             results.append(item)
-    return results
\ No newline at end of file
+    return results
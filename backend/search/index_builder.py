@@ -0,0 +1,217 @@
+import os
+import json
+import numpy as np
+import faiss
+from PIL import Image
+from tqdm import tqdm
+from backend.config import DATA_DIR, INDEX_DIR, FAST_PREPROCESS, EMBED_DIM
+from backend.models.clip import get_image_embedding
+from backend.utils.captioning import generate_caption
+from backend.utils.sketch_utils import photo_to_sketch_database
+from backend.utils.thumbnails import generate_thumbnails
+from backend.search import manifest as manifest_mod
+from backend.search import neighbors
+from backend.search.index_store import IMAGE_INDEX_PATH, SKETCH_INDEX_PATH, METADATA_PATH, write_index
+
+METADATA_JSON = os.path.join(INDEX_DIR, "metadata_with_captions.json")
+
+BATCH_SIZE = 32
+
+
+def list_catalogue(data_dir=DATA_DIR):
+    """(category, image name, full path) for every image, without opening any of them."""
+    entries = []
+    for category in os.listdir(data_dir):
+        cat_path = os.path.join(data_dir, category)
+        if not os.path.isdir(cat_path): continue
+
+        for img_name in os.listdir(cat_path):
+            if img_name.lower().endswith(manifest_mod.IMAGE_EXTS):
+                entries.append((category, img_name, os.path.join(cat_path, img_name)))
+    return entries
+
+
+def caption_image(full_path, category):
+    # minimal fallback or lazy generation could be better here
+    # but keeping original logic for consistency
+    try:
+        img = Image.open(full_path).convert("RGB")
+        return generate_caption(img, category_name=category)
+    except:
+        return f"a {category} made of gold or silver"
+
+
+def edited_in_place(img_name, full_path, stamps):
+    """True if the last manifest stamped this image with another size/mtime (its caption is stale)."""
+    old = (stamps or {}).get(img_name)
+    return old is not None and manifest_mod.file_stamp(full_path) != old[:2]
+
+
+def scan_catalogue(existing_meta, data_dir=DATA_DIR, only=None, stamps=None):
+    """
+    Walks every category directory; captions only images that aren't in existing_meta yet
+    or were edited in place since `stamps` (the last manifest's "files") was taken.
+    `only(img_name)` restricts the scan to a subset (e.g. one shard).
+    """
+    new_meta = {}
+    for category, img_name, full_path in list_catalogue(data_dir):
+        if only is not None and not only(img_name):
+            continue
+        if img_name in existing_meta and not edited_in_place(img_name, full_path, stamps):
+            caption = existing_meta[img_name]['caption']
+        else:
+            caption = caption_image(full_path, category)
+
+        new_meta[img_name] = {
+            "image_path": full_path,
+            "category": category,
+            "id": img_name,
+            "caption": caption
+        }
+    return new_meta
+
+
+def load_existing_meta():
+    if os.path.exists(METADATA_JSON):
+        with open(METADATA_JSON, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def stack_normalized(embeddings):
+    if not embeddings:
+        return np.zeros((0, EMBED_DIM), dtype='float32')
+    embeddings = np.vstack(embeddings).astype('float32')
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def flat_index(embeddings):
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+    return index
+
+
+def embed_photos(meta_list):
+    """L2-normalized CLIP embeddings of the catalogue photos, one row per item."""
+    print(f"Processing {len(meta_list)} images in batches of {BATCH_SIZE}...")
+    embeddings = []
+    for i in tqdm(range(0, len(meta_list), BATCH_SIZE)):
+        batch_items = meta_list[i:i+BATCH_SIZE]
+        if FAST_PREPROCESS:
+            # Paths go straight to the threaded decoder (JPEG draft mode, black placeholder on error)
+            current_batch_imgs = [item['image_path'] for item in batch_items]
+        else:
+            current_batch_imgs = []
+            for item in batch_items:
+                try:
+                    img = Image.open(item['image_path']).convert("RGB")
+                    current_batch_imgs.append(img)
+                except Exception as e:
+                    print(f"Error loading {item['image_path']}: {e}")
+                    # Black placeholder
+                    current_batch_imgs.append(Image.new("RGB", (224, 224)))
+
+        if current_batch_imgs:
+            embeddings.append(get_image_embedding(current_batch_imgs))
+    return stack_normalized(embeddings)
+
+
+def embed_sketches(meta_list):
+    """L2-normalized CLIP embeddings of each photo's pencil-sketch rendering."""
+    # photo_to_sketch_database is CPU-bound OpenCV, one by one; the embedding part is batched
+    embeddings = []
+    sketch_batch_imgs = []
+    for item in tqdm(meta_list):
+        try:
+            pil_sketch = photo_to_sketch_database(item['image_path'])
+            sketch_batch_imgs.append(pil_sketch if pil_sketch else Image.new("RGB", (224, 224))) # Placeholder
+        except:
+            sketch_batch_imgs.append(Image.new("RGB", (224, 224)))
+
+        if len(sketch_batch_imgs) >= BATCH_SIZE:
+            embeddings.append(get_image_embedding(sketch_batch_imgs))
+            sketch_batch_imgs = []
+
+    if sketch_batch_imgs:
+        embeddings.append(get_image_embedding(sketch_batch_imgs))
+    return stack_normalized(embeddings)
+
+
+def build_image_index(meta_list):
+    embeddings = embed_photos(meta_list)
+    return flat_index(embeddings) if len(embeddings) else None
+
+
+def build_sketch_index(meta_list):
+    embeddings = embed_sketches(meta_list)
+    return flat_index(embeddings) if len(embeddings) else None
+
+
+def build(force=False):
+    """
+    Full catalogue scan + (re)build of whatever is stale, then writes the manifest
+    that lets the next startup skip all of this.
+    """
+    existing_meta = load_existing_meta()
+    old_manifest = manifest_mod.load_manifest()
+
+    old_files = (old_manifest or {}).get("files") or {}
+    new_meta = scan_catalogue(existing_meta, stamps=old_files)
+    files = dict(old_files) # Unchanged images keep their sha256, only new/edited ones are hashed
+    directories = manifest_mod.scan_directories(files=files)
+    files = {k: v for k, v in files.items() if k in new_meta}
+    meta_list = list(new_meta.values())
+
+    # Save metadata if changed
+    if new_meta != existing_meta:
+        print("Updates detected (paths or content). Saving new metadata...")
+        with open(METADATA_JSON, 'w') as f:
+            json.dump(new_meta, f, indent=4)
+
+    # Thumbnail tier for result grids (incremental: only new/changed images)
+    generate_thumbnails(meta_list)
+
+    # Same file names but different bytes (an image replaced in place) also needs re-embedding
+    content_changed = old_manifest is not None and any(
+        old_manifest.get("directories", {}).get(cat, {}).get("content_hash") != entry["content_hash"]
+        for cat, entry in directories.items()
+    )
+    models_changed = old_manifest is not None and old_manifest.get("models") != manifest_mod.model_ids()
+    should_rebuild_index = (force or new_meta != existing_meta or content_changed or models_changed
+                            or not os.path.exists(IMAGE_INDEX_PATH))
+
+    if should_rebuild_index:
+        print("Building Visual Index...")
+        index = build_image_index(meta_list)
+        if index is not None:
+            tmp_meta = METADATA_PATH[:-len(".npy")] + ".tmp.npy"
+            np.save(tmp_meta, meta_list)
+            os.replace(tmp_meta, METADATA_PATH)
+            write_index(index, IMAGE_INDEX_PATH)
+
+    rebuild_sketch = should_rebuild_index or not os.path.exists(SKETCH_INDEX_PATH)
+    if rebuild_sketch:
+        print("🎨 Building Artistic Sketch Index (Batched)...")
+        # Sketch rows must line up with the photo index, i.e. metadata.npy, not this scan's order
+        sketch_meta = meta_list
+        if not should_rebuild_index and os.path.exists(METADATA_PATH):
+            sketch_meta = np.load(METADATA_PATH, allow_pickle=True).tolist()
+        index = build_sketch_index(sketch_meta)
+        if index is not None:
+            write_index(index, SKETCH_INDEX_PATH)
+
+    if (should_rebuild_index or rebuild_sketch) and os.path.exists(IMAGE_INDEX_PATH):
+        print("🕸️ Building neighbour graph (photo + sketch)...")
+        sketch_vectors = (neighbors.vectors_of(faiss.read_index(SKETCH_INDEX_PATH))
+                          if os.path.exists(SKETCH_INDEX_PATH) else None)
+        # Rows follow metadata.npy (what the index was built from), not this scan's order
+        ids = [m['id'] for m in np.load(METADATA_PATH, allow_pickle=True).tolist()]
+        graph = neighbors.build_graph(ids,
+                                      neighbors.vectors_of(faiss.read_index(IMAGE_INDEX_PATH)), sketch_vectors)
+        if graph is not None:
+            neighbors.save(graph)
+
+    manifest_mod.save_manifest(manifest_mod.build_manifest(directories, len(meta_list), files=files))
+    print(f"🧾 Manifest written ({len(directories)} directories, {len(meta_list)} items)")
+    return new_meta
@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+import faiss
+import numpy as np
+from backend.config import INDEX_DIR, MANIFEST_PATH, SHARDED_SEARCH, SEARCH_SHARDS
+from backend.utils import metrics
+from backend.search import neighbors
+
+IMAGE_INDEX_PATH = os.path.join(INDEX_DIR, "faiss_image.index")
+SKETCH_INDEX_PATH = os.path.join(INDEX_DIR, "faiss_sketch.index")
+METADATA_PATH = os.path.join(INDEX_DIR, "metadata.npy")
+CAPTION_EMB_PATH = os.path.join(INDEX_DIR, "caption_embeddings.npy")
+
+
+class IndexBundle:
+    """
+    One consistent snapshot of everything search reads: photo index, sketch index,
+    caption embeddings and metadata. Never mutated after construction; a reload
+    builds a new bundle and swaps the reference, so a request that grabbed the
+    old one keeps using it until it returns.
+    """
+    __slots__ = ("version", "index", "sketch_index", "caption_embeddings", "metadata", "loaded_at", "source",
+                 "resources", "neighbors")
+
+    def __init__(self, index, sketch_index, caption_embeddings, metadata, version=0, source="", resources=None,
+                 neighbors=None):
+        self.index = index
+        self.sketch_index = sketch_index
+        self.caption_embeddings = caption_embeddings
+        self.metadata = metadata
+        self.version = version
+        self.source = source
+        self.resources = resources # e.g. shard worker processes, closed once the bundle is retired
+        self.neighbors = neighbors # NeighborGraph for /similar, or None
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "items": len(self.metadata),
+            "image_index": self.index.ntotal if self.index is not None else None,
+            "sketch_index": self.sketch_index.ntotal if self.sketch_index is not None else None,
+            "loaded_at": self.loaded_at,
+            "source": self.source,
+            "neighbors": self.neighbors.info() if self.neighbors is not None else None,
+        }
+
+
+_current = None
+_swap_lock = threading.Lock()
+_version = 0
+
+# Held by anything that derives the next bundle from files or from the live one
+# (reload, ingestion), so two writers can't each swap in a bundle missing the other's changes
+write_lock = threading.RLock()
+
+
+def current():
+    """The live bundle (None before the first load). Read it once per request."""
+    return _current
+
+
+# Requests still searching a retired bundle get this long before its resources are closed
+RETIRE_GRACE_SECONDS = 60
+
+
+def swap(bundle):
+    """Atomically publishes `bundle`; returns the one it replaced."""
+    global _current, _version
+    with _swap_lock:
+        _version += 1
+        bundle.version = _version
+        old, _current = _current, bundle
+    metrics.gauge("index_bundle_version", "Version of the live index bundle").set(bundle.version)
+    metrics.gauge("index_items", "Items in the live index bundle").set(len(bundle))
+    if old is not None and old.resources is not None and old.resources is not bundle.resources:
+        timer = threading.Timer(RETIRE_GRACE_SECONDS, old.resources.close)
+        timer.daemon = True
+        timer.start()
+    return old
+
+
+def close():
+    """Shutdown: releases whatever the live bundle holds (shard workers)."""
+    bundle = _current
+    if bundle is not None and bundle.resources is not None:
+        bundle.resources.close()
+
+
+def _caption_embeddings(metadata):
+    # Reuse persisted caption embeddings when they match the metadata, so a
+    # restart doesn't have to load CLIP before the API can accept requests
+    if os.path.exists(CAPTION_EMB_PATH) and os.path.getmtime(CAPTION_EMB_PATH) >= os.path.getmtime(METADATA_PATH):
+        cached = np.load(CAPTION_EMB_PATH)
+        if len(cached) == len(metadata):
+            print(f"✅ Caption embeddings loaded from cache ({len(cached)} items)")
+            return cached
+
+    from backend.models.clip import get_text_embedding
+    print("🧠 Pre-computing caption embeddings for Hybrid Search...")
+    captions = [m.get('caption', "") for m in metadata]
+
+    # Batch process captions (batch size 32 to avoid OOM on small GPUs)
+    caption_embeddings = []
+    batch_size = 32
+    for i in range(0, len(captions), batch_size):
+        # Replace empty strings with space to avoid tokenizer errors
+        batch = [c if c.strip() else " " for c in captions[i:i+batch_size]]
+        caption_embeddings.append(get_text_embedding(batch))
+
+    if caption_embeddings:
+        caption_embeddings = np.vstack(caption_embeddings).astype('float32')
+    else:
+        caption_embeddings = np.zeros((0, 512), dtype='float32')
+
+    # Normalize for cosine similarity (already done in model but safe to ensure)
+    norm = np.linalg.norm(caption_embeddings, axis=1, keepdims=True)
+    norm[norm == 0] = 1
+    caption_embeddings = (caption_embeddings / norm).astype('float32')
+    np.save(CAPTION_EMB_PATH, caption_embeddings)
+    return caption_embeddings
+
+
+def _neighbor_graph(index, sketch_index, metadata):
+    # Persisted graph when it matches; otherwise (index from before the graph existed) build it now
+    ids = [m['id'] for m in metadata]
+    graph = neighbors.load(ids, METADATA_PATH)
+    if graph is None:
+        t0 = time.perf_counter()
+        graph = neighbors.build_graph(ids, neighbors.vectors_of(index), neighbors.vectors_of(sketch_index))
+        if graph is not None:
+            neighbors.save(graph)
+            print(f"🕸️ Neighbour graph built for {len(ids)} items in {time.perf_counter() - t0:.1f}s")
+    return graph
+
+
+def write_index(index, path):
+    # Write-then-rename, so a server reloading concurrently never reads a half-written file
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def save_bundle(bundle):
+    """Persists a bundle to INDEX_DIR in the layout load_bundle() reads."""
+    tmp_meta = METADATA_PATH[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp_meta, bundle.metadata)
+    os.replace(tmp_meta, METADATA_PATH)
+    # Written after metadata.npy so its mtime marks it as matching
+    tmp_caps = CAPTION_EMB_PATH[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp_caps, bundle.caption_embeddings)
+    os.replace(tmp_caps, CAPTION_EMB_PATH)
+    write_index(bundle.index, IMAGE_INDEX_PATH)
+    if bundle.sketch_index is not None:
+        write_index(bundle.sketch_index, SKETCH_INDEX_PATH)
+    if bundle.neighbors is not None:
+        neighbors.save(bundle.neighbors)
+
+
+def load_bundle():
+    """Reads the index files from INDEX_DIR into a new (not yet live) bundle, or None if there's no index."""
+    if not os.path.exists(IMAGE_INDEX_PATH):
+        return None
+    if SHARDED_SEARCH == "process":
+        from backend.search.sharding import start_process_bundle
+        bundle, workers = start_process_bundle(SEARCH_SHARDS)
+        bundle.resources = workers
+        # No vectors in this process to build it from: only a persisted graph is used
+        bundle.neighbors = neighbors.load([m['id'] for m in bundle.metadata], METADATA_PATH)
+        return bundle
+    index = faiss.read_index(IMAGE_INDEX_PATH)
+    metadata = np.load(METADATA_PATH, allow_pickle=True).tolist()
+    sketch_index = faiss.read_index(SKETCH_INDEX_PATH) if os.path.exists(SKETCH_INDEX_PATH) else None
+    if index.ntotal != len(metadata):
+        raise ValueError(f"Image index has {index.ntotal} vectors but metadata has {len(metadata)} items")
+    if sketch_index is not None and sketch_index.ntotal != len(metadata):
+        raise ValueError(f"Sketch index has {sketch_index.ntotal} vectors but metadata has {len(metadata)} items")
+
+    bundle = IndexBundle(index, sketch_index, _caption_embeddings(metadata), metadata, source=INDEX_DIR,
+                         neighbors=_neighbor_graph(index, sketch_index, metadata))
+    print(f"✅ Index Loaded: {len(metadata)} items ready"
+          + (f", sketch index {sketch_index.ntotal}" if sketch_index is not None else ", no sketch index"))
+    if SHARDED_SEARCH == "local":
+        from backend.search.sharding import split_bundle
+        bundle = split_bundle(bundle, SEARCH_SHARDS)
+    return bundle
+
+
+# --- Background reload ---
+_reload_lock = threading.Lock()
+reload_status = {"state": "idle", "rebuild": False, "started": None, "finished": None, "error": None, "version": 0}
+
+
+def _run_reload(rebuild):
+    t0 = time.perf_counter()
+    try:
+        with write_lock:
+            if rebuild:
+                from backend.search import index_builder
+                index_builder.build(force=True)
+            bundle = load_bundle()
+            if bundle is None:
+                raise FileNotFoundError(f"No index in {INDEX_DIR}")
+            old = swap(bundle)
+            mark_manifest_seen()
+        reload_status.update(state="idle", error=None, version=bundle.version)
+        metrics.counter("index_reloads_total", "Index bundle reloads", outcome="ok").inc()
+        print(f"🔁 Index bundle v{bundle.version} live ({len(bundle)} items, was {len(old) if old else 0}) "
+              f"in {time.perf_counter() - t0:.1f}s")
+    except Exception as e:
+        reload_status.update(state="failed", error=str(e))
+        metrics.counter("index_reloads_total", "Index bundle reloads", outcome="error").inc()
+        print(f"❌ Index reload failed, keeping v{_current.version if _current else 0}: {e}")
+    finally:
+        reload_status["finished"] = time.time()
+        _reload_lock.release()
+
+
+def reload_in_background(rebuild=False):
+    """
+    Loads (and with rebuild=True first rebuilds) the indexes in a background
+    thread and swaps them in when ready. Returns False if a reload is already running.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_status.update(state="building" if rebuild else "loading", rebuild=rebuild,
+                         started=time.time(), finished=None, error=None)
+    threading.Thread(target=_run_reload, args=(rebuild,), name="index-reload", daemon=True).start()
+    return True
+
+
+_manifest_seen = None
+
+
+def _manifest_mtime():
+    try:
+        return os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def mark_manifest_seen():
+    """Call after writing the manifest from this process, so the watcher doesn't reload our own change."""
+    global _manifest_seen
+    _manifest_seen = _manifest_mtime()
+
+
+def watch_manifest(interval=5.0):
+    """
+    Reloads whenever the manifest changes on disk, i.e. when an external
+    index build (see index_builder) finished. Polling, so it works everywhere.
+    """
+    mark_manifest_seen()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            mtime = _manifest_mtime()
+            if mtime is not None and mtime != _manifest_seen:
+                print("👀 Index manifest changed on disk, reloading...")
+                if reload_in_background(rebuild=False):
+                    mark_manifest_seen()
+
+    threading.Thread(target=run, name="index-watch", daemon=True).start()
@@ -0,0 +1,294 @@
+import os
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import faiss
+import numpy as np
+from PIL import Image
+from backend.config import DATA_DIR, INDEX_DIR, INGEST_BATCH_SIZE, EMBED_DIM
+from backend.search import index_store, neighbors
+from backend.search import manifest as manifest_mod
+from backend.utils import metrics
+from backend.utils.metrics import timed
+
+# Live ingestion: new images are captioned, embedded (photo + sketch + caption)
+# and appended to the live bundle copy-on-write, without a full rebuild (the
+# neighbour graph is extended with them too).
+# Removing or editing items still needs /admin/reload?rebuild=true.
+
+METADATA_JSON = os.path.join(INDEX_DIR, "metadata_with_captions.json")
+CATEGORY_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+MAX_JOBS_KEPT = 1000
+
+_queue = queue.Queue()
+_jobs = OrderedDict() # job id -> job dict (most recent MAX_JOBS_KEPT)
+_jobs_lock = threading.Lock()
+_pending_paths = set() # queued or processing, so the watcher doesn't enqueue twice
+_worker = None
+_worker_lock = threading.Lock()
+stats = {"queued": 0, "done": 0, "failed": 0, "batches": 0}
+
+
+def safe_filename(name):
+    base = os.path.basename(name or "")
+    stem, ext = os.path.splitext(base)
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", stem).strip("._") or "item"
+    return stem + (ext.lower() if ext.lower() in manifest_mod.IMAGE_EXTS else ".jpg")
+
+
+def unique_path(category, filename):
+    """DATA_DIR/<category>/<filename>, suffixed when the name (= item id) is already taken."""
+    cat_dir = os.path.join(DATA_DIR, category)
+    os.makedirs(cat_dir, exist_ok=True)
+    bundle = index_store.current()
+    taken = {m['id'] for m in bundle.metadata} if bundle else set()
+    stem, ext = os.path.splitext(filename)
+    candidate, n = filename, 1
+    while candidate in taken or os.path.exists(os.path.join(cat_dir, candidate)):
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    return os.path.join(cat_dir, candidate)
+
+
+def _set(job, **fields):
+    with _jobs_lock:
+        job.update(fields, updated=time.time())
+
+
+def submit(image_path, category, caption=None, source="api"):
+    """Queues an image that is already in DATA_DIR/<category>/ and returns its job."""
+    job = {
+        "job_id": uuid.uuid4().hex[:12],
+        "id": os.path.basename(image_path),
+        "image_path": image_path,
+        "category": category,
+        "caption": caption,
+        "source": source,
+        "state": "queued",
+        "error": None,
+        "created": time.time(),
+        "updated": time.time(),
+    }
+    with _jobs_lock:
+        _jobs[job["job_id"]] = job
+        while len(_jobs) > MAX_JOBS_KEPT:
+            _jobs.popitem(last=False)
+        _pending_paths.add(image_path)
+        stats["queued"] += 1
+    _queue.put(job)
+    metrics.gauge("ingest_queue_depth", "Items waiting for ingestion").set(_queue.qsize())
+    start_worker()
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def status(recent=20):
+    with _jobs_lock:
+        jobs = [dict(j) for j in list(_jobs.values())[-recent:]]
+        counts = dict(stats)
+    return {"queue_depth": _queue.qsize(), **counts, "recent": jobs[::-1]}
+
+
+def _embed(items, images):
+    """(photo, sketch, caption) embeddings for a batch, each row L2-normalized float32."""
+    from backend.models.clip import get_image_embedding, get_text_embedding
+    from backend.utils.sketch_utils import photo_to_sketch_database
+
+    photo = get_image_embedding(images).astype("float32")
+    sketches = []
+    for item in items:
+        try:
+            sketches.append(photo_to_sketch_database(item['image_path']) or Image.new("RGB", (224, 224)))
+        except Exception:
+            sketches.append(Image.new("RGB", (224, 224)))
+    sketch = get_image_embedding(sketches).astype("float32")
+    caption = get_text_embedding([i['caption'] if i['caption'].strip() else " " for i in items]).astype("float32")
+    for arr in (photo, sketch, caption):
+        faiss.normalize_L2(arr)
+    return photo, sketch, caption
+
+
+def _append(base, items, photo, sketch, caption):
+    """New bundle = base + items. The live bundle is never touched (requests may be searching it)."""
+    if base is not None and not isinstance(base.caption_embeddings, np.ndarray):
+        raise RuntimeError("Live ingestion isn't supported with sharded search; rebuild the shards and reload")
+    if base is None:
+        base = index_store.IndexBundle(faiss.IndexFlatIP(EMBED_DIM), faiss.IndexFlatIP(EMBED_DIM),
+                                       np.zeros((0, EMBED_DIM), dtype="float32"), [], source="ingest")
+    index = faiss.clone_index(base.index)
+    index.add(photo)
+    old_vectors = {"photo": neighbors.vectors_of(base.index)}
+    new_vectors = {"photo": photo}
+    sketch_index = None
+    if base.sketch_index is not None and base.sketch_index.ntotal == len(base.metadata):
+        sketch_index = faiss.clone_index(base.sketch_index)
+        sketch_index.add(sketch)
+        old_vectors["sketch"], new_vectors["sketch"] = neighbors.vectors_of(base.sketch_index), sketch
+    elif base.sketch_index is not None:
+        print("⚠️ Sketch index out of step with metadata, not appending sketches (rebuild to fix)")
+        sketch_index = base.sketch_index
+    metadata = base.metadata + items
+    with timed("ingest_neighbors"):
+        graph = neighbors.extend(base.neighbors, [m['id'] for m in metadata], old_vectors, new_vectors)
+    return index_store.IndexBundle(
+        index, sketch_index,
+        np.vstack([base.caption_embeddings, caption]).astype("float32"),
+        metadata,
+        source=base.source,
+        neighbors=graph,
+    )
+
+
+def _persist(bundle, items):
+    """Writes the new bundle + captions so a restart (or another worker) sees the items too."""
+    index_store.save_bundle(bundle)
+    try:
+        with open(METADATA_JSON, "r") as f:
+            meta_json = json.load(f)
+    except (OSError, ValueError):
+        meta_json = {}
+    for item in items:
+        meta_json[item['id']] = item
+    tmp = METADATA_JSON + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta_json, f, indent=4)
+    os.replace(tmp, METADATA_JSON)
+    if manifest_mod.refresh_manifest({i['category'] for i in items}, {m['id'] for m in bundle.metadata}, len(bundle)):
+        index_store.mark_manifest_seen()
+
+
+def _process(jobs):
+    from backend.utils.captioning import generate_caption
+    from backend.utils.thumbnails import generate_thumbnails
+
+    items, images, ok_jobs = [], [], []
+    live = index_store.current()
+    known = {m['id'] for m in live.metadata} if live else set()
+    for job in jobs:
+        _set(job, state="processing")
+        if job["id"] in known:
+            _set(job, state="skipped", error="already indexed")
+            continue
+        try:
+            img = Image.open(job["image_path"]).convert("RGB")
+            caption = job["caption"] or generate_caption(img, category_name=job["category"])
+        except Exception as e:
+            _set(job, state="failed", error=str(e))
+            stats["failed"] += 1
+            metrics.counter("ingest_items_total", "Items processed by live ingestion", outcome="failed").inc()
+            continue
+        _set(job, caption=caption)
+        known.add(job["id"])
+        items.append({"image_path": job["image_path"], "category": job["category"], "id": job["id"], "caption": caption})
+        images.append(img)
+        ok_jobs.append(job)
+
+    if not items:
+        return
+    with timed("ingest_embed"):
+        photo, sketch, caption = _embed(items, images)
+    generate_thumbnails(items)
+
+    # Derive + swap under the write lock so a concurrent reload can't drop these items
+    with index_store.write_lock:
+        base = index_store.current()
+        if base is not live and base is not None:
+            # A reload landed meanwhile and may already contain some of these
+            ids = {m['id'] for m in base.metadata}
+            keep = [i for i, item in enumerate(items) if item['id'] not in ids]
+            for i, job in enumerate(ok_jobs):
+                if i not in keep:
+                    _set(job, state="skipped", error="already indexed")
+            items, ok_jobs = [items[i] for i in keep], [ok_jobs[i] for i in keep]
+            photo, sketch, caption = photo[keep], sketch[keep], caption[keep]
+            if not items:
+                return
+        bundle = _append(base, items, photo, sketch, caption)
+        index_store.swap(bundle)
+        for job in ok_jobs:
+            _set(job, state="done", searchable_after_s=round(time.time() - job["created"], 2))
+        print(f"📥 Ingested {len(items)} item(s), bundle v{bundle.version} now has {len(bundle)}")
+        with timed("ingest_persist"):
+            _persist(bundle, items)
+    stats["done"] += len(items)
+    metrics.counter("ingest_items_total", "Items processed by live ingestion", outcome="done").inc(len(items))
+
+
+def _run():
+    while True:
+        jobs = [_queue.get()]
+        # Drain whatever else is waiting so CLIP sees one batch
+        while len(jobs) < INGEST_BATCH_SIZE:
+            try:
+                jobs.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        metrics.gauge("ingest_queue_depth", "Items waiting for ingestion").set(_queue.qsize())
+        try:
+            with timed("ingest_batch"):
+                _process(jobs)
+            stats["batches"] += 1
+        except Exception as e:
+            print(f"❌ Ingestion batch failed: {e}")
+            for job in jobs:
+                if job["state"] in ("queued", "processing"):
+                    _set(job, state="failed", error=str(e))
+                    stats["failed"] += 1
+        finally:
+            with _jobs_lock:
+                for job in jobs:
+                    _pending_paths.discard(job["image_path"])
+
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="ingest-worker", daemon=True)
+            _worker.start()
+
+
+def watch_data_dir(interval=5.0, settle_s=2.0):
+    """
+    Polls DATA_DIR and queues images that aren't indexed yet. Each tick is one
+    stat per category directory; only directories whose mtime moved are listed.
+    Files younger than `settle_s` are left for the next tick (may still be copying).
+    """
+    def run():
+        dir_mtimes = {}
+        while True:
+            try:
+                bundle = index_store.current()
+                known = {m['id'] for m in bundle.metadata} if bundle else set()
+                for category in os.listdir(DATA_DIR):
+                    cat_path = os.path.join(DATA_DIR, category)
+                    if not os.path.isdir(cat_path) or not CATEGORY_RE.match(category):
+                        continue
+                    mtime = os.stat(cat_path).st_mtime_ns
+                    if dir_mtimes.get(category) == mtime:
+                        continue
+                    settled = True
+                    for name in os.listdir(cat_path):
+                        path = os.path.join(cat_path, name)
+                        if not name.lower().endswith(manifest_mod.IMAGE_EXTS) or name in known or path in _pending_paths:
+                            continue
+                        if time.time() - os.stat(path).st_mtime < settle_s:
+                            settled = False
+                            continue
+                        submit(path, category, source="watcher")
+                    if settled:
+                        dir_mtimes[category] = mtime
+            except Exception as e:
+                print(f"⚠️ Data dir watcher error: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="ingest-watch", daemon=True).start()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import time
+from backend.config import DATA_DIR, INDEX_DIR, MANIFEST_PATH, MANIFEST_VERIFY_CHECKSUMS
+
+# Bump when the layout below (or how indexes are built from it) changes
+MANIFEST_VERSION = 1
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+# Files produced by an index build; recorded with size/mtime/sha256.
+# The JSON is only needed for the next build, serving reads the other three.
+SERVING_FILES = ("faiss_image.index", "faiss_sketch.index", "metadata.npy")
+INDEX_FILES = SERVING_FILES + ("metadata_with_captions.json",)
+
+
+def model_ids():
+    """Models whose output is baked into the indexes (a change means re-embedding)."""
+    from backend.models.clip import MODEL_ID
+    from backend.utils.captioning import BLIP_MODEL_ID
+    return {"clip": MODEL_ID, "caption": BLIP_MODEL_ID}
+
+
+def _sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def directory_entry(cat_path, files=None):
+    """
+    mtime, image count and a content hash (names + bytes) of one category directory.
+    `files` (image id -> [size, mtime_ns, sha256], the manifest's "files") is read
+    so unchanged images aren't hashed again, and updated with this scan's stamps.
+    """
+    files = {} if files is None else files
+    names = sorted(n for n in os.listdir(cat_path) if n.lower().endswith(IMAGE_EXTS))
+    h = hashlib.sha256()
+    for name in names:
+        path = os.path.join(cat_path, name)
+        stamp, old = file_stamp(path), files.get(name)
+        digest = old[2] if old is not None and len(old) == 3 and old[:2] == stamp else _sha256(path)
+        files[name] = stamp + [digest]
+        h.update(name.encode("utf-8"))
+        h.update(digest.encode("ascii"))
+    return {"mtime_ns": os.stat(cat_path).st_mtime_ns, "count": len(names), "content_hash": h.hexdigest()}
+
+
+def index_entry(path, checksum=True):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(path) if checksum else None}
+
+
+def scan_directories(data_dir=DATA_DIR, files=None):
+    """{category: directory_entry}; fills `files` with the stamps of every image seen."""
+    directories = {}
+    for category in sorted(os.listdir(data_dir)):
+        cat_path = os.path.join(data_dir, category)
+        if os.path.isdir(cat_path):
+            directories[category] = directory_entry(cat_path, files)
+    return directories
+
+
+def build_manifest(directories, items, data_dir=DATA_DIR, index_dir=INDEX_DIR, files=None):
+    """Call after the index files are written, their size/mtime are part of it."""
+    return {
+        "version": MANIFEST_VERSION,
+        "built_at": time.time(),
+        "data_dir": data_dir,
+        "data_dir_mtime_ns": os.stat(data_dir).st_mtime_ns,
+        "items": items,
+        "models": model_ids(),
+        "directories": directories,
+        "files": files or {},
+        "indexes": {name: index_entry(os.path.join(index_dir, name))
+                    for name in INDEX_FILES if os.path.exists(os.path.join(index_dir, name))},
+    }
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def check_manifest(manifest, data_dir=DATA_DIR, index_dir=INDEX_DIR, verify_checksums=MANIFEST_VERIFY_CHECKSUMS):
+    """
+    Returns None if the indexes on disk still describe the catalogue, otherwise
+    the reason they don't. Only stats DATA_DIR, each category directory and the
+    index files, so it's O(directories) no matter how many images there are.
+    Adding, removing or renaming an image bumps its directory's mtime; editing
+    an image in place doesn't, use FORCE_REINDEX=1 for that.
+    """
+    if manifest is None:
+        return "no manifest"
+    if manifest.get("version") != MANIFEST_VERSION:
+        return "manifest version changed"
+    if manifest.get("data_dir") != data_dir:
+        return "data dir moved"
+    if manifest.get("models") != model_ids():
+        return "model ids changed"
+    try:
+        if os.stat(data_dir).st_mtime_ns != manifest["data_dir_mtime_ns"]:
+            return "category added or removed"
+        for category, entry in manifest["directories"].items():
+            if os.stat(os.path.join(data_dir, category)).st_mtime_ns != entry["mtime_ns"]:
+                return f"'{category}' changed"
+    except OSError as e:
+        return f"catalogue missing ({e})"
+
+    for name in SERVING_FILES:
+        entry = manifest["indexes"].get(name)
+        path = os.path.join(index_dir, name)
+        if entry is None or not os.path.exists(path):
+            return f"{name} missing"
+        st = os.stat(path)
+        if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+            return f"{name} modified"
+        # No checksum after an ingest refresh (too slow per batch); the next full build records it
+        if verify_checksums and entry.get("sha256") and _sha256(path) != entry["sha256"]:
+            return f"{name} checksum mismatch"
+    return None
+
+
+def refresh_manifest(categories, known_ids, items, data_dir=DATA_DIR, index_dir=INDEX_DIR):
+    """
+    Updates the manifest after items were added to the live index without a full
+    build (ingestion), so the next startup can still skip the scan. A category is
+    only re-stamped if every image in it is indexed; otherwise it stays stale and
+    the next boot rescans it. Runs per ingest batch, so it only hashes the new
+    images, and records size/mtime (no checksum) for the index files.
+    """
+    manifest = load_manifest()
+    if manifest is None or manifest.get("models") != model_ids():
+        return False
+    files = manifest.setdefault("files", {})
+    for category in categories:
+        cat_path = os.path.join(data_dir, category)
+        names = {n for n in os.listdir(cat_path) if n.lower().endswith(IMAGE_EXTS)}
+        if names <= known_ids:
+            manifest["directories"][category] = directory_entry(cat_path, files)
+    on_disk = {c for c in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, c))}
+    if on_disk <= set(manifest["directories"]):
+        manifest["data_dir_mtime_ns"] = os.stat(data_dir).st_mtime_ns
+    manifest["items"] = items
+    manifest["indexes"] = {name: index_entry(os.path.join(index_dir, name), checksum=False)
+                           for name in INDEX_FILES if os.path.exists(os.path.join(index_dir, name))}
+    save_manifest(manifest)
+    return True
@@ -0,0 +1,151 @@
+import os
+import faiss
+import numpy as np
+from backend.config import INDEX_DIR, NEIGHBORS_K
+
+# Item-to-item similarity graph for "more like this". Every item's top-K neighbours
+# in photo and sketch space are computed when the index is built (exact batched kNN
+# over the flat index), so /similar/{item_id} is a row lookup with no model involved.
+# Stored per space as two .npy files next to the indexes: N x K int32 rows (-1 = no
+# neighbour) and N x K float16 cosine scores, ~6 bytes per edge. Live ingestion
+# extends the graph instead of recomputing it (see extend()).
+
+SPACES = ("photo", "sketch")
+BATCH = 1024 # Query rows per faiss search while building
+
+
+def paths(space, index_dir=INDEX_DIR):
+    base = os.path.join(index_dir, f"neighbors_{space}")
+    return base + "_ids.npy", base + "_scores.npy"
+
+
+class NeighborGraph:
+    """{space: (ids, scores)} for one bundle's rows; immutable like the bundle it belongs to."""
+
+    def __init__(self, spaces, item_ids):
+        self.spaces = spaces
+        self.row_of = {item_id: row for row, item_id in enumerate(item_ids)}
+
+    def neighbors(self, item_id, space="photo", k=NEIGHBORS_K):
+        """[(row, score), ...] best first; None if the item (or the space) isn't in the graph."""
+        row = self.row_of.get(item_id)
+        if row is None or space not in self.spaces:
+            return None
+        ids, scores = self.spaces[space]
+        return [(int(i), float(s)) for i, s in zip(ids[row, :k], scores[row, :k]) if i >= 0]
+
+    def info(self):
+        return {space: {"items": len(ids), "k": ids.shape[1]} for space, (ids, _) in self.spaces.items()}
+
+
+def vectors_of(index):
+    """All vectors of a flat faiss index (None for sharded/remote indexes, which can't hand them out)."""
+    if index is None or not hasattr(index, "reconstruct_n"):
+        return None
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _top_k_excluding_self(index, queries, first_row, k):
+    """Top-k of `queries` (rows first_row.. of `index`) against `index`, each row's own entry dropped."""
+    n = len(queries)
+    kk = min(k + 1, index.ntotal)
+    scores, ids = index.search(queries, kk)
+    keep = ids != np.arange(first_row, first_row + n)[:, None]
+    # Exact duplicates can tie self out of the list: drop the last column instead
+    keep[keep.all(axis=1), -1] = False
+    ids = ids[keep].reshape(n, kk - 1)
+    scores = scores[keep].reshape(n, kk - 1)
+    out_ids = np.full((n, k), -1, dtype=np.int32)
+    out_scores = np.zeros((n, k), dtype=np.float16)
+    out_ids[:, :kk - 1] = ids
+    out_scores[:, :kk - 1] = scores
+    return out_ids, out_scores
+
+
+def knn(vectors, k=NEIGHBORS_K):
+    """Exact top-k neighbours of every row (L2-normalized float32), in BATCH-row searches."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n = len(vectors)
+    if n < 2:
+        return np.full((n, k), -1, dtype=np.int32), np.zeros((n, k), dtype=np.float16)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    parts = [_top_k_excluding_self(index, vectors[lo:lo + BATCH], lo, k) for lo in range(0, n, BATCH)]
+    return np.vstack([p[0] for p in parts]), np.vstack([p[1] for p in parts])
+
+
+def build_graph(item_ids, photo=None, sketch=None, k=NEIGHBORS_K):
+    """Graph from each space's full vector matrix; spaces passed as None are left out."""
+    spaces = {}
+    for space, vectors in (("photo", photo), ("sketch", sketch)):
+        if vectors is not None and len(vectors) == len(item_ids):
+            spaces[space] = knn(vectors, k)
+    return NeighborGraph(spaces, item_ids) if spaces else None
+
+
+def _merge_new(ids, scores, old_vectors, new_vectors):
+    """Old rows' neighbour lists with the new items (rows len(old)..) merged in where they rank."""
+    n_old, k = ids.shape
+    new_rows = np.arange(n_old, n_old + len(new_vectors), dtype=np.int32)
+    out_ids, out_scores = np.empty_like(ids), np.empty_like(scores)
+    for lo in range(0, n_old, BATCH):
+        hi = min(lo + BATCH, n_old)
+        sims = old_vectors[lo:hi] @ new_vectors.T
+        cand_ids = np.hstack([ids[lo:hi], np.broadcast_to(new_rows, sims.shape)])
+        cand_scores = np.hstack([scores[lo:hi].astype(np.float32), sims])
+        cand_scores[cand_ids < 0] = -np.inf
+        best = np.argsort(-cand_scores, axis=1, kind="stable")[:, :k]
+        out_ids[lo:hi] = np.take_along_axis(cand_ids, best, axis=1)
+        out_scores[lo:hi] = np.take_along_axis(cand_scores, best, axis=1)
+    out_ids[out_scores == -np.inf] = -1 # Rows that had fewer than k neighbours
+    out_scores[out_ids < 0] = 0
+    return out_ids, out_scores
+
+
+def extend(graph, item_ids, old_vectors, new_vectors):
+    """
+    Graph for old + new items without an all-pairs rebuild: each new row gets its
+    exact top-k over everything, and each old row takes in any new item that beats
+    its current k-th neighbour (one (N x m) product per space). `old_vectors` /
+    `new_vectors` are {space: matrix}; spaces the old graph lacks are built in full.
+    """
+    spaces = {}
+    for space in SPACES:
+        old, new = old_vectors.get(space), new_vectors.get(space)
+        if old is None or new is None:
+            continue
+        everything = np.vstack([old, new]).astype("float32")
+        if graph is None or space not in graph.spaces or len(graph.spaces[space][0]) != len(old):
+            spaces[space] = knn(everything)
+            continue
+        ids, scores = graph.spaces[space]
+        index = faiss.IndexFlatIP(everything.shape[1])
+        index.add(everything)
+        new_ids, new_scores = _top_k_excluding_self(index, np.ascontiguousarray(new, dtype="float32"),
+                                                    len(old), ids.shape[1])
+        merged_ids, merged_scores = _merge_new(ids, scores, old, new)
+        spaces[space] = (np.vstack([merged_ids, new_ids]), np.vstack([merged_scores, new_scores]))
+    return NeighborGraph(spaces, item_ids) if spaces else None
+
+
+def save(graph, index_dir=INDEX_DIR):
+    for space, arrays in graph.spaces.items():
+        for path, arr in zip(paths(space, index_dir), arrays):
+            tmp = path[:-len(".npy")] + ".tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, path)
+
+
+def load(item_ids, metadata_path, index_dir=INDEX_DIR):
+    """The persisted graph if it matches the metadata (same row count, written after it), else None."""
+    spaces = {}
+    for space in SPACES:
+        id_path, score_path = paths(space, index_dir)
+        if not (os.path.exists(id_path) and os.path.exists(score_path)):
+            continue
+        if min(os.path.getmtime(id_path), os.path.getmtime(score_path)) < os.path.getmtime(metadata_path):
+            continue # Written for an older index
+        ids, scores = np.load(id_path), np.load(score_path)
+        if len(ids) == len(item_ids) and ids.shape == scores.shape:
+            spaces[space] = (ids, scores)
+    return NeighborGraph(spaces, item_ids) if spaces else None
@@ -0,0 +1,197 @@
+"""
+Sharded index builds for large catalogues.
+
+    python -m backend.search.sharded_build build --shards 8 --workers 4   # all local
+    python -m backend.search.sharded_build shard --shard 3 --shards 8     # one shard (any machine)
+    python -m backend.search.sharded_build merge --shards 8               # after every shard is done
+
+Items are assigned to shards by sha1(image id) % N, so every machine pointed at
+the same DATA_DIR / INDEX_DIR agrees on the split without talking to the others.
+Each shard writes its own vectors (photo, sketch, caption) and metadata to
+INDEX_DIR/shards/; the merge orders items by (category, id), checks the shards
+are complete and consistent, and writes the usual index files + manifest.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config import SHARD_DIR, DATA_DIR
+
+
+def shard_of(item_id, num_shards):
+    # sha1 rather than hash(): stable across processes, machines and PYTHONHASHSEED
+    return int(hashlib.sha1(item_id.encode("utf-8")).hexdigest(), 16) % num_shards
+
+
+def shard_paths(shard, num_shards, shard_dir=SHARD_DIR):
+    stem = os.path.join(shard_dir, f"shard-{shard:03d}-of-{num_shards:03d}")
+    return stem + ".npz", stem + ".json"
+
+
+def build_shard(shard, num_shards, shard_dir=SHARD_DIR):
+    """Captions (if needed) and embeds one shard's items into shard_dir."""
+    from backend.search import index_builder
+    from backend.search.manifest import model_ids, load_manifest
+    from backend.models.clip import get_text_embedding
+    from backend.utils.thumbnails import generate_thumbnails
+
+    t0 = time.perf_counter()
+    existing = index_builder.load_existing_meta()
+    meta = index_builder.scan_catalogue(existing, only=lambda item_id: shard_of(item_id, num_shards) == shard,
+                                        stamps=(load_manifest() or {}).get("files"))
+    meta_list = [meta[k] for k in sorted(meta)]
+    print(f"🧩 Shard {shard}/{num_shards}: {len(meta_list)} items")
+
+    generate_thumbnails(meta_list)
+    photo = index_builder.embed_photos(meta_list)
+    sketch = index_builder.embed_sketches(meta_list)
+    captions = [m['caption'] if m['caption'].strip() else " " for m in meta_list]
+    caption = [get_text_embedding(captions[i:i+index_builder.BATCH_SIZE])
+               for i in range(0, len(captions), index_builder.BATCH_SIZE)]
+    caption = index_builder.stack_normalized(caption)
+
+    os.makedirs(shard_dir, exist_ok=True)
+    npz_path, json_path = shard_paths(shard, num_shards, shard_dir)
+    # Vectors first, JSON last: the JSON's presence is what marks the shard as finished
+    tmp = npz_path[:-len(".npz")] + ".tmp.npz"
+    np.savez(tmp, photo=photo, sketch=sketch, caption=caption)
+    os.replace(tmp, npz_path)
+    info = {
+        "shard": shard,
+        "num_shards": num_shards,
+        "count": len(meta_list),
+        "models": model_ids(),
+        "built_at": time.time(),
+        "seconds": round(time.perf_counter() - t0, 1),
+        "metadata": meta_list,
+    }
+    with open(json_path + ".tmp", "w") as f:
+        json.dump(info, f)
+    os.replace(json_path + ".tmp", json_path)
+    print(f"✅ Shard {shard}/{num_shards} written ({len(meta_list)} items, {info['seconds']}s)")
+    return info
+
+
+def load_shard(shard, num_shards, shard_dir=SHARD_DIR):
+    """(info, {"photo", "sketch", "caption"}) of a finished shard; raises if missing or inconsistent."""
+    npz_path, json_path = shard_paths(shard, num_shards, shard_dir)
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"Shard {shard}/{num_shards} not built ({json_path})")
+    with open(json_path) as f:
+        info = json.load(f)
+    with np.load(npz_path) as npz:
+        arrays = {k: npz[k] for k in ("photo", "sketch", "caption")}
+    n = len(info["metadata"])
+    if info["count"] != n or any(len(a) != n for a in arrays.values()):
+        raise ValueError(f"Shard {shard}: {n} metadata rows but "
+                         f"{ {k: len(a) for k, a in arrays.items()} } vectors")
+    wrong = [m['id'] for m in info["metadata"] if shard_of(m['id'], num_shards) != shard]
+    if wrong:
+        raise ValueError(f"Shard {shard}: {len(wrong)} items belong to other shards (e.g. {wrong[0]})")
+    return info, arrays
+
+
+def merge(num_shards, shard_dir=SHARD_DIR, verify_catalogue=True):
+    """Combines every shard into the serving index files, in a deterministic order."""
+    from backend.search import index_builder
+    from backend.search import manifest as manifest_mod
+    from backend.search import neighbors
+    from backend.search.index_store import IndexBundle, save_bundle
+
+    shards = [load_shard(i, num_shards, shard_dir) for i in range(num_shards)]
+    models = {json.dumps(info["models"], sort_keys=True) for info, _ in shards}
+    if len(models) != 1:
+        raise ValueError(f"Shards were built with different models: {models}")
+
+    rows = [] # (category, id, shard, row)
+    for s, (info, _) in enumerate(shards):
+        rows.extend((m['category'], m['id'], s, r) for r, m in enumerate(info["metadata"]))
+    rows.sort()
+    ids = [r[1] for r in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate item ids across shards")
+
+    expected = sum(info["count"] for info, _ in shards)
+    if verify_catalogue:
+        on_disk = len(index_builder.list_catalogue())
+        if on_disk != expected:
+            raise ValueError(f"Shards hold {expected} items but DATA_DIR has {on_disk}; rebuild the stale shards")
+
+    # Concatenate in shard order, then one fancy-index gather into (category, id) order
+    offsets = np.cumsum([0] + [info["count"] for info, _ in shards])
+    order = np.array([offsets[s] + r for _, _, s, r in rows], dtype=np.int64)
+
+    def gather(key):
+        return np.concatenate([arrays[key] for _, arrays in shards]).astype("float32")[order]
+
+    metadata = [shards[s][0]["metadata"][r] for _, _, s, r in rows]
+    photo, sketch, caption = gather("photo"), gather("sketch"), gather("caption")
+    assert len(photo) == len(sketch) == len(caption) == len(metadata) == expected
+
+    graph = neighbors.build_graph([m['id'] for m in metadata], photo, sketch)
+    bundle = IndexBundle(index_builder.flat_index(photo), index_builder.flat_index(sketch), caption, metadata,
+                         neighbors=graph)
+    save_bundle(bundle)
+    with open(index_builder.METADATA_JSON + ".tmp", "w") as f:
+        json.dump({m['id']: m for m in metadata}, f, indent=4)
+    os.replace(index_builder.METADATA_JSON + ".tmp", index_builder.METADATA_JSON)
+    files = dict((manifest_mod.load_manifest() or {}).get("files") or {})
+    directories = manifest_mod.scan_directories(files=files)
+    ids = {m['id'] for m in metadata}
+    manifest_mod.save_manifest(manifest_mod.build_manifest(directories, len(metadata),
+                                                           files={k: v for k, v in files.items() if k in ids}))
+    print(f"🧬 Merged {num_shards} shards: {len(metadata)} items")
+    return bundle
+
+
+def _worker(args):
+    shard, num_shards, threads = args
+    import torch
+    torch.set_num_threads(threads)
+    build_shard(shard, num_shards)
+    return shard
+
+
+def build_all(num_shards, workers):
+    """Builds every shard in `workers` local processes, then merges."""
+    import multiprocessing as mp
+    threads = max(1, (os.cpu_count() or 2) // workers)
+    # spawn: a forked torch/OpenMP runtime can deadlock
+    with mp.get_context("spawn").Pool(workers) as pool:
+        for shard in pool.imap_unordered(_worker, [(i, num_shards, threads) for i in range(num_shards)]):
+            print(f"🧩 Shard {shard} done")
+    return merge(num_shards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build", help="Build every shard locally, then merge")
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    p = sub.add_parser("shard", help="Build one shard")
+    p.add_argument("--shard", type=int, required=True)
+    p.add_argument("--shards", type=int, required=True)
+    p = sub.add_parser("merge", help="Merge finished shards into the serving index")
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--no-verify-catalogue", action="store_true", help=f"Don't compare the item count with {DATA_DIR}")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build_all(args.shards, args.workers)
+    elif args.cmd == "shard":
+        if not 0 <= args.shard < args.shards:
+            parser.error("--shard must be in [0, --shards)")
+        build_shard(args.shard, args.shards)
+    else:
+        merge(args.shards, verify_catalogue=not args.no_verify_catalogue)
+
+
+if __name__ == "__main__":
+    main()
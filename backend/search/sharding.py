@@ -0,0 +1,294 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from backend.config import SEARCH_SHARDS, SHARD_DIR, SHARD_THREADS
+from backend.utils import metrics
+from backend.utils.tracing import span
+
+# Scatter-gather search. A ShardedIndex looks like a faiss index to the search
+# code (.ntotal, .search(q, k) -> global rows), so search_by_text/_image/_sketch,
+# caption fusion and the single rerank pass run unchanged on top of it.
+#
+#   SHARDED_SEARCH=local    contiguous slices of the loaded bundle, searched in threads
+#   SHARDED_SEARCH=process  one worker process per shard from sharded_build (RPC over
+#                           multiprocessing.connection); the API process holds no vectors
+
+SPACES = ("photo", "sketch", "caption")
+
+
+def _flat(vectors):
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    return index
+
+
+class LocalShard:
+    """One slice of every space, searched in this process."""
+
+    def __init__(self, vectors_by_space):
+        self.indexes = {space: _flat(v) for space, v in vectors_by_space.items()}
+
+    def ntotal(self, space):
+        return self.indexes[space].ntotal
+
+    def search(self, space, q, k):
+        index = self.indexes[space]
+        return index.search(q, min(k, index.ntotal))
+
+    def score(self, space, q, rows):
+        vectors = self.indexes[space].reconstruct_batch(np.asarray(rows, dtype="int64"))
+        return vectors @ q.reshape(-1)
+
+    def close(self):
+        pass
+
+
+class RemoteShard:
+    """Client for a shard worker process; a small pool of connections so concurrent requests don't queue."""
+
+    def __init__(self, address, authkey, ntotals, pool_size=4):
+        self.address = address
+        self.authkey = authkey
+        self._ntotals = ntotals
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pool_size = pool_size
+
+    def _call(self, *request):
+        from multiprocessing.connection import Client
+        with self._pool_lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send(request)
+            ok, result = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        with self._pool_lock:
+            if len(self._pool) < self._pool_size:
+                self._pool.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        if not ok:
+            raise RuntimeError(f"Shard {self.address}: {result}")
+        return result
+
+    def ntotal(self, space):
+        return self._ntotals[space]
+
+    def search(self, space, q, k):
+        return self._call("search", space, q, k)
+
+    def score(self, space, q, rows):
+        return self._call("score", space, q, rows)
+
+    def close(self):
+        with self._pool_lock:
+            for conn in self._pool:
+                conn.close()
+            self._pool = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(2, SEARCH_SHARDS * 2), thread_name_prefix="shard-search")
+        return _pool
+
+
+class ShardedIndex:
+    """
+    Fans a query out to every shard, maps each shard's local rows to global rows
+    and merges the per-shard top-k by score. Duck-types the bits of the faiss
+    index API that search uses.
+    """
+
+    def __init__(self, space, shards, global_ids):
+        self.space = space
+        self.shards = shards
+        self.global_ids = global_ids # per shard: local row -> global row
+        self.ntotal = sum(len(g) for g in global_ids)
+        # global row -> (shard, local row), for score()
+        self._owner = np.empty(self.ntotal, dtype=np.int32)
+        self._local = np.empty(self.ntotal, dtype=np.int64)
+        for s, g in enumerate(global_ids):
+            self._owner[g] = s
+            self._local[g] = np.arange(len(g))
+
+    def _search_one(self, s, q, k):
+        if self.shards[s].ntotal(self.space) == 0:
+            return np.zeros((len(q), 0), dtype="float32"), np.zeros((len(q), 0), dtype="int64")
+        t0 = time.perf_counter()
+        with span(f"shard_search.{self.space}", shard=s):
+            scores, rows = self.shards[s].search(self.space, q, k)
+        metrics.histogram("shard_search_seconds", "Latency of one shard's part of a scatter-gather search",
+                          space=self.space, shard=str(s)).observe(time.perf_counter() - t0)
+        gids = np.where(rows >= 0, self.global_ids[s][np.clip(rows, 0, None)], -1)
+        return scores, gids
+
+    def _fan_out(self, fn, args_per_shard):
+        pool = _executor()
+        # copy_context per task: spans recorded in the pool threads still land on the request's trace
+        futures = [pool.submit(contextvars.copy_context().run, fn, s, *args) for s, args in args_per_shard]
+        return [f.result() for f in futures]
+
+    def search(self, q, k):
+        q = np.ascontiguousarray(q, dtype="float32").reshape(-1, q.shape[-1])
+        parts = self._fan_out(self._search_one, [(s, (q, k)) for s in range(len(self.shards))])
+        scores = np.concatenate([p[0] for p in parts], axis=1)
+        gids = np.concatenate([p[1] for p in parts], axis=1)
+        scores = np.where(gids >= 0, scores, -np.inf)
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        out_scores = np.take_along_axis(scores, top, axis=1)
+        out_ids = np.take_along_axis(gids, top, axis=1)
+        if out_ids.shape[1] < k: # fewer vectors than k overall, pad like faiss does
+            pad = k - out_ids.shape[1]
+            out_scores = np.pad(out_scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+            out_ids = np.pad(out_ids, ((0, 0), (0, pad)), constant_values=-1)
+        return out_scores.astype("float32"), out_ids.astype("int64")
+
+    def score(self, q, rows):
+        """Inner products of q with the given global rows (used for caption fusion)."""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        out = np.zeros(len(rows), dtype="float32")
+        if not len(rows):
+            return out
+        owners = self._owner[rows]
+        todo = [(s, (np.nonzero(owners == s)[0],)) for s in np.unique(owners)]
+
+        def one(s, positions):
+            return positions, self.shards[s].score(self.space, q, self._local[rows[positions]])
+
+        for positions, values in self._fan_out(one, todo):
+            out[positions] = values
+        return out
+
+    def __len__(self):
+        return self.ntotal
+
+
+def split_bundle(bundle, num_shards):
+    """SHARDED_SEARCH=local: the loaded bundle cut into contiguous in-process shards."""
+    from backend.search.index_store import IndexBundle
+    vectors = {
+        "photo": bundle.index.reconstruct_n(0, bundle.index.ntotal),
+        "sketch": bundle.sketch_index.reconstruct_n(0, bundle.sketch_index.ntotal)
+                  if bundle.sketch_index is not None else None,
+        "caption": bundle.caption_embeddings,
+    }
+    spaces = [s for s in SPACES if vectors[s] is not None]
+    bounds = np.linspace(0, len(bundle.metadata), num_shards + 1).astype(int)
+    shards, global_ids = [], []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        shards.append(LocalShard({s: vectors[s][lo:hi] for s in spaces}))
+        global_ids.append(np.arange(lo, hi, dtype=np.int64))
+    print(f"🧩 Serving {len(bundle.metadata)} items from {num_shards} in-process shards")
+    index = {s: ShardedIndex(s, shards, global_ids) for s in spaces}
+    return IndexBundle(index["photo"], index.get("sketch"), index["caption"], bundle.metadata,
+                       source=f"sharded:local:{num_shards}", neighbors=bundle.neighbors)
+
+
+# --- Worker processes ---
+
+def serve_shard(shard, num_shards, authkey, ready, threads=SHARD_THREADS, shard_dir=SHARD_DIR):
+    """Worker process main: loads one sharded_build shard and answers search/score calls."""
+    from multiprocessing.connection import Listener
+    from backend.search.sharded_build import load_shard
+
+    faiss.omp_set_num_threads(threads)
+    info, arrays = load_shard(shard, num_shards, shard_dir)
+    local = LocalShard(arrays)
+    del arrays
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    ready.send((listener.address, {s: local.ntotal(s) for s in SPACES}, [m['id'] for m in info["metadata"]]))
+    ready.close()
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    op, space, *args = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send((True, getattr(local, op)(space, *args)))
+                except Exception as e:
+                    conn.send((False, str(e)))
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class ShardWorkers:
+    """The worker processes behind one SHARDED_SEARCH=process bundle."""
+
+    def __init__(self, processes, shards):
+        self.processes = processes
+        self.shards = shards
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        for p in self.processes:
+            p.terminate()
+        for p in self.processes:
+            p.join(timeout=5)
+
+
+def start_process_bundle(num_shards, shard_dir=SHARD_DIR):
+    """
+    SHARDED_SEARCH=process: spawns one worker per shard file and returns a bundle whose
+    indexes are RPC fan-outs. Only metadata lives in the API process. The shards must be
+    the ones the serving index was merged from (python -m backend.search.sharded_build).
+    """
+    import multiprocessing as mp
+    from backend.search import index_store
+
+    metadata = np.load(index_store.METADATA_PATH, allow_pickle=True).tolist()
+    row_of = {m['id']: i for i, m in enumerate(metadata)}
+    ctx = mp.get_context("spawn")
+    authkey = os.urandom(16)
+    processes, pipes = [], []
+    for s in range(num_shards):
+        parent, child = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=serve_shard, args=(s, num_shards, authkey, child, SHARD_THREADS, shard_dir),
+                        name=f"shard-{s}", daemon=True)
+        p.start()
+        processes.append(p)
+        pipes.append(parent)
+
+    shards, global_ids = [], []
+    try:
+        for s, pipe in enumerate(pipes):
+            if not pipe.poll(600):
+                raise TimeoutError(f"Shard worker {s} didn't start")
+            address, ntotals, ids = pipe.recv()
+            missing = [i for i in ids if i not in row_of]
+            if missing:
+                raise ValueError(f"Shard {s} has items not in the serving metadata (e.g. {missing[0]}); re-run the merge")
+            shards.append(RemoteShard(address, authkey, ntotals))
+            global_ids.append(np.array([row_of[i] for i in ids], dtype=np.int64))
+        if sum(len(g) for g in global_ids) != len(metadata):
+            raise ValueError(f"Shards hold {sum(len(g) for g in global_ids)} items, metadata has {len(metadata)}")
+    except Exception:
+        ShardWorkers(processes, shards).close()
+        raise
+
+    print(f"🧩 Serving {len(metadata)} items from {num_shards} shard worker processes")
+    index = {space: ShardedIndex(space, shards, global_ids) for space in SPACES}
+    bundle = index_store.IndexBundle(index["photo"], index["sketch"], index["caption"], metadata,
+                                     source=f"sharded:process:{num_shards}")
+    return bundle, ShardWorkers(processes, shards)
@@ -1,50 +1,111 @@
-import os
 import faiss
 import numpy as np
-from PIL import Image
-from backend.config import INDEX_DIR, TOP_K
+from backend.config import TOP_K
 from backend.models.clip import get_image_embedding
 from backend.utils.sketch_utils import preprocess_sketch
-from backend.search import image_search 
-from backend.utils.captioning import describe_sketch
+from backend.search import image_search, index_store
+from backend.utils.captioning import describe_sketch, SKETCH_FALLBACK
 from backend.utils.reranker import rerank_results  # <--- NEW IMPORT
+from backend.utils.query_cache import sketch_embedding_cache, sketch_interpretation_cache, phash
+from backend.utils.metrics import timed
+from backend.utils.tracing import span, annotate
+from backend.utils import deadline
+from backend.config import DEADLINE_STAGE_S
 
-SKETCH_INDEX_PATH = os.path.join(INDEX_DIR, "faiss_sketch.index")
+def load_sketch_index(meta=None):
+    """The sketch index is part of the bundle image_search.load_index() makes live; kept for old callers."""
+    if index_store.current() is None:
+        image_search.load_index()
 
-sketch_index = None
-metadata = []
+def __getattr__(name):
+    # Old module globals (sketch_search.sketch_index / .metadata) read from the live bundle
+    if name in ("sketch_index", "metadata"):
+        bundle = index_store.current()
+        if bundle is None:
+            return [] if name == "metadata" else None
+        return getattr(bundle, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def load_sketch_index(meta):
-    global sketch_index, metadata
-    metadata = meta
-    if os.path.exists(SKETCH_INDEX_PATH):
-        sketch_index = faiss.read_index(SKETCH_INDEX_PATH)
-        print(f"✅ Sketch Index Loaded: {sketch_index.ntotal} items")
+def prepare_sketch(sketch):
+    """Cleaned 224x224 line drawing + its perceptual hash (near-identical sketches share cache entries)."""
+    with timed("sketch_preprocess"):
+        processed = preprocess_sketch(sketch)
+    if processed is None:
+        raise ValueError("Could not read sketch image")
+    return processed, phash(processed)
 
-def search_by_sketch(sketch_path, top_k=TOP_K):
+def shape_candidates(bundle, processed, sketch_key, k=50):
+    """CLIP embedding of the sketch (cached by phash) against sketch_index: (scores, indices), one row."""
+    if bundle is None or bundle.sketch_index is None: # Not loaded yet / built without sketches: no shape matches
+        return np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+    visual_emb = sketch_embedding_cache.get(sketch_key)
+    if visual_emb is None:
+        visual_emb = get_image_embedding(processed).astype("float32")
+        faiss.normalize_L2(visual_emb.reshape(1, -1))
+        sketch_embedding_cache.put(sketch_key, visual_emb)
+    with timed("faiss_search"):
+        return bundle.sketch_index.search(visual_emb.reshape(1, -1), k)
+
+@span("sketch_search.shape_search")
+def shape_search(sketch, top_k=TOP_K):
+    """
+    The cheap half of search_by_sketch, for live drawing: shape matches only, no LLM
+    or rerank. Returns (results sorted by shape score, sketch_key).
+    """
+    bundle = index_store.current()
+    if bundle is None: return [], None
+    processed, sketch_key = prepare_sketch(sketch)
+    v_scores, v_indices = shape_candidates(bundle, processed, sketch_key, k=top_k)
+    results = []
+    for score, idx in zip(v_scores[0], v_indices[0]):
+        if 0 <= idx < len(bundle.metadata):
+            item = bundle.metadata[idx].copy()
+            item['score'] = item['shape_score'] = float(score)
+            item['debug'] = f"Shape: {score:.2f}"
+            results.append(item)
+    return results, sketch_key
+
+@span("sketch_search.search_by_sketch")
+def search_by_sketch(sketch, top_k=TOP_K):
+    """`sketch` is a file path, PIL image or uint8 array (see preprocess_sketch)."""
+    bundle = index_store.current()
+    if bundle is None: return [], ""
     # 1. Preprocess
-    processed_sketch_pil = preprocess_sketch(sketch_path)
+    # Hash the cleaned 224x224 line drawing so near-identical resubmissions match
+    processed_sketch_pil, sketch_key = prepare_sketch(sketch)
     
     # 2. Generate Description (The "Query")
-    # 2. Generate Description (The "Query")
-    llm_response = describe_sketch(processed_sketch_pil)
+    # Whatever follows the LLM (text search, rerank) has to fit after it
+    after_llm = DEADLINE_STAGE_S.get("rerank", 0.0) * 2
+    llm_response = sketch_interpretation_cache.get(sketch_key)
+    annotate(interpretation_cached=llm_response is not None)
+    if llm_response is None:
+        # None back means the deadline had no room for the LLM (the on-disk cache is still checked)
+        llm_response = describe_sketch(processed_sketch_pil, reserve=after_llm)
+        if llm_response is not None and llm_response != SKETCH_FALLBACK: # Don't pin a failed LLM call
+            sketch_interpretation_cache.put(sketch_key, llm_response)
+    else:
+        print("🎨 Sketch interpretation cache hit")
     print(f"🎨 AI Raw Response: '{llm_response}'")
     
     import json
-    try:
-        data = json.loads(llm_response)
-        search_query = data.get("description", "jewellery sketch")
-        strict_type = data.get("type", "").lower() # "ring" or "necklace"
-    except:
-        print("⚠️ Failed to parse Sketch LLM JSON. Fallback to raw.")
-        search_query = llm_response
-        strict_type = ""
+    if llm_response is None: # No time for the LLM: visual (shape) matches only
+        search_query, strict_type = SKETCH_FALLBACK, ""
+    else:
+        try:
+            data = json.loads(llm_response)
+            search_query = data.get("description", "jewellery sketch")
+            strict_type = data.get("type", "").lower() # "ring" or "necklace"
+        except:
+            print("⚠️ Failed to parse Sketch LLM JSON. Fallback to raw.")
+            search_query = llm_response
+            strict_type = ""
 
     print(f"🎨 Parsed: Query='{search_query}' | Type='{strict_type}'")
     
     # 3. Get Candidates (Text Search)
     # We fetch 50 candidates to allow for reranking
-    text_results = image_search.search_by_text(search_query, top_k=50)
+    text_results = image_search.search_by_text(search_query, top_k=50) if llm_response is not None else []
     
     # STRICT FILTERING based on LLM decision
     if strict_type in ["ring", "necklace"]:
@@ -52,9 +113,7 @@ def search_by_sketch(sketch_path, top_k=TOP_K):
         text_results = [r for r in text_results if r['category'].lower() == strict_type]
     
     # 4. Get Candidates (Visual Shape Search)
-    visual_emb = get_image_embedding(processed_sketch_pil).astype("float32")
-    faiss.normalize_L2(visual_emb.reshape(1, -1))
-    v_scores, v_indices = sketch_index.search(visual_emb.reshape(1, -1), 50)
+    v_scores, v_indices = shape_candidates(bundle, processed_sketch_pil, sketch_key)
     
     # 5. Hybrid Fusion (Merge lists)
     candidates = {}
@@ -67,8 +126,8 @@ def search_by_sketch(sketch_path, top_k=TOP_K):
 
     # Add Shape Matches
     for score, idx in zip(v_scores[0], v_indices[0]):
-        if idx < len(metadata):
-            item = metadata[idx]
+        if idx < len(bundle.metadata):
+            item = bundle.metadata[idx]
             if item['id'] not in candidates:
                 item_copy = item.copy()
                 item_copy['debug'] = f"Shape: {score:.2f}"
@@ -77,11 +136,20 @@ def search_by_sketch(sketch_path, top_k=TOP_K):
                 if 'debug' not in candidates[item['id']]:
                     candidates[item['id']]['debug'] = "Text Match"
                 candidates[item['id']]['debug'] += f" | Shape: {score:.2f}"
+            candidates[item['id']]['shape_score'] = float(score)
 
     candidate_list = list(candidates.values())
+    annotate(text_candidates=len(text_results), candidates=len(candidate_list))
 
     # 6. RERANKING
     # Rerank ALL candidates against the sketch description
-    final_results = rerank_results(search_query, candidate_list, top_k=top_k)
+    if llm_response is not None and deadline.allows("rerank"):
+        final_results = rerank_results(search_query, candidate_list, top_k=top_k)
+    else:
+        # Degraded: shape matches by sketch similarity, then text-only matches in their order
+        candidate_list.sort(key=lambda c: -c.get('shape_score', -1.0))
+        for c in candidate_list:
+            c['score'] = c.get('shape_score', c.get('score', 0.0))
+        final_results = candidate_list[:top_k]
     
     return final_results, search_query
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from backend.config import ADMISSION_ENABLED, ADMISSION_MAX_ACTIVE, ADMISSION_LIMITS, ADMISSION_WAIT_S
+from backend.utils import metrics, deadline
+
+# Admission control for the API. Every expensive endpoint runs inside
+# `async with admit(<class>)`: each class has its own concurrency limit, and all
+# classes share ADMISSION_MAX_ACTIVE slots handed out by priority, so cheap visual
+# lookups get the next free slot ahead of queued sketch / OCR / voice requests.
+# Requests that can't get in are rejected fast instead of piling up:
+#   429  the class's wait queue is full
+#   503  waited longer than the class's wait budget (or the request's deadline)
+# Both carry Retry-After. All state is touched from the event loop only (no locks).
+
+# Lower = served first
+PRIORITY = {"visual": 0, "text": 1, "sketch": 2, "ocr": 2, "voice": 2}
+QUEUE_PER_SLOT = 8
+
+
+class Rejected(Exception):
+    def __init__(self, cls, status, reason, retry_after):
+        super().__init__(f"{cls}: {reason}")
+        self.cls = cls
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Class:
+    def __init__(self, name, limit, wait_s):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = self.limit * QUEUE_PER_SLOT
+        self.wait_s = wait_s
+        self.priority = PRIORITY.get(name, 1)
+        self.active = 0
+        self.waiting = 0
+        self.service_s = 1.0 # EWMA of time spent holding a slot, for Retry-After
+        self.rejected = {"queue_full": 0, "wait_timeout": 0}
+
+    def retry_after(self):
+        return max(1, math.ceil(self.service_s * (self.waiting + 1) / self.limit))
+
+    def publish(self):
+        metrics.gauge("admission_active", "Requests holding an admission slot", cls=self.name).set(self.active)
+        metrics.gauge("admission_queue_depth", "Requests waiting for an admission slot", cls=self.name).set(self.waiting)
+
+
+_classes = {name: _Class(name, limit, ADMISSION_WAIT_S.get(name, 5.0)) for name, limit in ADMISSION_LIMITS.items()}
+_active = 0
+_waiters = [] # heap of (priority, seq, class, future)
+_seq = itertools.count()
+
+
+def _get_class(name):
+    if name not in _classes: # Class missing from ADMISSION_LIMITS
+        _classes[name] = _Class(name, 4, ADMISSION_WAIT_S.get(name, 5.0))
+    return _classes[name]
+
+
+def _can_run(c):
+    return c.active < c.limit and _active < ADMISSION_MAX_ACTIVE
+
+
+def _grant(c):
+    global _active
+    c.active += 1
+    _active += 1
+    c.publish()
+
+
+def _release(c):
+    global _active
+    c.active -= 1
+    _active -= 1
+    c.publish()
+    _wake()
+
+
+def _wake():
+    # Best priority first; a waiter whose own class is full doesn't block the ones behind it
+    skipped = []
+    while _waiters and _active < ADMISSION_MAX_ACTIVE:
+        item = heapq.heappop(_waiters)
+        c, fut = item[2], item[3]
+        if fut.done(): # Timed out or client went away
+            continue
+        if c.active >= c.limit:
+            skipped.append(item)
+            continue
+        _grant(c)
+        fut.set_result(None)
+    for item in skipped:
+        heapq.heappush(_waiters, item)
+
+
+def _reject(c, status, reason):
+    c.rejected[reason] += 1
+    metrics.counter("admission_rejected_total", "Requests turned away by admission control",
+                    cls=c.name, reason=reason).inc()
+    return Rejected(c.name, status, reason, c.retry_after())
+
+
+@asynccontextmanager
+async def admit(name):
+    """Holds one slot of class `name` for the duration of the block; raises Rejected if none comes in time."""
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    c = _get_class(name)
+    t0 = time.perf_counter()
+    if _can_run(c):
+        _grant(c)
+    else:
+        if c.waiting >= c.max_queue:
+            raise _reject(c, 429, "queue_full")
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(_waiters, (c.priority, next(_seq), c, fut))
+        c.waiting += 1
+        c.publish()
+        # Never wait past the request's own deadline
+        left = deadline.remaining()
+        wait_s = c.wait_s if left is None else max(0.0, min(c.wait_s, left))
+        try:
+            await asyncio.wait_for(fut, wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled(): # Granted in the same tick the wait ended
+                _release(c)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise _reject(c, 503, "wait_timeout") from None
+        finally:
+            c.waiting -= 1
+            c.publish()
+    metrics.histogram("admission_wait_seconds", "Time spent queued for an admission slot",
+                      cls=c.name).observe(time.perf_counter() - t0)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        c.service_s = 0.8 * c.service_s + 0.2 * (time.perf_counter() - started)
+        _release(c)
+
+
+def status():
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "active": _active,
+        "max_active": ADMISSION_MAX_ACTIVE,
+        "classes": {name: {"active": c.active, "limit": c.limit, "waiting": c.waiting, "max_queue": c.max_queue,
+                           "wait_s": c.wait_s, "priority": c.priority, "rejected": dict(c.rejected)}
+                    for name, c in _classes.items()},
+    }
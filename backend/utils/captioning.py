@@ -1,11 +1,10 @@
 import base64
 from io import BytesIO
 from PIL import Image
-from openai import OpenAI
-from backend.config import API_KEY, BASE_URL, LLM_MODEL
-
-# Initialize Client
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+from backend.config import LLM_MODEL, get_device
+from backend.utils.metrics import timed, timed_model_load, counter
+from backend.utils.tracing import span
+from backend.utils import llm_client, llm_cache, deadline
 
 def encode_image(image: Image.Image):
     """Encodes a PIL image to base64 string"""
@@ -16,11 +15,8 @@ def encode_image(image: Image.Image):
     image.save(buffered, format="JPEG")
     return base64.b64encode(buffered.getvalue()).decode('utf-8')
 
-from transformers import BlipProcessor, BlipForConditionalGeneration
-import torch
-from backend.config import DEVICE
-
-# Lazy Load BLIP
+# Lazy Load BLIP (transformers is imported inside load_blip)
+BLIP_MODEL_ID = "Salesforce/blip-image-captioning-base"
 blip_processor = None
 blip_model = None
 
@@ -30,12 +26,15 @@ def load_blip():
     
     print("⏳ Loading BLIP Captioning Model (Local)...")
     try:
-        blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(DEVICE)
+        with timed_model_load("blip"):
+            from transformers import BlipProcessor, BlipForConditionalGeneration
+            blip_processor = BlipProcessor.from_pretrained(BLIP_MODEL_ID)
+            blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_ID).to(get_device())
         print("✅ BLIP Ready")
     except Exception as e:
         print(f"❌ Error loading BLIP: {e}")
 
+@span("captioning.generate_caption")
 def generate_caption(image: Image.Image, category_name: str = None) -> str:
     """
     Generates a visual description using local BLIP model (Free).
@@ -52,9 +51,10 @@ def generate_caption(image: Image.Image, category_name: str = None) -> str:
         text_prompt = "a photograph of"
         if category_name: text_prompt += f" a {category_name},"
         
-        inputs = blip_processor(image, text_prompt, return_tensors="pt").to(DEVICE)
+        inputs = blip_processor(image, text_prompt, return_tensors="pt").to(get_device())
         
-        out = blip_model.generate(**inputs, max_new_tokens=50)
+        with timed("blip_caption"):
+            out = blip_model.generate(**inputs, max_new_tokens=50)
         caption = blip_processor.decode(out[0], skip_special_tokens=True)
         
         return caption
@@ -62,13 +62,24 @@ def generate_caption(image: Image.Image, category_name: str = None) -> str:
         print(f"Caption Error: {e}")
         return f"A {category_name or 'jewellery'} piece."
 
-def describe_sketch(image: Image.Image) -> str:
+SKETCH_FALLBACK = "sketch of jewellery"
+SKETCH_PROMPT_VERSION = 1 # Bump when the prompt changes (invalidates llm_cache entries)
+
+@span("captioning.describe_sketch")
+def describe_sketch(image: Image.Image, timeout: float = 20.0, reserve: float = 0.0):
     """
     Generates a description for a hand-drawn sketch.
     Used for converting sketch -> text query.
+    Returns None (no LLM call) when the request deadline can't fit it plus `reserve`.
     """
     try:
         base64_image = encode_image(image)
+        cache_key = llm_cache.key("describe_sketch", SKETCH_PROMPT_VERSION, base64_image)
+        cached = llm_cache.get(cache_key, "describe_sketch")
+        if cached is not None:
+            return cached
+        if not deadline.allows("sketch_llm", reserve=reserve):
+            return None
         
         prompt = """
         Analyze this sketch of a jewellery piece. 
@@ -85,31 +96,36 @@ def describe_sketch(image: Image.Image) -> str:
         }
         """
 
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+        with timed("llm_call"):
+            response = llm_client.chat(
+                model=LLM_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                },
                             },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=100,
-            timeout=20.0
-        )
+                        ],
+                    }
+                ],
+                max_tokens=100,
+                timeout=deadline.timeout(timeout, reserve=reserve)
+            )
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="describe_sketch", outcome="ok").inc()
         content = response.choices[0].message.content
         if "```json" in content:
             content = content.split("```json")[1].split("```")[0]
         elif "```" in content:
             content = content.split("```")[1]
-        return content.strip()
+        content = content.strip()
+        llm_cache.put(cache_key, "describe_sketch", content)
+        return content
     except Exception as e:
         print(f"Sketch Description Error: {e}")
-        return "sketch of jewellery"
+        counter("llm_requests_total", "LLM calls by purpose and outcome", purpose="describe_sketch", outcome="error").inc()
+        return SKETCH_FALLBACK
@@ -0,0 +1,92 @@
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from backend.config import DEADLINE_STAGE_S
+from backend.utils import metrics
+from backend.utils.tracing import annotate
+
+# Per-request time budget, carried in a ContextVar like the trace (asyncio.to_thread
+# and the shard fan-out copy the context, so every stage sees it). Stages ask
+# allows("rerank") before starting something optional; with too little time left
+# they're skipped and recorded, and the response lists them (X-Degraded-Stages).
+# Outside a request, or with no deadline, everything is allowed.
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires = time.perf_counter() + seconds
+        self.degraded = [] # Mutated from worker threads; appends are atomic
+
+    def remaining(self):
+        return self.expires - time.perf_counter()
+
+
+@contextmanager
+def scope(seconds):
+    """Runs the block under a deadline of `seconds` (None = no deadline)."""
+    if seconds is None:
+        yield None
+        return
+    d = Deadline(seconds)
+    token = _current.set(d)
+    try:
+        yield d
+    finally:
+        _current.reset(token)
+
+
+def header_budget_ms(value, default, maximum):
+    """
+    X-Request-Deadline-Ms -> budget in ms, clamped to [1, maximum]. Missing, unparsable
+    or non-finite values get `default` ("nan" would otherwise fail every allows()).
+    """
+    try:
+        ms = float(value) if value else None
+    except ValueError:
+        ms = None
+    if ms is None or not math.isfinite(ms):
+        return default
+    return min(max(ms, 1.0), maximum)
+
+
+def remaining():
+    """Seconds left, or None without a deadline."""
+    d = _current.get()
+    return d.remaining() if d is not None else None
+
+
+def skip(stage):
+    d = _current.get()
+    if d is not None and stage not in d.degraded:
+        d.degraded.append(stage)
+    annotate(**{f"skipped_{stage}": True})
+    metrics.counter("degraded_stages_total", "Stages skipped to meet a request deadline", stage=stage).inc()
+    print(f"⏱️ Deadline: skipping {stage} ({remaining() or 0:.2f}s left)")
+
+
+def allows(stage, reserve=0.0):
+    """
+    True if there's time for `stage` (estimate from DEADLINE_STAGE_S) plus `reserve`
+    seconds for what comes after it. False records the stage as skipped.
+    """
+    left = remaining()
+    if left is None or left >= DEADLINE_STAGE_S.get(stage, 0.0) + reserve:
+        return True
+    skip(stage)
+    return False
+
+
+def timeout(default, reserve=0.0, floor=0.5):
+    """`default` capped to the time left (minus `reserve`), for LLM / network calls."""
+    left = remaining()
+    if left is None:
+        return default
+    return max(floor, min(default, left - reserve))
+
+
+def degraded():
+    d = _current.get()
+    return list(d.degraded) if d is not None else []
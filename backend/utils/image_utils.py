@@ -1,28 +1,95 @@
-import cv2
 import numpy as np
 
-def compute_skew_angle(gray):
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
-    if lines is None:
+# cv2 is imported inside the functions so importing this module stays cheap
+
+def _ink(gray):
+    import cv2
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return ink
+
+def compute_skew_angle(gray, max_angle=15.0):
+    """
+    Text skew in degrees, by projection profile: the rotation whose row-ink
+    histogram is the most peaked (lines sharp, gaps empty). Handwriting rarely
+    has the long straight edges a Hough transform needs. Runs on a ~400 px copy,
+    coarse 1 degree steps, then 0.2, then 0.05 around the best.
+    """
+    import cv2
+    scale = min(1.0, 400 / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    ink = _ink(small).astype(np.float32)
+    if not ink.any():
         return 0.0
-    angles = []
-    for rho, theta in lines[:20]:
-        angle = (theta - np.pi / 2) * 180 / np.pi
-        angles.append(angle)
-    return np.median(angles) if angles else 0.0
+    h, w = ink.shape
+    center = (w / 2, h / 2)
+
+    def sharpness(angle):
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        # Linear, not nearest: nearest-neighbour aliasing biased the fine steps by ~0.3 degree
+        rows = cv2.warpAffine(ink, M, (w, h), flags=cv2.INTER_LINEAR).sum(axis=1)
+        return float(np.var(rows))
+
+    best = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=sharpness)
+    best = max(np.arange(best - 0.8, best + 0.9, 0.2), key=sharpness)
+    best = max(np.arange(best - 0.15, best + 0.16, 0.05), key=sharpness)
+    return float(best)
 
 def rotate_image(image, angle):
+    import cv2
     (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
     M = cv2.getRotationMatrix2D(center, angle, 1.0)
     return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
 
+def deskew(img):
+    """Rotates a BGR/RGB or grayscale array so its text lines are horizontal."""
+    import cv2
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    angle = compute_skew_angle(gray)
+    if abs(angle) >= 0.5:
+        img = rotate_image(img, angle)
+    return img
+
 def normalize_text_image(image_path):
+    import cv2
     img = cv2.imread(image_path)
     if img is None: return None
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    angle = compute_skew_angle(gray)
-    if abs(angle) > 1.0:
-        img = rotate_image(img, angle)
-    return img
\ No newline at end of file
+    return deskew(img)
+
+def segment_lines(gray, min_height=8, gap_ratio=0.05, pad=4):
+    """
+    Finds text lines in a (deskewed) grayscale note by horizontal projection:
+    ink pixels per row after Otsu binarisation, rows above `gap_ratio` of the
+    busiest row count as text. Returns [(top, bottom), ...] row ranges, top to
+    bottom; the whole image if nothing line-like is found.
+    """
+    h = gray.shape[0]
+    profile = _ink(gray).sum(axis=1).astype(np.float32)
+    if profile.max() == 0:
+        return [(0, h)]
+    # Smooth over ~1% of the height so descenders / dots don't split a line
+    k = max(3, h // 100) | 1
+    profile = np.convolve(profile, np.ones(k, dtype=np.float32) / k, mode="same")
+    rows = profile > profile.max() * gap_ratio
+
+    # Runs of text rows -> spans; merge gaps smaller than half a typical line
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], rows.astype(np.int8), [0]])))
+    spans = [(int(a), int(b)) for a, b in zip(edges[::2], edges[1::2])]
+    if not spans:
+        return [(0, h)]
+    typical = np.median([b - a for a, b in spans])
+    merged = [spans[0]]
+    for a, b in spans[1:]:
+        if a - merged[-1][1] < typical / 2:
+            merged[-1] = (merged[-1][0], b)
+        else:
+            merged.append((a, b))
+    lines = [(max(0, a - pad), min(h, b + pad)) for a, b in merged if b - a >= min_height]
+    return lines or [(0, h)]
+
+def crop_columns(line, pad=8):
+    """Trims the blank margins left and right of a grayscale line crop (ink found with Otsu)."""
+    cols = np.flatnonzero(_ink(line).sum(axis=0))
+    if len(cols) == 0:
+        return line
+    return line[:, max(0, cols[0] - pad):min(line.shape[1], cols[-1] + 1 + pad)]
@@ -0,0 +1,118 @@
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from backend.config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL_S, LLM_CACHE_MAX_MB, LLM_MODEL
+from backend.utils import metrics
+
+# On-disk cache of parsed LLM results (sketch descriptions, OCR refinement, vision OCR).
+# Keys are content addresses: purpose + prompt template version + model + the exact
+# input (text, or sha256 of the image bytes), so bumping a template's version is
+# all it takes to invalidate its entries. sqlite in WAL mode, so every uvicorn
+# worker on the machine shares one file. Entries expire after LLM_CACHE_TTL_S; the
+# least recently used go first once the file holds more than LLM_CACHE_MAX_MB.
+# Only successful, parsed results are stored; failures and fallbacks never are.
+
+_local = threading.local()
+_puts = itertools.count(1) # next() is atomic, put() runs on many request threads
+_PRUNE_EVERY = 100
+
+
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=5.0, isolation_level=None) # autocommit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY, purpose TEXT, value TEXT,
+            created REAL, accessed REAL, size INTEGER)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        _local.conn = conn
+    return conn
+
+
+def key(purpose, version, data):
+    """Content address for one LLM input. `data` is str (prompt input) or bytes (image)."""
+    h = hashlib.sha256(f"{purpose}\0{version}\0{LLM_MODEL}\0".encode())
+    h.update(data.encode("utf-8") if isinstance(data, str) else data)
+    return h.hexdigest()
+
+
+def get(cache_key, purpose):
+    """The cached result, or None on a miss (or when the cache is off/unavailable)."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        conn = _db()
+        row = conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (cache_key,)).fetchone()
+        now = time.time()
+        value, stale = None, False
+        if row is not None:
+            if now - row[1] > LLM_CACHE_TTL_S:
+                stale = True
+            else:
+                try:
+                    value = json.loads(row[0])
+                except ValueError: # Corrupt row: a miss, and it goes too
+                    print(f"⚠️ LLM cache: dropping unreadable {purpose} entry")
+                    stale = True
+        if stale:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (cache_key,))
+            row = None
+        if row is None:
+            metrics.counter("llm_cache_misses_total", "Persistent LLM cache misses", purpose=purpose).inc()
+            return None
+        conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, cache_key))
+        metrics.counter("llm_cache_hits_total", "Persistent LLM cache hits", purpose=purpose).inc()
+        return value
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM cache read failed: {e}")
+        return None
+
+
+def put(cache_key, purpose, value):
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        blob = json.dumps(value)
+        now = time.time()
+        _db().execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                      (cache_key, purpose, blob, now, now, len(blob)))
+        if next(_puts) % _PRUNE_EVERY == 1:
+            prune()
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM cache write failed: {e}")
+
+
+def prune():
+    """Drops expired entries, then least recently used ones until under LLM_CACHE_MAX_MB."""
+    conn = _db()
+    conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - LLM_CACHE_TTL_S,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+    excess = total - LLM_CACHE_MAX_MB * 1024 * 1024
+    if excess <= 0:
+        return
+    # Oldest-accessed first, up to the first row that brings the total under the limit
+    cutoff, dropped = None, 0
+    for accessed, size in conn.execute("SELECT accessed, size FROM llm_cache ORDER BY accessed"):
+        dropped += size
+        cutoff = accessed
+        if dropped >= excess:
+            break
+    conn.execute("DELETE FROM llm_cache WHERE accessed <= ?", (cutoff,))
+
+
+def stats():
+    if not LLM_CACHE_ENABLED:
+        return {"enabled": False}
+    try:
+        count, size = _db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+    except sqlite3.Error as e:
+        return {"enabled": True, "error": str(e)}
+    return {"enabled": True, "path": LLM_CACHE_PATH, "entries": count, "bytes": size,
+            "max_bytes": int(LLM_CACHE_MAX_MB * 1024 * 1024), "ttl_s": LLM_CACHE_TTL_S}
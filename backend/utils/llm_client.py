@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from backend.config import API_KEY, BASE_URL, LLM_MAX_CONCURRENCY, LLM_RETRIES, LLM_HEDGE_MS
+from backend.utils import metrics
+
+# One OpenAI client for the whole process, created on first LLM call.
+# Building it at import time pulled in openai/httpx/pydantic models for every
+# worker, even ones that only serve /search/image.
+_client = None
+
+def get_client():
+    """Plain synchronous client (no retries/coalescing); prefer chat() below."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+    return _client
+
+
+# --- Shared async client ---
+# All chat calls go through one AsyncOpenAI client (one pooled HTTP connection
+# set) running on a background event loop, so request threads just wait on a
+# future. On top of the raw call:
+#   - coalescing: identical requests already in flight share one upstream call
+#   - retries with full jitter on 429 / 5xx / connection errors, within the caller's timeout
+#   - hedging (LLM_HEDGE_MS > 0): a duplicate request if the first is slow, first answer wins
+#   - at most LLM_MAX_CONCURRENCY calls in flight
+
+_RETRY_BASE_S = 0.25
+_COALESCE_SLACK_S = 0.5 # Join an in-flight call whose budget ends at most this much before ours
+
+_loop = None
+_loop_lock = threading.Lock()
+_async_client = None
+_semaphore = None
+_inflight = {} # request key -> (asyncio.Task, monotonic end of its budget) (loop thread only)
+_base_url = BASE_URL
+_api_key = API_KEY
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def _get_async_client():
+    # Loop thread only
+    global _async_client, _semaphore
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        # Retries are ours (they respect the caller's overall timeout)
+        _async_client = AsyncOpenAI(api_key=_api_key, base_url=_base_url, max_retries=0)
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _async_client
+
+
+def _retryable(e):
+    import openai
+    if isinstance(e, (openai.APIConnectionError, openai.RateLimitError)): # includes APITimeoutError
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+async def _attempt(kwargs, timeout, sent=None):
+    client = _get_async_client()
+    async with _semaphore:
+        if sent is not None:
+            sent.set()
+        t0 = time.perf_counter()
+        try:
+            return await client.chat.completions.create(**kwargs, timeout=timeout)
+        finally:
+            metrics.histogram("llm_attempt_seconds", "Latency of single upstream LLM attempts").observe(
+                time.perf_counter() - t0)
+
+
+async def _hedged(kwargs, timeout):
+    hedge_s = LLM_HEDGE_MS / 1000
+    if hedge_s <= 0 or hedge_s >= timeout:
+        return await _attempt(kwargs, timeout)
+    sent = asyncio.Event()
+    first = asyncio.ensure_future(_attempt(kwargs, timeout, sent))
+    # The hedge clock starts when the request actually goes out, not while it queues for a slot
+    waiter = asyncio.ensure_future(sent.wait())
+    await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+    done, _ = await asyncio.wait({first}, timeout=hedge_s)
+    if done:
+        return first.result()
+    if _semaphore.locked(): # Saturated: a duplicate would only add load
+        return await first
+    metrics.counter("llm_hedges_total", "Hedged (duplicate) LLM requests sent").inc()
+    pending = {first, asyncio.ensure_future(_attempt(kwargs, timeout - hedge_s))}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _with_retries(kwargs, timeout):
+    end = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        left = end - time.monotonic()
+        if left <= 0:
+            raise TimeoutError(f"LLM call out of time after {attempt} attempt(s)")
+        try:
+            return await _hedged(kwargs, left)
+        except Exception as e:
+            attempt += 1
+            pause = random.uniform(0, _RETRY_BASE_S * 2 ** attempt) # Full jitter
+            if attempt > LLM_RETRIES or not _retryable(e) or end - time.monotonic() < pause + 0.5:
+                raise
+            metrics.counter("llm_retries_total", "LLM attempts retried after a transient error").inc()
+            print(f"🔁 LLM retry {attempt}/{LLM_RETRIES} in {pause:.2f}s: {type(e).__name__}")
+            await asyncio.sleep(pause)
+
+
+def _key(kwargs):
+    return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def achat(timeout=20.0, **kwargs):
+    """
+    chat.completions.create(**kwargs) on the shared client. `timeout` is the overall
+    budget (retries + hedges included). Must run on the client's loop (see chat()).
+    """
+    key = _key(kwargs)
+    end = time.monotonic() + timeout
+    entry = _inflight.get(key)
+    # Only share a call that has (about) as much time as we do: one started by a nearly
+    # expired request would hand us its TimeoutError. Otherwise start our own, and
+    # later identical callers join that one instead.
+    if entry is not None and entry[1] >= end - _COALESCE_SLACK_S:
+        task = entry[0]
+        metrics.counter("llm_coalesced_total", "LLM calls answered by an identical in-flight request").inc()
+    else:
+        task = asyncio.ensure_future(_with_retries(kwargs, timeout))
+        _inflight[key] = (task, end)
+        def forget(t):
+            if _inflight.get(key, (None,))[0] is t:
+                del _inflight[key]
+        task.add_done_callback(forget)
+    # shield: one caller timing out mustn't cancel the call the others are waiting on
+    return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+
+def chat(timeout=20.0, **kwargs):
+    """Blocking wrapper for request threads: same arguments and return value as chat.completions.create."""
+    loop = _get_loop()
+    if threading.current_thread().name == "llm-client":
+        raise RuntimeError("llm_client.chat() called from the LLM loop; await achat() instead")
+    return asyncio.run_coroutine_threadsafe(achat(timeout=timeout, **kwargs), loop).result()
+
+
+def configure(base_url=None, api_key=None):
+    """Points the shared async client somewhere else (e.g. benchmarks/stub_llm); the next call reconnects."""
+    global _base_url, _api_key
+    _base_url = base_url or BASE_URL
+    _api_key = api_key or API_KEY or "stub"
+    if _loop is not None:
+        asyncio.run_coroutine_threadsafe(_reset(), _loop).result()
+
+
+async def _reset():
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
+
+
+def close():
+    """Shutdown: closes pooled connections and stops the loop."""
+    global _loop
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_reset(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from backend.utils.tracing import span
+
+# Latency buckets in seconds: 1 ms .. 60 s (covers FAISS lookups up to LLM calls)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_LATENCY = "stage_latency_seconds"
+MODEL_LOAD = "model_load_seconds"
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = float(value)
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def dec(self, amount=1.0):
+        self.value -= amount
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+# name -> {"type", "help", "series": {labels_tuple: metric}}
+_families = {}
+_families_lock = threading.Lock()
+_collectors = []
+
+
+def _get(name, kind, cls, help_text, labels):
+    key = tuple(sorted(labels.items()))
+    family = _families.get(name)
+    if family is not None:
+        metric = family["series"].get(key)
+        if metric is not None:
+            return metric
+    with _families_lock:
+        family = _families.setdefault(name, {"type": kind, "help": help_text, "series": {}})
+        return family["series"].setdefault(key, cls())
+
+
+def counter(name, help_text="", **labels) -> Counter:
+    return _get(name, "counter", Counter, help_text, labels)
+
+
+def gauge(name, help_text="", **labels) -> Gauge:
+    return _get(name, "gauge", Gauge, help_text, labels)
+
+
+def histogram(name, help_text="", **labels) -> Histogram:
+    return _get(name, "histogram", Histogram, help_text, labels)
+
+
+def observe_stage(stage, seconds):
+    histogram(STAGE_LATENCY, "Latency of each retrieval/inference stage", stage=stage).observe(seconds)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Times a block (or, as a decorator, a function) into stage_latency_seconds{stage=...}.
+    Also records a span of the same name when the request is being traced.
+    """
+    t0 = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+@contextmanager
+def timed_model_load(model):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge(MODEL_LOAD, "Wall time of the last load of each model", model=model).set(time.perf_counter() - t0)
+
+
+def register_collector(fn):
+    """
+    fn() is called at scrape time and returns (name, type, help, labels, value) tuples,
+    for values that live elsewhere (e.g. cache hit counters).
+    """
+    _collectors.append(fn)
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(pairs):
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"): return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _families_lock:
+        families = [(name, dict(f, series=dict(f["series"]))) for name, f in sorted(_families.items())]
+
+    for name, family in families:
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, metric in sorted(family["series"].items()):
+            if family["type"] == "histogram":
+                with metric._lock:
+                    counts, total, n = list(metric.counts), metric.sum, metric.count
+                cumulative = 0
+                for bound, c in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', _fmt_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {total!r}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {n}")
+            else:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(metric.value)}")
+
+    # Group collector samples by family, the exposition format needs them contiguous
+    collected = {}
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception as e:
+            print(f"⚠️ Metrics collector failed: {e}")
+            continue
+        for name, kind, help_text, labels, value in samples:
+            collected.setdefault(name, (kind, help_text, []))[2].append((labels, value))
+    for name, (kind, help_text, samples) in collected.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_fmt_labels(tuple(sorted(labels.items())))} {_fmt_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf functions of threads that are just parked (thread pools, event loop, sockets)
+IDLE_LEAVES = {"wait", "select", "poll", "epoll", "_worker", "accept", "_wait_for_tstate_lock", "run_forever"}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for every thread of the running process.
+    A background thread snapshots sys._current_frames() every `interval` seconds;
+    cost is one stack walk per thread per sample, nothing is hooked into the code.
+    """
+
+    def __init__(self, interval=0.005, skip_idle=True):
+        self.interval = interval
+        self.skip_idle = skip_idle
+        self.stacks = Counter() # (thread_name, frame_label, ...) root -> leaf
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, own_id, names):
+        for tid, frame in sys._current_frames().items():
+            if tid == own_id or names.get(tid) == "startup-profiler":
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if not stack or (self.skip_idle and stack[0].split(" ", 1)[0] in IDLE_LEAVES):
+                continue
+            stack.append(names.get(tid, f"thread-{tid}"))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self._sample(own_id, names)
+            self.samples += 1
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_tick = time.perf_counter() # Fell behind (GIL held elsewhere), don't burst
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed-stack format (flamegraph.pl, inferno, speedscope import)."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def speedscope(self) -> dict:
+        """speedscope.app JSON, one sampled profile per thread."""
+        frames, frame_index = [], {}
+        per_thread = {}
+        for stack, count in self.stacks.items():
+            thread_name, labels = stack[0], stack[1:]
+            idxs = []
+            for label in labels:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    name, _, where = label.partition(" (")
+                    file, _, line = where.rstrip(")").rpartition(":")
+                    frames.append({"name": name, "file": file, "line": int(line) if line.isdigit() else None})
+                idxs.append(frame_index[label])
+            prof = per_thread.setdefault(thread_name, {"samples": [], "weights": []})
+            prof["samples"].append(idxs)
+            prof["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"backend profile ({self.duration:.1f}s, {self.samples} ticks)",
+            "exporter": "backend.utils.profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(p["weights"]),
+                    "samples": p["samples"],
+                    "weights": p["weights"],
+                }
+                for thread_name, p in sorted(per_thread.items())
+            ],
+        }
+
+
+# Only one profile at a time, overlapping samplers would just double the overhead
+profile_lock = threading.Lock()
+
+
+def profile_startup(seconds, out_dir, interval=0.005):
+    """Samples the first `seconds` of the process (model loads, index build) and writes a collapsed file."""
+    def run():
+        with profile_lock:
+            prof = SamplingProfiler(interval=interval, skip_idle=True).start()
+            time.sleep(seconds)
+            prof.stop()
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"startup-{int(time.time())}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(prof.collapsed())
+        print(f"🔬 Startup profile written: {path} ({prof.samples} ticks)")
+
+    threading.Thread(target=run, name="startup-profiler", daemon=True).start()
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from backend.config import QUERY_CACHE_SIZE, QUERY_CACHE_MAX_DISTANCE, SKETCH_CACHE_MAX_DISTANCE
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2D DCT is just D @ X @ D.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+
+def phash(image: Image.Image) -> int:
+    """
+    64-bit perceptual hash (low-frequency DCT sign pattern).
+    Stable under re-compression, resizing and small crops.
+    """
+    gray = np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float32)
+    freq = (_DCT_32 @ gray @ _DCT_32.T)[:8, :8].flatten()
+    # Skip the DC term when picking the threshold, it only encodes overall brightness
+    return _bits_to_int(freq > np.median(freq[1:]))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class PerceptualCache:
+    """
+    LRU cache keyed by a 64-bit perceptual hash.
+    A lookup hits if any stored hash is within `max_distance` bits of the query,
+    so re-uploads of the same photo (re-cropped / re-compressed) reuse the result.
+    """
+
+    def __init__(self, name, max_entries=QUERY_CACHE_SIZE, max_distance=QUERY_CACHE_MAX_DISTANCE):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int):
+        with self._lock:
+            match = None
+            if key in self._entries:
+                match = key
+            elif self.max_distance > 0:
+                # Linear scan is fine for a few hundred 64-bit ints
+                match, best = None, self.max_distance + 1
+                for stored in self._entries:
+                    d = hamming(stored, key)
+                    if d < best:
+                        match, best = stored, d
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(match)
+            self.hits += 1
+            return self._entries[match]
+
+    def put(self, key: int, value):
+        if self.max_entries <= 0: return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Shared instances
+image_embedding_cache = PerceptualCache("image_embedding")
+sketch_embedding_cache = PerceptualCache("sketch_embedding", max_distance=SKETCH_CACHE_MAX_DISTANCE)
+sketch_interpretation_cache = PerceptualCache("sketch_interpretation", max_distance=SKETCH_CACHE_MAX_DISTANCE)
+
+
+def all_cache_stats():
+    return {c.name: c.stats() for c in (image_embedding_cache, sketch_embedding_cache, sketch_interpretation_cache)}
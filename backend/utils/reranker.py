@@ -1,5 +1,7 @@
-from sentence_transformers import CrossEncoder
-from backend.config import DEVICE
+from backend.config import get_device
+from backend.models import workers
+from backend.utils.metrics import timed, timed_model_load
+from backend.utils.tracing import annotate
 
 # A fast, high-accuracy model optimized for search ranking
 MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
@@ -11,19 +13,31 @@ def load_ranker():
     
     print(f"⏳ Loading Cross-Encoder Reranker ({MODEL_NAME})...")
     try:
-        reranker_model = CrossEncoder(MODEL_NAME, device=DEVICE)
+        with timed_model_load("reranker"):
+            from sentence_transformers import CrossEncoder
+            reranker_model = CrossEncoder(MODEL_NAME, device=get_device())
         print("✅ Reranker Ready")
     except Exception as e:
         print(f"⚠️ Error loading Reranker: {e}")
         reranker_model = None
 
+def predict_scores(pairs):
+    """Cross-encoder logits for [[query, text], ...], or None if the model isn't available."""
+    if workers.enabled("reranker"):
+        return workers.call("reranker", "backend.utils.reranker:predict_scores", pairs)
+    load_ranker()
+    if reranker_model is None:
+        return None
+    return reranker_model.predict(pairs)
+
+@timed("rerank")
 def rerank_results(query, initial_results, top_k=5):
     """
     Takes a query and a list of results.
     Re-scores them by comparing 'Query' vs 'Image Caption'.
     """
-    load_ranker()
-    if reranker_model is None or not initial_results:
+    annotate(candidates=len(initial_results), top_k=top_k)
+    if not initial_results:
         return initial_results[:top_k]
 
     # 1. Prepare pairs for the model: [[Query, Caption1], [Query, Caption2], ...]
@@ -43,7 +57,9 @@ def rerank_results(query, initial_results, top_k=5):
 
     # 2. Predict scores (returns a list of floats, e.g., [-4.2, 2.1, 0.5])
     # Higher is better.
-    scores = reranker_model.predict(prediction_inputs)
+    scores = predict_scores(prediction_inputs)
+    if scores is None:
+        return initial_results[:top_k]
 
     # 3. Attach new scores to results
     import numpy as np
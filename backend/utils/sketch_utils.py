@@ -1,13 +1,15 @@
-import cv2
 import numpy as np
 from PIL import Image
 
+# cv2 is imported inside the functions: it's only needed for sketch indexing/search
+
 def photo_to_sketch_database(image_path):
     """
     CONVERTS DATABASE PHOTOS -> REALISTIC PENCIL SKETCHES.
     Uses a 'Color Dodge' blend to preserve shading and texture.
     This creates the "Target" for the search.
     """
+    import cv2
     img = cv2.imread(image_path)
     if img is None: return None
     
@@ -28,13 +30,35 @@ def photo_to_sketch_database(image_path):
     sketch_rgb = cv2.cvtColor(sketch, cv2.COLOR_GRAY2RGB)
     return Image.fromarray(sketch_rgb)
 
-def preprocess_sketch(image_path):
+def _sketch_gray(image):
+    """Path, PIL image or HxW / HxWx3 (RGB) / HxWx4 (RGBA) uint8 array -> grayscale array."""
+    import cv2
+    if isinstance(image, str):
+        return cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    if isinstance(image, Image.Image):
+        if image.mode in ("RGBA", "LA", "P"):
+            # Transparent canvas exports: paint them onto white, not black
+            rgba = image.convert("RGBA")
+            image = Image.new("RGBA", rgba.size, "white")
+            image.alpha_composite(rgba)
+        return np.asarray(image.convert("L"))
+    img = np.asarray(image, dtype=np.uint8)
+    if img.ndim == 3 and img.shape[2] == 4:
+        alpha = img[:, :, 3:].astype(np.float32) / 255
+        img = (img[:, :, :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    return img
+
+def preprocess_sketch(image):
     """
     CLEANS USER UPLOAD -> STANDARD PENCIL SKETCH.
     Assumes user uploads 'Dark lines on White paper'.
+    `image` is a file path, a PIL image or a uint8 array (live canvas updates skip the disk).
     """
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if img is None: return None
+    import cv2
+    img = _sketch_gray(image)
+    if img is None or img.size == 0: return None
 
     # 1. Resize/Pad to 224x224 (Standardize Size)
     h, w = img.shape
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from backend.config import DATA_DIR, THUMB_DIR, THUMB_SIZES, THUMB_GRID_SIZE, THUMB_FORMAT, THUMB_WORKERS
+
+# WebP needs Pillow built with libwebp, fall back to JPEG otherwise
+_EXT = {"webp": "webp", "jpeg": "jpg"}
+
+
+def _thumb_format():
+    fmt = THUMB_FORMAT.lower()
+    if fmt == "webp":
+        from PIL import features
+        if not features.check("webp"):
+            return "jpeg"
+    return fmt if fmt in _EXT else "jpeg"
+
+
+def rel_data_path(image_path):
+    """Path of an image relative to DATA_DIR, e.g. 'ring/ring_001.jpg'"""
+    clean_data_dir = DATA_DIR.replace("\\", "/")
+    clean_img_path = image_path.replace("\\", "/")
+    if clean_img_path.startswith(clean_data_dir):
+        return clean_img_path[len(clean_data_dir):].strip("/")
+    if "data/images" in clean_img_path:
+        return clean_img_path.split("data/images")[-1].strip("/")
+    return os.path.basename(clean_img_path)
+
+
+def thumbnail_rel_path(rel_path, size, fmt=None):
+    """'ring/ring_001.jpg' -> '256/ring/ring_001.webp' (relative to THUMB_DIR)"""
+    stem = os.path.splitext(rel_path)[0]
+    return f"{size}/{stem}.{_EXT[fmt or _thumb_format()]}"
+
+
+def thumbnail_url(rel_path, size=None, base_url="http://localhost:8000"):
+    """
+    Public URL of a pre-generated thumbnail, or None if it hasn't been built yet.
+    The thumbnail mtime is part of the URL so it can be cached as immutable.
+    """
+    thumb_rel = thumbnail_rel_path(rel_path, size or THUMB_GRID_SIZE)
+    try:
+        version = int(os.stat(os.path.join(THUMB_DIR, thumb_rel)).st_mtime)
+    except OSError:
+        return None
+    return f"{base_url}/thumbs/{thumb_rel}?v={version}"
+
+
+def _make_thumbnails(image_path, fmt, sizes):
+    """Decodes a source image once and writes every missing/stale size tier."""
+    rel_path = rel_data_path(image_path)
+    src_mtime = os.stat(image_path).st_mtime
+
+    todo = []
+    for size in sizes:
+        out_path = os.path.join(THUMB_DIR, thumbnail_rel_path(rel_path, size, fmt))
+        try:
+            if os.stat(out_path).st_mtime >= src_mtime:
+                continue
+        except OSError:
+            pass
+        todo.append((size, out_path))
+    if not todo:
+        return 0
+
+    with Image.open(image_path) as img:
+        # JPEG draft mode lets libjpeg downscale during decode (much cheaper)
+        largest = max(size for size, _ in todo)
+        img.draft("RGB", (largest, largest))
+        img = img.convert("RGB")
+
+        # Largest first so each tier is resampled from the previous one
+        for size, out_path in sorted(todo, reverse=True):
+            img.thumbnail((size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            tmp_path = out_path + ".tmp"
+            if fmt == "webp":
+                img.save(tmp_path, format="WEBP", quality=80, method=4)
+            else:
+                img.save(tmp_path, format="JPEG", quality=82, optimize=True, progressive=True)
+            os.replace(tmp_path, out_path)
+    return len(todo)
+
+
+def generate_thumbnails(items, sizes=THUMB_SIZES, workers=THUMB_WORKERS):
+    """
+    Incrementally builds the thumbnail store for a list of metadata items.
+    Only thumbnails that are missing or older than their source are (re)generated.
+    Pillow releases the GIL while decoding/resampling/encoding, so a thread pool scales.
+    """
+    fmt = _thumb_format()
+    paths = [item['image_path'] for item in items]
+    if not paths:
+        return 0
+
+    def work(path):
+        try:
+            return _make_thumbnails(path, fmt, sizes)
+        except Exception as e:
+            print(f"⚠️ Thumbnail error for {path}: {e}")
+            return 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        written = sum(pool.map(work, paths))
+
+    if written:
+        print(f"🖼️ Thumbnails: wrote {written} files ({fmt}, sizes {list(sizes)})")
+    return written
@@ -0,0 +1,104 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_slow_log_lock = threading.Lock()
+
+
+class Trace:
+    """Per-request span collector. Spans are plain dicts appended from any thread."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.spans = []
+        self.attrs = {}
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self, total_ms=None):
+        """Server-Timing header value: one entry per stage name (durations summed)."""
+        totals = {}
+        for s in self.spans:
+            agg = totals.setdefault(s["name"], [0.0, 0])
+            agg[0] += s["dur_ms"]
+            agg[1] += 1
+        parts = [f'{name};dur={dur:.1f}' + (f';desc="x{n}"' if n > 1 else "") for name, (dur, n) in totals.items()]
+        parts.append(f"total;dur={(total_ms if total_ms is not None else self.elapsed_ms()):.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self, total_ms, **extra):
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "ts": self.wall_start,
+            "total_ms": round(total_ms, 2),
+            **self.attrs,
+            **extra,
+            "spans": self.spans,
+        }
+
+
+def start_trace(name):
+    trace = Trace(name)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Records a span on the active trace. With no active trace (tracing off, or
+    code running outside a request) this is a single ContextVar lookup.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    record = {
+        "name": name,
+        "start_ms": round((time.perf_counter() - trace.start) * 1000, 2),
+        "parent": parent["name"] if parent else None,
+    }
+    if attrs:
+        record.update(attrs)
+    token = _current_span.set(record)
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["dur_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        _current_span.reset(token)
+        trace.spans.append(record)
+
+
+def annotate(**attrs):
+    """Adds attributes (e.g. candidates=57) to the innermost open span, or the trace itself."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    target = _current_span.get()
+    (target if target is not None else trace.attrs).update(attrs)
+
+
+def write_slow_log(path, record):
+    line = json.dumps(record, default=str)
+    with _slow_log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
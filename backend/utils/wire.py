@@ -0,0 +1,62 @@
+import base64
+import numpy as np
+from backend.config import EMBED_DIM
+
+# Binary in/out for high-volume API callers: raw embedding vectors in, and compact
+# (orjson / msgpack) result encodings out. Both encoders are optional dependencies,
+# imported on first use.
+
+VECTOR_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+COMPACT_TYPES = {
+    "orjson": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def decode_vector(data, dtype=None):
+    """
+    Raw little-endian bytes or base64 text -> L2-normalized float32 (EMBED_DIM,).
+    Without `dtype` it's inferred from the size (2048 bytes float32, 1024 float16).
+    Raises ValueError on anything that isn't one finite, non-zero vector.
+    """
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data, validate=True)
+        except ValueError as e:
+            raise ValueError(f"Vector is not valid base64: {e}") from None
+    if dtype is None:
+        dtype = {EMBED_DIM * 4: "float32", EMBED_DIM * 2: "float16"}.get(len(data))
+        if dtype is None:
+            raise ValueError(f"Expected {EMBED_DIM} float32 ({EMBED_DIM * 4} bytes) or float16 "
+                             f"({EMBED_DIM * 2} bytes) values, got {len(data)} bytes")
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"dtype must be one of {sorted(VECTOR_DTYPES)}")
+    if len(data) != EMBED_DIM * np.dtype(VECTOR_DTYPES[dtype]).itemsize:
+        raise ValueError(f"Expected {EMBED_DIM} {dtype} values, got {len(data)} bytes")
+    vector = np.frombuffer(data, dtype=VECTOR_DTYPES[dtype]).astype(np.float32)
+    norm = float(np.linalg.norm(vector))
+    if not np.isfinite(norm) or norm == 0:
+        raise ValueError("Vector must be finite and non-zero")
+    return vector / norm
+
+
+def negotiate(fmt, accept):
+    """Response encoding from ?format= or the Accept header: "json" (default), "orjson" or "msgpack"."""
+    if fmt:
+        return fmt.lower()
+    accept = (accept or "").lower()
+    if "msgpack" in accept:
+        return "msgpack"
+    return "json"
+
+
+def encode_compact(payload, fmt):
+    """(body bytes, media type). Skips response models entirely; raises ImportError if the encoder isn't installed."""
+    if fmt == "orjson":
+        import orjson
+        return orjson.dumps(payload), COMPACT_TYPES[fmt]
+    if fmt == "msgpack":
+        import msgpack
+        return msgpack.packb(payload, use_bin_type=True), COMPACT_TYPES[fmt]
+    raise ValueError(f"Unknown response format '{fmt}'")
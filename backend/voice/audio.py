@@ -0,0 +1,95 @@
+import io
+import subprocess
+import wave
+import numpy as np
+from backend.config import VAD_THRESHOLD_DB, VAD_MIN_SPEECH_DB
+
+# Audio helpers for voice search: decode uploads in memory (no temp files) to
+# 16 kHz mono float32, and find the speech in them so Whisper only sees that.
+
+SAMPLE_RATE = 16000 # What Whisper expects
+FRAME_S = 0.03
+MAX_SEGMENT_S = 30.0 # Whisper's window
+
+
+def _ffmpeg_exe():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def _decode_wav(data):
+    """PCM WAV without ffmpeg; None if it's not a format handled here."""
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            width, channels, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+            frames = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width != 2:
+        return None
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE: # Linear resample; fine for speech going into Whisper's mel frontend
+        n = int(round(len(samples) * SAMPLE_RATE / rate))
+        samples = np.interp(np.linspace(0, len(samples) - 1, n), np.arange(len(samples)), samples).astype(np.float32)
+    return samples
+
+
+def decode_audio(data):
+    """Bytes of any ffmpeg-readable file -> 16 kHz mono float32, decoded through pipes."""
+    if data[:4] == b"RIFF":
+        samples = _decode_wav(data)
+        if samples is not None:
+            return samples
+    cmd = [_ffmpeg_exe(), "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+           "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    try:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    except FileNotFoundError as e:
+        raise RuntimeError("FFMPEG dependency missing") from e
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Could not decode audio: {e.stderr.decode(errors='replace').strip()[:200]}") from e
+    return np.frombuffer(out, dtype=np.float32)
+
+
+def speech_segments(samples, min_speech_s=0.25, merge_gap_s=0.4, pad_s=0.2):
+    """
+    Energy-based voice activity: [(start, end), ...] sample ranges that contain speech.
+    A 30 ms frame is speech when its level is VAD_THRESHOLD_DB above the noise floor
+    (10th percentile of frame levels) and above VAD_MIN_SPEECH_DB. Nearby runs are
+    merged, padded, and anything longer than Whisper's 30 s window is split.
+    """
+    frame = int(SAMPLE_RATE * FRAME_S)
+    n = len(samples) // frame
+    if n == 0:
+        return []
+    frames = samples[:n * frame].reshape(n, frame)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    floor = np.percentile(db, 10)
+    voiced = (db > floor + VAD_THRESHOLD_DB) & (db > VAD_MIN_SPEECH_DB)
+    if floor > VAD_MIN_SPEECH_DB + VAD_THRESHOLD_DB: # No quiet part to measure against: all of it is signal
+        voiced = db > VAD_MIN_SPEECH_DB
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]])))
+    runs = [[int(a), int(b)] for a, b in zip(edges[::2], edges[1::2])]
+    merged = []
+    for a, b in runs:
+        if merged and (a - merged[-1][1]) * FRAME_S < merge_gap_s:
+            merged[-1][1] = b
+        else:
+            merged.append([a, b])
+
+    pad = int(pad_s * SAMPLE_RATE)
+    max_len = int(MAX_SEGMENT_S * SAMPLE_RATE)
+    segments = []
+    for a, b in merged:
+        if (b - a) * FRAME_S < min_speech_s:
+            continue
+        start, end = max(0, a * frame - pad), min(len(samples), b * frame + pad)
+        for s in range(start, end, max_len):
+            segments.append((s, min(end, s + max_len)))
+    return segments
@@ -0,0 +1,136 @@
+import re
+import threading
+import numpy as np
+from backend.config import VOICE_STREAM_STEP_S, VOICE_STREAM_WINDOW_S, VOICE_STREAM_MAX_S
+from backend.voice.audio import SAMPLE_RATE, decode_audio, speech_segments
+from backend.voice.transcriber import transcribe_samples
+
+# Incremental transcription for /ws/voice. Audio arrives in chunks while the user
+# speaks; every VOICE_STREAM_STEP_S of new audio the open window (everything since the
+# last finalised point) is re-transcribed. Words two consecutive hypotheses agree on
+# are "stable": Whisper rarely changes them again, so they're safe to search on
+# speculatively. Once the window outgrows VOICE_STREAM_WINDOW_S, the part before its
+# last pause is transcribed for good and dropped, so each step stays bounded.
+
+PCM_FORMATS = {"pcm_s16": "<i2", "pcm_f32": "<f4"}
+
+
+def _norm(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _agreed(a, b):
+    """Length of the common word prefix of two hypotheses (case/punctuation-insensitive)."""
+    n = 0
+    for x, y in zip(a, b):
+        if _norm(x) != _norm(y):
+            break
+        n += 1
+    return n
+
+
+class VoiceStream:
+    """
+    One streaming session. `fmt` is "pcm_s16" / "pcm_f32" (raw little-endian mono at
+    `sample_rate`, e.g. from an AudioWorklet) or anything ffmpeg reads as a growing
+    stream (e.g. MediaRecorder webm/opus chunks), which is re-decoded as a whole:
+    a container stream can't be decoded from the middle, so each step costs O(audio
+    so far) and a session O(n^2) (see VOICE_STREAM_MAX_S). Prefer PCM for long sessions.
+    feed() runs on the socket loop while step()/finish() run in a worker thread (one at a time).
+    """
+
+    def __init__(self, fmt="pcm_s16", sample_rate=SAMPLE_RATE):
+        self.fmt = fmt
+        self.sample_rate = int(sample_rate)
+        self.chunks = [] # PCM: float32 arrays at 16 kHz
+        self.encoded = bytearray() # Compressed: the whole stream so far
+        self.received_s = 0.0 # Estimated for compressed streams until decoded
+        self.offset = 0 # Samples before this are finalised
+        self.stepped_at = 0.0
+        self.committed = [] # Finalised words
+        self.hypothesis = [] # Last transcript of the open window
+        self.stable = 0 # Leading words of `hypothesis` agreed by two passes
+        self._decoded = np.zeros(0, dtype=np.float32)
+        self._partial = b"" # PCM: trailing bytes of a sample split across frames
+        self._lock = threading.Lock() # Guards chunks/encoded between feed() and the stepping thread
+
+    def feed(self, data):
+        if self.fmt in PCM_FORMATS:
+            # Frames needn't end on a sample boundary; carry the odd bytes into the next one
+            data = self._partial + bytes(data)
+            usable = len(data) - len(data) % np.dtype(PCM_FORMATS[self.fmt]).itemsize
+            data, self._partial = data[:usable], data[usable:]
+            pcm = np.frombuffer(data, dtype=PCM_FORMATS[self.fmt]).astype(np.float32)
+            if self.fmt == "pcm_s16":
+                pcm /= 32768.0
+            if self.sample_rate != SAMPLE_RATE and len(pcm):
+                n = int(round(len(pcm) * SAMPLE_RATE / self.sample_rate))
+                pcm = np.interp(np.linspace(0, len(pcm) - 1, n), np.arange(len(pcm)), pcm).astype(np.float32)
+            with self._lock:
+                self.chunks.append(pcm)
+            self.received_s += len(pcm) / SAMPLE_RATE
+        else:
+            with self._lock:
+                self.encoded += data
+            self.received_s = max(self.received_s, len(self.encoded) / 4000) # ~32 kbit/s opus, corrected on decode
+
+    def _samples(self):
+        if self.fmt in PCM_FORMATS:
+            with self._lock:
+                if len(self.chunks) > 1:
+                    self.chunks = [np.concatenate(self.chunks)]
+                return self.chunks[0] if self.chunks else self._decoded
+        with self._lock:
+            encoded = bytes(self.encoded)
+        try:
+            self._decoded = decode_audio(encoded)
+        except ValueError:
+            pass # Cut mid-frame; the next chunk completes it
+        self.received_s = len(self._decoded) / SAMPLE_RATE
+        return self._decoded
+
+    def pending(self):
+        return self.received_s - self.stepped_at >= VOICE_STREAM_STEP_S
+
+    def full(self):
+        return self.received_s >= VOICE_STREAM_MAX_S
+
+    def stable_text(self):
+        return " ".join(self.committed + self.hypothesis[:self.stable])
+
+    def partial_text(self):
+        return " ".join(self.committed + self.hypothesis)
+
+    def step(self):
+        """Re-transcribes the open window. Returns {"partial", "stable"}, or None if neither changed."""
+        samples = self._samples()
+        self.stepped_at = len(samples) / SAMPLE_RATE
+        window = samples[self.offset:]
+        if len(window) > VOICE_STREAM_WINDOW_S * SAMPLE_RATE:
+            self._commit(window)
+            window = samples[self.offset:]
+
+        words = transcribe_samples(window).split()
+        before = (self.partial_text(), self.stable_text())
+        self.stable = _agreed(self.hypothesis, words)
+        self.hypothesis = words
+        after = (self.partial_text(), self.stable_text())
+        if after == before:
+            return None
+        return {"partial": after[0], "stable": after[1]}
+
+    def _commit(self, window):
+        """Finalises the window up to the start of its last speech segment (or all of it but one step)."""
+        segments = speech_segments(window)
+        cut = segments[-1][0] if segments and segments[-1][0] > 0 else len(window) - int(VOICE_STREAM_STEP_S * SAMPLE_RATE)
+        self.committed += transcribe_samples(window[:cut]).split()
+        self.offset += cut
+        self.hypothesis, self.stable = [], 0
+
+    def finish(self):
+        """Final transcript of everything received."""
+        samples = self._samples()
+        self.committed += transcribe_samples(samples[self.offset:]).split()
+        self.offset = len(samples)
+        self.hypothesis, self.stable = [], 0
+        return " ".join(self.committed)
@@ -1,12 +1,13 @@
 
 import os
-import torch
-from transformers import pipeline
-from backend.config import DEVICE
-import imageio_ffmpeg
+from backend.config import get_device, WHISPER_BATCH_SIZE
+from backend.models import workers
+from backend.utils.metrics import timed, timed_model_load
+from backend.utils.tracing import annotate
+from backend.voice.audio import SAMPLE_RATE, decode_audio, speech_segments
 
-# Explicitly add ffmpeg to PATH for subprocesses
-os.environ["PATH"] += os.pathsep + os.path.dirname(imageio_ffmpeg.get_ffmpeg_exe())
+# Audio is decoded in memory (backend.voice.audio, ffmpeg through pipes) and handed to
+# Whisper as raw 16 kHz samples, so the pipeline itself never needs ffmpeg or a file.
 
 # Global pipeline instance to avoid reloading
 _transcriber = None
@@ -20,42 +21,71 @@ def get_transcriber():
             # You can switch to "openai/whisper-base" or "openai/whisper-small" for better accuracy
             model_id = "openai/whisper-tiny"
             
-            _transcriber = pipeline(
-                "automatic-speech-recognition",
-                model=model_id,
-                device=DEVICE if torch.cuda.is_available() else "cpu",
-                chunk_length_s=30,
-            )
+            with timed_model_load("whisper"):
+                from transformers import pipeline
+                _transcriber = pipeline(
+                    "automatic-speech-recognition",
+                    model=model_id,
+                    device=get_device(),
+                    chunk_length_s=30,
+                )
             print("✅ Whisper Model Loaded Successfully")
         except Exception as e:
             print(f"❌ Failed to load Whisper Model: {e}")
             _transcriber = None
     return _transcriber
 
-def transcribe_audio(audio_path: str) -> str:
+def transcribe_audio(audio) -> str:
     """
-    Transcribes audio file to text.
-    supported formats: wav, mp3, flac, etc. (ffmpeg required usually)
+    Transcribes an audio file (path) or upload (bytes) to text.
+    supported formats: wav, mp3, flac, webm, etc. (ffmpeg needed for anything but PCM wav)
+    Only the detected speech goes to Whisper: silence is trimmed and long recordings
+    are cut at pauses into <= 30 s segments, transcribed in one batch.
     """
-    transcriber = get_transcriber()
-    if not transcriber:
-        raise RuntimeError("Transcriber model not initialized")
-
     try:
-        # result is {'text': " transcription..."}
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        if isinstance(audio, str):
+            if not os.path.exists(audio):
+                raise FileNotFoundError(f"Audio file not found: {audio}")
+            with open(audio, "rb") as f:
+                audio = f.read()
 
-        print(f"🎙️ Transcribing: {audio_path}")
-        result = transcriber(audio_path)
-        text = result.get('text', '').strip()
+        with timed("audio_decode"):
+            samples = decode_audio(audio)
+        print(f"🎙️ Transcribing {len(samples) / SAMPLE_RATE:.1f}s of audio...")
+        text = transcribe_samples(samples)
         print(f"🎙️ Transcription Result: '{text}'")
         return text
-    except ValueError as e:
-        if "ffmpeg" in str(e).lower():
-            print("❌ FFMPEG Not Found: Audio transcoding requires ffmpeg.")
-            raise RuntimeError("FFMPEG dependency missing") from e
-        raise e
     except Exception as e:
         print(f"❌ Transcription Error: {e}")
         raise e
+
+def transcribe_samples(samples) -> str:
+    """16 kHz mono float32 -> text, Whisper only over the detected speech ("" if there is none)."""
+    with timed("vad"):
+        segments = speech_segments(samples)
+    speech_s = sum(end - start for start, end in segments) / SAMPLE_RATE
+    annotate(audio_s=round(len(samples) / SAMPLE_RATE, 2), speech_s=round(speech_s, 2), segments=len(segments))
+    if not segments:
+        return ""
+
+    # One contiguous buffer + offsets, so the worker path is a single shared-memory copy
+    import numpy as np
+    speech = np.concatenate([samples[start:end] for start, end in segments])
+    bounds = np.cumsum([0] + [end - start for start, end in segments]).astype(np.int64)
+    if workers.enabled("whisper"):
+        return workers.call("whisper", "backend.voice.transcriber:transcribe_segments", speech, bounds)
+    return transcribe_segments(speech, bounds)
+
+def transcribe_segments(speech, bounds):
+    """
+    16 kHz float32 speech + segment offsets -> joined text, one batched Whisper call
+    (also the whisper inference worker's entry point).
+    """
+    transcriber = get_transcriber()
+    if not transcriber:
+        raise RuntimeError("Transcriber model not initialized")
+    inputs = [{"raw": speech[a:b], "sampling_rate": SAMPLE_RATE} for a, b in zip(bounds[:-1], bounds[1:])]
+    with timed("whisper_transcribe"):
+        # result is [{'text': " transcription..."}, ...], in segment order
+        results = transcriber(inputs, batch_size=min(len(inputs), WHISPER_BATCH_SIZE))
+    return " ".join(r.get("text", "").strip() for r in results if r.get("text", "").strip())
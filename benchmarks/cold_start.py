@@ -0,0 +1,127 @@
+"""
+Cold-start report for the API process.
+
+    python -m benchmarks.cold_start                 # import-time report only
+    python -m benchmarks.cold_start --serve         # + time until /debug/check answers
+
+Runs `python -X importtime -c "import backend.main"` in a fresh interpreter,
+lists the most expensive imports, and fails if any heavy library (torch,
+transformers, ...) is pulled in at import time. With --serve it also launches
+uvicorn (PRELOAD_MODELS empty) and measures how long /debug/check takes to
+become reachable. Exit code is non-zero when a target is missed.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must only load when their subsystem is first used (or preloaded)
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "cv2", "imageio_ffmpeg", "openai")
+
+IMPORT_TARGET_MS = 1500
+READY_TARGET_S = 5.0
+
+
+def _env():
+    env = dict(os.environ)
+    env["PRELOAD_MODELS"] = ""
+    env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_report(module="backend.main"):
+    """Returns {"wall_ms", "self_ms" per top-level package, "heavy": [...]} for a fresh import."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, env=_env(), capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    per_package = {}
+    imported = set()
+    for line in proc.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        self_us = int(parts[0])
+        name = parts[2].strip()
+        top = name.split(".")[0]
+        imported.add(top)
+        per_package[top] = per_package.get(top, 0) + self_us / 1000
+
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(per_package.values()), 1),
+        "top_packages": sorted(((k, round(v, 1)) for k, v in per_package.items()), key=lambda kv: -kv[1])[:15],
+        "heavy": sorted(m for m in HEAVY_MODULES if m in imported),
+    }
+
+
+def time_to_ready(port=8766, timeout_s=120):
+    import requests
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=PROJECT_ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout_s:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Backend exited during startup (code {proc.returncode})")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/debug/check", timeout=1).ok:
+                    return time.perf_counter() - t0
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError(f"/debug/check not reachable after {timeout_s}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve", action="store_true", help="Also measure time until /debug/check answers")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--import-target-ms", type=float, default=IMPORT_TARGET_MS)
+    parser.add_argument("--ready-target-s", type=float, default=READY_TARGET_S)
+    args = parser.parse_args()
+
+    failed = False
+    report = import_report()
+    print(f"📦 import backend.main: {report['wall_ms']:.0f} ms wall, {report['import_ms']:.0f} ms in imports"
+          f" (target {args.import_target_ms:.0f} ms)")
+    for pkg, ms in report["top_packages"]:
+        print(f"   {pkg:<28}{ms:>9.1f} ms")
+    if report["heavy"]:
+        print(f"❌ Heavy libraries imported eagerly: {', '.join(report['heavy'])}")
+        failed = True
+    if report["wall_ms"] > args.import_target_ms:
+        print("❌ Import time above target")
+        failed = True
+
+    if args.serve:
+        ready_s = time_to_ready(args.port)
+        print(f"🚦 /debug/check reachable after {ready_s:.2f}s (target {args.ready_target_s:.1f}s)")
+        if ready_s > args.ready_target_s:
+            print("❌ Time-to-ready above target")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+End-to-end load generator for the FastAPI backend.
+
+    python -m benchmarks.loadgen --concurrency 16 --duration 60 \\
+        --mix text=50,image=25,sketch=10,ocr=10,voice=5 --latency-ms 600 --error-rate 0.05
+
+Starts a local stub chat-completions server (benchmarks/stub_llm.py), launches
+the backend with OPENAI_BASE_URL pointing at it (HF_HUB_OFFLINE=1, so models must
+already be in the local cache), then keeps `--concurrency` requests in flight
+with the given endpoint mix. Use --target to hit an already running backend
+instead (it must have been started against the stub to stay offline).
+
+Reports p50/p95/p99 latency, throughput and error rate per endpoint.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stubs
+from benchmarks.stub_llm import StubLLMServer, add_stub_args, config_from_args
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEXT_QUERIES = ["gold ring", "heart shaped necklace", "diamond solitaire ring", "floral pendant", "silver chain"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def synthetic_wav(seconds=2.0, rate=16000):
+    """A short tone with silence around it; enough to exercise the Whisper path."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        n = int(seconds * rate)
+        frames = b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / rate)) if n // 4 < i < 3 * n // 4 else 0)
+            for i in range(n))
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+class Payloads:
+    def __init__(self, workdir):
+        with open(stubs.write_synthetic_photo(os.path.join(workdir, "photo.jpg")), "rb") as f:
+            self.photo = f.read()
+        with open(stubs.write_synthetic_sketch(os.path.join(workdir, "sketch.png")), "rb") as f:
+            self.sketch = f.read()
+        self.audio = synthetic_wav()
+
+
+def make_requests(base, payloads, timeout=None):
+    """endpoint name -> callable(session) returning a Response"""
+    return {
+        "text": lambda s: s.post(f"{base}/search/text", json={"query": random.choice(TEXT_QUERIES), "top_k": 30},
+                                 timeout=timeout),
+        "image": lambda s: s.post(f"{base}/search/image", files={"file": ("photo.jpg", payloads.photo, "image/jpeg")},
+                                  timeout=timeout),
+        "sketch": lambda s: s.post(f"{base}/search/sketch", files={"file": ("sketch.png", payloads.sketch, "image/png")},
+                                   timeout=timeout),
+        "ocr": lambda s: s.post(f"{base}/ocr/read", files={"file": ("note.png", payloads.sketch, "image/png")},
+                                data={"mode": "standard"}, timeout=timeout),
+        "ocr_llm": lambda s: s.post(f"{base}/ocr/read", files={"file": ("note.png", payloads.sketch, "image/png")},
+                                    data={"mode": "llm"}, timeout=timeout),
+        "voice": lambda s: s.post(f"{base}/voice/transcribe", files={"file": ("clip.wav", payloads.audio, "audio/wav")},
+                                  timeout=timeout),
+        "check": lambda s: s.get(f"{base}/debug/check", timeout=timeout),
+    }
+
+
+def parse_mix(spec, available):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in available:
+            raise SystemExit(f"Unknown endpoint '{name}' in --mix (choose from {', '.join(available)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, name, ms, ok, status):
+        with self.lock:
+            rec = self.samples.setdefault(name, {"lat": [], "errors": 0, "status": {}})
+            rec["lat"].append(ms)
+            rec["status"][status] = rec["status"].get(status, 0) + 1
+            if not ok:
+                rec["errors"] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        for name, rec in sorted(self.samples.items()):
+            lat = sorted(rec["lat"])
+            n = len(lat)
+            rows[name] = {
+                "requests": n,
+                "throughput_rps": round(n / elapsed, 2),
+                "error_rate": round(rec["errors"] / n, 4) if n else 0.0,
+                "p50_ms": round(percentile(lat, 50), 1),
+                "p95_ms": round(percentile(lat, 95), 1),
+                "p99_ms": round(percentile(lat, 99), 1),
+                "status": rec["status"],
+            }
+        return rows
+
+
+def run_load(base, mix, concurrency, duration, timeout, payloads):
+    calls = make_requests(base, payloads, timeout)
+    names, weights = zip(*mix.items())
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                res = calls[name](session)
+                status = res.status_code
+                ok = res.ok
+            except requests.RequestException as e:
+                status, ok = type(e).__name__, False
+            recorder.add(name, (time.perf_counter() - t0) * 1000, ok, status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return recorder.report(elapsed), elapsed
+
+
+def wait_until_ready(base, proc, timeout_s):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"Backend exited during startup (code {proc.returncode})")
+        try:
+            if requests.get(f"{base}/debug/check", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise SystemExit(f"Backend not ready after {timeout_s}s")
+
+
+def launch_backend(port, llm_base_url, extra_env):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": llm_base_url,
+        "OPENAI_API_KEY": "stub-key",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+    })
+    env.update(extra_env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=PROJECT_ROOT, env=env,
+    )
+
+
+def print_report(rows, elapsed, stub):
+    print(f"\n⏱️  {elapsed:.1f}s  |  stub LLM calls: {stub.requests if stub else '-'}")
+    print(f"{'endpoint':<10}{'reqs':>7}{'rps':>8}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 63)
+    for name, r in rows.items():
+        print(f"{name:<10}{r['requests']:>7}{r['throughput_rps']:>8.2f}{r['error_rate'] * 100:>7.1f}%"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="Existing backend base URL (skip launching one)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the launched backend")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load after warmup")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load discarded before measuring")
+    parser.add_argument("--mix", default="text=50,image=25,sketch=10,ocr=10,voice=5")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--env", action="append", default=[], help="Extra KEY=VALUE for the launched backend")
+    parser.add_argument("--output", help="Write the per-endpoint report as JSON")
+    add_stub_args(parser)
+    args = parser.parse_args()
+
+    stub = StubLLMServer(config_from_args(args)).start()
+    print(f"🤖 Stub LLM on {stub.base_url}")
+    proc = None
+    base = args.target
+    if not base:
+        base = f"http://127.0.0.1:{args.port}"
+        extra_env = dict(e.split("=", 1) for e in args.env)
+        proc = launch_backend(args.port, stub.base_url, extra_env)
+    try:
+        wait_until_ready(base, proc, args.startup_timeout)
+        with tempfile.TemporaryDirectory() as workdir:
+            payloads = Payloads(workdir)
+        mix = parse_mix(args.mix, make_requests(base, payloads))
+
+        if args.warmup > 0:
+            print(f"🔥 Warmup {args.warmup:.0f}s...")
+            run_load(base, mix, args.concurrency, args.warmup, args.request_timeout, payloads)
+        print(f"🚀 {args.concurrency} concurrent clients for {args.duration:.0f}s, mix {mix}")
+        rows, elapsed = run_load(base, mix, args.concurrency, args.duration, args.request_timeout, payloads)
+        print_report(rows, elapsed, stub.config)
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"concurrency": args.concurrency, "duration_s": elapsed, "mix": mix,
+                           "stub": {"latency_ms": args.latency_ms, "jitter": args.jitter,
+                                    "error_rate": args.error_rate, "timeout_rate": args.timeout_rate},
+                           "endpoints": rows}, f, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
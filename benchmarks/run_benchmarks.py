@@ -0,0 +1,209 @@
+"""
+Offline micro-benchmarks for every retrieval stage.
+
+    python -m benchmarks.run_benchmarks                      # compare against baseline.json (must exist)
+    python -m benchmarks.run_benchmarks --sizes 1000,1000000 # include a 1M-vector catalogue
+    python -m benchmarks.run_benchmarks --update-baseline    # record a new baseline (machine + settings included)
+
+Uses tiny randomly initialised CLIP / cross-encoder stand-ins and synthetic
+catalogues (see benchmarks/stubs.py), so no network, GPU or real index is needed.
+Absolute numbers are only comparable on the same machine; the baseline exists so
+that a regression in any single stage shows up as a ratio.
+Also checks fast preprocessing against CLIPImageProcessor and exits non-zero if
+it drifts past fast_preprocess.PARITY_MEAN_TOLERANCE.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stubs
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+QUERY = "heart shaped gold ring with ruby"
+
+
+def time_stage(fn, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "min_ms": round(samples[0], 4),
+        "repeats": repeats,
+    }
+
+
+def model_stages(repeats, workdir):
+    """Stages that don't depend on catalogue size."""
+    from PIL import Image
+    from backend.models.clip import get_text_embedding, get_image_embedding
+    from backend.utils.reranker import rerank_results
+    from backend.utils.sketch_utils import photo_to_sketch_database, preprocess_sketch
+
+    photo_path = stubs.write_synthetic_photo(os.path.join(workdir, "photo.jpg"))
+    sketch_path = stubs.write_synthetic_sketch(os.path.join(workdir, "sketch.png"))
+    photos = [Image.open(photo_path).convert("RGB")] * 32
+    candidates = stubs.synthetic_metadata(80)
+
+    def rerank():
+        # rerank_results mutates its input, give it fresh dicts every run
+        rerank_results(QUERY, [c.copy() for c in candidates], top_k=30)
+
+    return {
+        "get_text_embedding": time_stage(lambda: get_text_embedding(QUERY), repeats),
+        "get_image_embedding[32]": time_stage(lambda: get_image_embedding(photos), max(3, repeats // 4)),
+        "rerank_results[80]": time_stage(rerank, repeats),
+        "photo_to_sketch_database": time_stage(lambda: photo_to_sketch_database(photo_path), repeats),
+        "preprocess_sketch": time_stage(lambda: preprocess_sketch(sketch_path), repeats),
+    }
+
+
+def preprocess_parity(workdir):
+    """
+    Fast preprocessing vs a real CLIPImageProcessor (default config = CLIP ViT-B/32, no download).
+    The stub processor routes images through fast_preprocess itself, so it can't be the reference.
+    """
+    from transformers import CLIPImageProcessor
+    from backend.models.fast_preprocess import diff_vs_processor, PARITY_MEAN_TOLERANCE
+
+    paths = [stubs.write_synthetic_photo(os.path.join(workdir, f"parity_{i}.jpg"), size=size, seed=i)
+             for i, size in enumerate((300, 800, 1600))]
+    max_abs, mean_abs = diff_vs_processor(paths, CLIPImageProcessor())
+    ok = mean_abs <= PARITY_MEAN_TOLERANCE
+    print(f"{'✅' if ok else '⚠️'} Preprocess parity vs CLIPImageProcessor: mean {mean_abs:.4f} "
+          f"(tolerance {PARITY_MEAN_TOLERANCE}), max {max_abs:.4f}")
+    return {"max_abs": round(max_abs, 4), "mean_abs": round(mean_abs, 4),
+            "tolerance": PARITY_MEAN_TOLERANCE, "ok": ok}
+
+
+def catalogue_stages(n, repeats):
+    """Stages that scale with catalogue size."""
+    import numpy as np
+    from backend.search import image_search, index_store
+
+    stubs.install_catalogue(n)
+    query_emb = stubs.random_unit_vectors(1, seed=42)[0]
+    q = query_emb.reshape(1, -1)
+    v_scores, v_indices = image_search.index.search(q, 50)
+
+    results = {
+        f"index.search@{n}": time_stage(lambda: image_search.index.search(q, 50), repeats),
+        f"caption_fusion@{n}": time_stage(
+            lambda: image_search.caption_fusion(query_emb, v_scores[0], v_indices[0]), repeats),
+    }
+
+    # Same catalogue as 4 in-process shards (SHARDED_SEARCH=local): fan-out + merge overhead
+    from backend.search.sharding import split_bundle
+    sharded = split_bundle(index_store.current(), 4)
+    results[f"sharded[4].search@{n}"] = time_stage(lambda: sharded.index.search(q, 50), repeats)
+    results[f"sharded[4].caption_fusion@{n}"] = time_stage(
+        lambda: image_search.caption_fusion(query_emb, v_scores[0], v_indices[0], bundle=sharded), repeats)
+    del sharded
+    # Drop the catalogue before building the next (1M x 512 float32 is ~2 GB per copy)
+    index_store.swap(index_store.IndexBundle(None, None, np.zeros((0, stubs.EMBED_DIM), dtype="float32"), []))
+    return results
+
+
+def cold_start_stages(repeats=3):
+    """Fresh-interpreter `import backend.main` (see benchmarks/cold_start.py)."""
+    from benchmarks.cold_start import import_report
+    walls = sorted(import_report()["wall_ms"] for _ in range(repeats))
+    return {"import backend.main": {"median_ms": walls[len(walls) // 2], "p95_ms": walls[-1],
+                                    "min_ms": walls[0], "repeats": repeats}}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'stage':<32}{'median ms':>12}{'baseline':>12}{'ratio':>9}")
+    print("-" * 65)
+    for stage, r in results.items():
+        base = baseline.get("stages", {}).get(stage)
+        if base and base["median_ms"] > 0:
+            ratio = r["median_ms"] / base["median_ms"]
+            flag = "  ⚠️ REGRESSION" if ratio > threshold else ""
+            print(f"{stage:<32}{r['median_ms']:>12.3f}{base['median_ms']:>12.3f}{ratio:>8.2f}x{flag}")
+            if ratio > threshold:
+                regressions.append((stage, ratio))
+        else:
+            print(f"{stage:<32}{r['median_ms']:>12.3f}{'-':>12}{'-':>9}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated catalogue sizes")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Flag stages slower than baseline x this")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    parser.add_argument("--skip-import", action="store_true", help="Skip the cold-start import stage")
+    args = parser.parse_args()
+    # Never bootstrap a baseline implicitly: a first run would compare against itself and flag nothing
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        parser.error(f"No baseline at {args.baseline}; record one on this machine with --update-baseline")
+
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+    stubs.install_models()
+
+    results = {}
+    if not args.skip_import:
+        results.update(cold_start_stages())
+    with tempfile.TemporaryDirectory() as workdir:
+        results.update(model_stages(args.repeats, workdir))
+        parity = preprocess_parity(workdir)
+    for n in (int(s) for s in args.sizes.split(",") if s):
+        print(f"📦 Catalogue of {n:,} vectors...")
+        results.update(catalogue_stages(n, args.repeats))
+
+    run = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "torch_threads": torch.get_num_threads()},
+        "settings": {"sizes": args.sizes, "repeats": args.repeats, "skip_import": args.skip_import},
+        "stages": results,
+        "preprocess_parity": parity,
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != run["machine"] or baseline.get("settings", run["settings"]) != run["settings"]:
+            print(f"⚠️ Baseline was recorded with {baseline.get('machine')} / {baseline.get('settings')}; "
+                  "ratios may not mean much")
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\n💾 Baseline written to {args.baseline}")
+
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} stage(s) slower than {args.threshold}x baseline")
+    # Embedding drift is a correctness problem, not a timing one: always fail on it
+    if not parity["ok"]:
+        print("\n⚠️ Fast preprocessing drifted past tolerance from CLIPImageProcessor")
+        sys.exit(1)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Local stub of an OpenAI-compatible chat-completions server.
+
+    python -m benchmarks.stub_llm --port 8900 --latency-ms 400 --jitter 0.5 --error-rate 0.02
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1.
+Latency is log-normal around --latency-ms (sigma = --jitter); a fraction of
+requests fail with HTTP 500 (--error-rate) or hang past the client timeout
+(--timeout-rate). Responses are canned JSON shaped like what captioning.py and
+ocr_pipeline.py expect, so the full parsing path is exercised.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SKETCH_REPLY = {"type": "Ring", "description": "heart shaped gold ring with a small diamond"}
+OCR_REPLY = {"product_type": "ring", "cleaned_query": "gold ring with ruby"}
+
+
+class StubConfig:
+    def __init__(self, latency_ms=400.0, jitter=0.5, error_rate=0.0, timeout_rate=0.0, hang_s=60.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_s = hang_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def draw(self):
+        """Returns (delay_seconds, outcome) where outcome is 'ok' | 'error' | 'hang'."""
+        with self.lock:
+            self.requests += 1
+            u = self.rng.random()
+            delay = self.latency_ms / 1000 * self.rng.lognormvariate(0, self.jitter) if self.jitter else self.latency_ms / 1000
+            if u < self.error_rate:
+                self.errors += 1
+                return delay, "error"
+            if u < self.error_rate + self.timeout_rate:
+                return self.hang_s, "hang"
+            return delay, "ok"
+
+
+def _reply_for(body):
+    text = json.dumps(body.get("messages", []))
+    reply = SKETCH_REPLY if "sketch" in text.lower() else OCR_REPLY
+    return f"```json\n{json.dumps(reply)}\n```"
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass # Keep the load-test output readable
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass # Client gave up (timeout, or the losing half of a hedged request)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                return self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+
+            delay, outcome = config.draw()
+            time.sleep(delay)
+            if outcome == "error":
+                return self._send(500, {"error": {"message": "stub injected failure", "type": "server_error"}})
+
+            self._send(200, {
+                "id": f"chatcmpl-stub-{config.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": _reply_for(body)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+    return Handler
+
+
+class StubLLMServer:
+    """Runs the stub in a background thread: `with StubLLMServer(cfg) as s: s.base_url`"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_stub_args(parser):
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Median stub LLM latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Log-normal sigma of stub latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls returning HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of stub calls that hang")
+
+
+def config_from_args(args):
+    return StubConfig(args.latency_ms, args.jitter, args.error_rate, args.timeout_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_args(parser)
+    args = parser.parse_args()
+
+    server = StubLLMServer(config_from_args(args), args.host, args.port)
+    print(f"🤖 Stub LLM listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
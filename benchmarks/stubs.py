@@ -0,0 +1,166 @@
+"""
+Offline stand-ins for the benchmark suite.
+
+Tiny randomly initialised CLIP / cross-encoder models with the same call
+signatures as the real ones, plus a synthetic catalogue of N unit vectors.
+Nothing here touches the network or the real indexes on disk.
+"""
+import os
+import zlib
+import numpy as np
+import torch
+import faiss
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+EMBED_DIM = 512
+VOCAB_SIZE = 1000
+PAD_ID, BOS_ID, EOS_ID = 0, 1, VOCAB_SIZE - 1
+
+CAPTION_WORDS = [
+    "gold", "silver", "diamond", "ruby", "emerald", "heart", "flower", "geometric",
+    "ring", "necklace", "pendant", "chain", "band", "solitaire", "floral", "vintage",
+    "rose", "platinum", "pearl", "twisted", "layered", "halo", "oval", "round",
+]
+
+
+def _token_id(word):
+    # Stable across runs (unlike hash()), never collides with PAD/BOS/EOS
+    return 2 + zlib.crc32(word.lower().encode()) % (VOCAB_SIZE - 3)
+
+
+class TinyClipProcessor:
+    """Minimal CLIPProcessor look-alike: hashed word tokenizer + fast image path."""
+
+    def __call__(self, text=None, images=None, return_tensors="pt", padding=True, truncation=True):
+        out = {}
+        if text is not None:
+            texts = text if isinstance(text, list) else [text]
+            ids = [[BOS_ID] + [_token_id(w) for w in t.split()][:75] + [EOS_ID] for t in texts]
+            width = max(len(i) for i in ids)
+            out["input_ids"] = torch.tensor([i + [PAD_ID] * (width - len(i)) for i in ids])
+            out["attention_mask"] = torch.tensor([[1] * len(i) + [0] * (width - len(i)) for i in ids])
+        if images is not None:
+            from backend.models.fast_preprocess import preprocess_batch
+            imgs = images if isinstance(images, list) else [images]
+            out["pixel_values"] = preprocess_batch(imgs, device="cpu")
+        return out
+
+
+def make_tiny_clip():
+    from transformers import CLIPConfig, CLIPModel
+    torch.manual_seed(0)
+    config = CLIPConfig(
+        text_config=dict(
+            vocab_size=VOCAB_SIZE, hidden_size=32, intermediate_size=64,
+            num_hidden_layers=2, num_attention_heads=2, max_position_embeddings=77,
+            pad_token_id=PAD_ID, bos_token_id=BOS_ID, eos_token_id=EOS_ID,
+        ),
+        vision_config=dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=2, image_size=224, patch_size=32,
+        ),
+        projection_dim=EMBED_DIM,
+    )
+    return CLIPModel(config).eval(), TinyClipProcessor()
+
+
+class TinyCrossEncoder(torch.nn.Module):
+    """Bag-of-hashed-words scorer with the CrossEncoder.predict() signature."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.emb = torch.nn.EmbeddingBag(VOCAB_SIZE, 64, mode="mean")
+        self.head = torch.nn.Sequential(torch.nn.Linear(128, 64), torch.nn.ReLU(), torch.nn.Linear(64, 1))
+        self.eval()
+
+    def _bag(self, texts):
+        ids, offsets = [], []
+        for t in texts:
+            offsets.append(len(ids))
+            ids.extend(_token_id(w) for w in (t.split() or [""]))
+        return self.emb(torch.tensor(ids), torch.tensor(offsets))
+
+    @torch.no_grad()
+    def predict(self, pairs, **kwargs):
+        if not len(pairs):
+            return np.zeros(0, dtype=np.float32)
+        q = self._bag([p[0] for p in pairs])
+        d = self._bag([p[1] for p in pairs])
+        return self.head(torch.cat([q, d], dim=1)).squeeze(1).numpy()
+
+
+def install_models():
+    """Swaps the tiny models into the backend's lazy-loaded globals."""
+    from backend.models import clip
+    from backend.utils import reranker
+    clip.model, clip.processor = make_tiny_clip()
+    reranker.reranker_model = TinyCrossEncoder()
+
+
+def random_unit_vectors(n, dim=EMBED_DIM, seed=0, chunk=100_000):
+    rng = np.random.default_rng(seed)
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, chunk):
+        block = rng.standard_normal((min(chunk, n - i), dim), dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[i:i + len(block)] = block
+    return out
+
+
+def synthetic_metadata(n, seed=0):
+    rng = np.random.default_rng(seed)
+    meta = []
+    for i in range(n):
+        category = "ring" if i % 2 else "necklace"
+        words = rng.choice(CAPTION_WORDS, size=6).tolist()
+        meta.append({
+            "image_path": f"/synthetic/{category}/{category}_{i}.jpg",
+            "category": category,
+            "id": f"{category}_{i}.jpg",
+            "caption": f"a photograph of a {category}, " + " ".join(words),
+        })
+    return meta
+
+
+def install_catalogue(n, seed=0):
+    """Makes an in-memory synthetic catalogue of n items the live index bundle."""
+    from backend.search.index_store import IndexBundle, swap
+    photo = random_unit_vectors(n, seed=seed)
+    sketch = random_unit_vectors(n, seed=seed + 1)
+    captions = random_unit_vectors(n, seed=seed + 2)
+
+    index = faiss.IndexFlatIP(EMBED_DIM)
+    index.add(photo)
+    sketch_index = faiss.IndexFlatIP(EMBED_DIM)
+    sketch_index.add(sketch)
+
+    meta = synthetic_metadata(n, seed=seed)
+    swap(IndexBundle(index, sketch_index, captions, meta, source=f"synthetic:{n}"))
+    return meta
+
+
+def write_synthetic_photo(path, size=800, seed=0):
+    """A jewellery-ish test photo: bright background, metallic ring + stone."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), 235, dtype=np.uint8)
+    img += rng.integers(0, 15, img.shape, dtype=np.uint8)
+    c = size // 2
+    cv2.circle(img, (c, c), size // 4, (40, 160, 210), thickness=size // 20)
+    cv2.circle(img, (c, c - size // 4), size // 14, (60, 40, 200), thickness=-1)
+    cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return path
+
+
+def write_synthetic_sketch(path, size=600):
+    """Dark pencil lines on white paper, like a phone photo of a drawing."""
+    import cv2
+    img = np.full((size, size), 250, dtype=np.uint8)
+    c = size // 2
+    cv2.circle(img, (c, c), size // 4, 30, thickness=4)
+    cv2.ellipse(img, (c, c - size // 4), (size // 10, size // 14), 0, 0, 360, 30, 3)
+    cv2.imwrite(path, img)
+    return path
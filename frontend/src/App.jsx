@@ -743,7 +743,8 @@ function App() {
                       <div className="aspect-[3/4] overflow-hidden bg-white mb-4 relative shadow-[0_10px_30px_-10px_rgba(0,0,0,0.05)] border border-neutral-100 group-hover:shadow-[0_20px_40px_-15px_rgba(0,0,0,0.1)] transition-all duration-500 rounded-lg">
                         <div className="w-full h-full p-8 flex items-center justify-center">
                           <img
-                            src={item.image_path}
+                            src={item.thumbnail_url || item.image_path}
+                            loading="lazy"
                             alt={item.caption || "Jewellery Item"}
                             className="max-w-full max-h-full object-contain transition-transform duration-700 group-hover:scale-110"
                             onError={(e) => {
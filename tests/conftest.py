@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Same as benchmarks/: run from anywhere without installing the backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
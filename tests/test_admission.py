@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from backend.utils import admission, deadline
+
+
+@pytest.fixture
+def idle(monkeypatch):
+    """One global slot, one slot per class, queue of one per class, nothing running."""
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_ACTIVE", 1)
+    monkeypatch.setattr(admission, "QUEUE_PER_SLOT", 1)
+    monkeypatch.setattr(admission, "_classes",
+                        {name: admission._Class(name, 1, 1.0) for name in ("visual", "text", "sketch")})
+    monkeypatch.setattr(admission, "_active", 0)
+    monkeypatch.setattr(admission, "_waiters", [])
+
+
+async def _hold(name, release):
+    async with admission.admit(name):
+        await release.wait()
+
+
+def test_freed_slot_goes_to_best_priority(idle):
+    order = []
+
+    async def wait_for_slot(name):
+        async with admission.admit(name):
+            order.append(name)
+
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold("sketch", release))
+        await asyncio.sleep(0)
+        # Queued worst priority first
+        waiters = [asyncio.create_task(wait_for_slot(n)) for n in ("sketch", "text", "visual")]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(holder, *waiters)
+
+    asyncio.run(main())
+    assert order == ["visual", "text", "sketch"]
+    assert admission._active == 0
+
+
+def test_full_queue_is_rejected_with_429(idle):
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold("text", release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(_hold("text", release))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Rejected) as e:
+            async with admission.admit("text"):
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+        return e.value
+
+    rejected = asyncio.run(main())
+    assert (rejected.status, rejected.reason) == (429, "queue_full")
+    assert rejected.retry_after >= 1
+
+
+def test_wait_past_budget_is_rejected_with_503(idle, monkeypatch):
+    monkeypatch.setattr(admission._classes["visual"], "wait_s", 0.05)
+
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold("visual", release))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Rejected) as e:
+            async with admission.admit("visual"):
+                pass
+        release.set()
+        await holder
+        return e.value
+
+    rejected = asyncio.run(main())
+    assert (rejected.status, rejected.reason) == (503, "wait_timeout")
+    c = admission._classes["visual"]
+    assert (c.waiting, c.active, admission._active) == (0, 0, 0)
+
+
+def test_wait_never_outlives_the_request_deadline(idle):
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold("sketch", release))
+        await asyncio.sleep(0)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        with deadline.scope(0.05), pytest.raises(admission.Rejected):
+            async with admission.admit("sketch"): # class wait budget is 1 s
+                pass
+        waited = loop.time() - t0
+        release.set()
+        await holder
+        return waited
+
+    assert asyncio.run(main()) < 0.5
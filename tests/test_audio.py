@@ -0,0 +1,34 @@
+import numpy as np
+from backend.voice.audio import SAMPLE_RATE, MAX_SEGMENT_S, speech_segments
+
+
+def _clip(*parts):
+    """(seconds, amplitude) pieces: amplitude 0 is faint noise, anything else a 220 Hz tone."""
+    rng = np.random.default_rng(0)
+    out = []
+    for seconds, amp in parts:
+        n = int(seconds * SAMPLE_RATE)
+        noise = rng.standard_normal(n).astype(np.float32) * 1e-4
+        out.append(noise + amp * np.sin(2 * np.pi * 220 * np.arange(n) / SAMPLE_RATE).astype(np.float32))
+    return np.concatenate(out)
+
+
+def test_finds_speech_between_silences():
+    segments = speech_segments(_clip((1.0, 0), (1.0, 0.3), (1.0, 0)))
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert 0.7 * SAMPLE_RATE <= start <= 1.0 * SAMPLE_RATE
+    assert 2.0 * SAMPLE_RATE <= end <= 2.3 * SAMPLE_RATE
+
+
+def test_silence_and_blips_are_dropped():
+    assert speech_segments(_clip((2.0, 0))) == []
+    assert speech_segments(_clip((1.0, 0), (0.06, 0.3), (1.0, 0))) == [] # Shorter than min_speech_s
+    assert speech_segments(np.zeros(10, dtype=np.float32)) == []
+
+
+def test_long_speech_is_split_to_whisper_windows():
+    segments = speech_segments(_clip((0.5, 0), (70.0, 0.3), (0.5, 0)))
+    assert len(segments) == 3
+    assert all(end - start <= MAX_SEGMENT_S * SAMPLE_RATE for start, end in segments)
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
@@ -0,0 +1,38 @@
+import time
+import pytest
+from backend.utils import deadline
+
+
+def test_no_deadline_allows_everything():
+    assert deadline.remaining() is None
+    assert deadline.allows("rerank", reserve=1e9)
+    assert deadline.timeout(20.0) == 20.0
+    assert deadline.degraded() == []
+
+
+def test_stages_that_dont_fit_are_skipped_and_listed(monkeypatch):
+    monkeypatch.setattr(deadline, "DEADLINE_STAGE_S", {"rerank": 0.2, "llm": 5.0})
+    with deadline.scope(1.0) as d:
+        assert deadline.allows("rerank")
+        assert not deadline.allows("llm")
+        assert not deadline.allows("llm") # Listed once
+        assert not deadline.allows("rerank", reserve=2.0)
+        assert d.degraded == ["llm", "rerank"]
+    assert deadline.remaining() is None # Scope restored
+
+
+def test_timeout_is_capped_to_what_is_left():
+    with deadline.scope(2.0):
+        assert 1.0 < deadline.timeout(20.0, reserve=0.5) <= 1.5
+    with deadline.scope(0.01):
+        time.sleep(0.02)
+        assert deadline.timeout(20.0) == 0.5 # Floor
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, 4000), ("", 4000), ("soon", 4000),
+    ("nan", 4000), ("inf", 4000), ("-inf", 4000),
+    ("250", 250.0), ("0", 1.0), ("-5", 1.0), ("1e9", 30000),
+])
+def test_header_budget(header, expected):
+    assert deadline.header_budget_ms(header, 4000, 30000) == expected
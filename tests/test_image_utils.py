@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import cv2
+from backend.utils.image_utils import compute_skew_angle, rotate_image, segment_lines, crop_columns, deskew
+
+LINES = ["gold ring with ruby", "size 7 please", "engraved heart", "white gold band"]
+
+
+def _note(n=4, w=900, h=700):
+    """White page with `n` lines of script text; returns it and each line's baseline row."""
+    img = np.full((h, w), 255, dtype=np.uint8)
+    baselines = [120 + i * 140 for i in range(n)]
+    for text, y in zip(LINES, baselines):
+        cv2.putText(img, text, (60, y), cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, 2.0, 0, 4)
+    return img, baselines
+
+
+@pytest.mark.parametrize("angle", [-9.0, -7.3, -6.0, -2.5, 0.0, 1.1, 4.6, 6.0, 8.5, 9.0])
+def test_skew_is_recovered_within_a_fifth_of_a_degree(angle):
+    note, _ = _note()
+    assert abs(compute_skew_angle(rotate_image(note, -angle)) - angle) <= 0.2
+
+
+def test_blank_page_has_no_skew():
+    assert compute_skew_angle(np.full((300, 400), 255, dtype=np.uint8)) == 0.0
+
+
+def test_one_span_per_text_line():
+    note, baselines = _note()
+    lines = segment_lines(note)
+    assert len(lines) == len(baselines)
+    for (top, bottom), y in zip(lines, baselines):
+        assert top < y <= bottom
+
+
+def test_lines_survive_deskew():
+    note, baselines = _note()
+    assert len(segment_lines(deskew(rotate_image(note, -7.0)))) == len(baselines)
+
+
+def test_blank_page_is_one_span():
+    assert segment_lines(np.full((300, 400), 255, dtype=np.uint8)) == [(0, 300)]
+
+
+def test_crop_columns_trims_side_margins():
+    note, _ = _note(n=1)
+    line = note[60:140]
+    cropped = crop_columns(line, pad=8)
+    assert cropped.shape[0] == line.shape[0]
+    assert cropped.shape[1] < line.shape[1] - 100
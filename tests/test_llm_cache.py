@@ -0,0 +1,68 @@
+import itertools
+import threading
+import time
+import pytest
+from backend.utils import llm_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_local", threading.local()) # Fresh connection per test
+    monkeypatch.setattr(llm_cache, "_puts", itertools.count(2)) # No prune on the first put
+    return llm_cache
+
+
+def test_round_trip_and_content_addressing(cache):
+    k = cache.key("ocr", 1, "gold rnig")
+    assert cache.get(k, "ocr") is None
+    cache.put(k, "ocr", {"cleaned_query": "gold ring"})
+    assert cache.get(k, "ocr") == {"cleaned_query": "gold ring"}
+    assert cache.key("ocr", 2, "gold rnig") != k # Template version bump = new address
+    assert cache.key("ocr", 1, b"gold rnig") == k
+
+
+def test_expired_entries_are_misses_and_deleted(cache, monkeypatch):
+    k = cache.key("sketch", 1, b"png bytes")
+    cache.put(k, "sketch", {"type": "Ring"})
+    monkeypatch.setattr(cache, "LLM_CACHE_TTL_S", -1.0)
+    assert cache.get(k, "sketch") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_prune_drops_least_recently_used_past_the_size_limit(cache, monkeypatch):
+    value = "x" * 100 # 102 bytes as JSON
+    for name in "abc":
+        cache.put(name, "ocr", value)
+        time.sleep(0.002)
+    cache.get("a", "ocr") # a is now the most recently used
+    time.sleep(0.002)
+    cache.put("d", "ocr", value)
+    monkeypatch.setattr(cache, "LLM_CACHE_MAX_MB", 3 * 102 / (1024 * 1024))
+    cache.prune()
+    assert [cache.get(n, "ocr") is not None for n in "abcd"] == [True, False, True, True]
+
+
+def test_unreadable_row_is_a_miss_and_goes(cache):
+    cache.put("k", "ocr", {"ok": True})
+    cache._db().execute("UPDATE llm_cache SET value = '{not json' WHERE key = 'k'")
+    assert cache.get("k", "ocr") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_prune_cadence_holds_across_threads(cache, monkeypatch):
+    pruned = []
+    monkeypatch.setattr(cache, "_puts", itertools.count(1))
+    monkeypatch.setattr(cache, "prune", lambda: pruned.append(1))
+
+    def writer(t):
+        for i in range(50):
+            cache.put(f"{t}-{i}", "ocr", i)
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(pruned) == 400 // cache._PRUNE_EVERY
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import pytest
+from benchmarks.stub_llm import StubConfig, StubLLMServer
+from backend.utils import llm_client
+
+pytest.importorskip("openai")
+
+MESSAGES = [{"role": "user", "content": "clean up: gold rnig with rubby"}]
+
+
+class Scripted(StubConfig):
+    """Plays back (delay_s, outcome) for the first requests, fast successes after that."""
+
+    def __init__(self, *script):
+        super().__init__(latency_ms=50, jitter=0)
+        self.script = list(script)
+
+    def draw(self):
+        with self.lock:
+            self.requests += 1
+            return self.script.pop(0) if self.script else (0.05, "ok")
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(config):
+        server = StubLLMServer(config).start()
+        servers.append(server)
+        llm_client.configure(base_url=server.base_url, api_key="stub")
+        return server
+
+    yield start
+    llm_client.close()
+    for server in servers:
+        server.stop()
+
+
+def _run(*calls):
+    """Runs achat() coroutines together on the client's loop; exceptions come back as values."""
+    async def together():
+        return await asyncio.gather(*calls, return_exceptions=True)
+    return asyncio.run_coroutine_threadsafe(together(), llm_client._get_loop()).result()
+
+
+def test_identical_calls_share_one_upstream_request(stub):
+    server = stub(Scripted((0.3, "ok")))
+    results = _run(*[llm_client.achat(model="stub", messages=MESSAGES, timeout=5) for _ in range(5)])
+    assert all(not isinstance(r, Exception) for r in results)
+    assert server.config.requests == 1
+
+    _run(llm_client.achat(model="stub", messages=MESSAGES + [{"role": "user", "content": "x"}], timeout=5))
+    assert server.config.requests == 2 # Different request, its own call
+
+
+def test_caller_with_more_time_does_not_join_a_nearly_expired_call(stub):
+    server = stub(Scripted((0.4, "ok"), (0.4, "ok")))
+    hurried, patient = _run(llm_client.achat(model="stub", messages=MESSAGES, timeout=0.1),
+                            llm_client.achat(model="stub", messages=MESSAGES, timeout=5))
+    assert isinstance(hurried, (TimeoutError, asyncio.TimeoutError))
+    assert not isinstance(patient, Exception)
+    assert server.config.requests == 2
+
+
+def test_transient_errors_are_retried(stub):
+    server = stub(Scripted((0.01, "error")))
+    result, = _run(llm_client.achat(model="stub", messages=MESSAGES, timeout=10))
+    assert "cleaned_query" in result.choices[0].message.content
+    assert server.config.requests == 2
+
+
+def test_retries_stop_after_llm_retries(stub):
+    import openai
+    server = stub(Scripted(*[(0.01, "error")] * 10))
+    error, = _run(llm_client.achat(model="stub", messages=MESSAGES, timeout=10))
+    assert isinstance(error, openai.InternalServerError)
+    assert server.config.requests == 1 + llm_client.LLM_RETRIES
+
+
+def test_slow_call_is_hedged(stub, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_MS", 100)
+    server = stub(Scripted((3.0, "ok")))
+    t0 = time.perf_counter()
+    result, = _run(llm_client.achat(model="stub", messages=MESSAGES, timeout=10))
+    assert not isinstance(result, Exception)
+    assert time.perf_counter() - t0 < 1.5 # The hedge answered, not the 3 s original
+    assert server.config.requests == 2
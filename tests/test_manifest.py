@@ -0,0 +1,43 @@
+import functools
+import os
+import pytest
+from PIL import Image
+from backend.search import manifest
+
+
+@pytest.fixture
+def catalogue(tmp_path, monkeypatch):
+    """data/rings with three images, an index dir with one file, and a counter on sha256 calls."""
+    data, index = tmp_path / "data", tmp_path / "indexes"
+    (data / "rings").mkdir(parents=True)
+    index.mkdir()
+    for i in range(3):
+        Image.new("RGB", (8, 8), (i, 0, 0)).save(data / "rings" / f"r{i}.png")
+    (index / "faiss_image.index").write_bytes(b"\0" * 1024)
+
+    hashed = []
+    real = manifest._sha256
+    monkeypatch.setattr(manifest, "_sha256", lambda path, *a: hashed.append(os.path.basename(path)) or real(path, *a))
+    path = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(manifest, "load_manifest", functools.partial(manifest.load_manifest, path=path))
+    monkeypatch.setattr(manifest, "save_manifest", functools.partial(manifest.save_manifest, path=path))
+    return str(data), str(index), hashed
+
+
+def test_refresh_only_hashes_new_images(catalogue):
+    data, index, hashed = catalogue
+    files = {}
+    directories = manifest.scan_directories(data, files=files)
+    manifest.save_manifest(manifest.build_manifest(directories, 3, data_dir=data, index_dir=index, files=files))
+    assert sorted(hashed) == ["faiss_image.index", "r0.png", "r1.png", "r2.png"]
+
+    hashed.clear()
+    Image.new("RGB", (8, 8), "blue").save(os.path.join(data, "rings", "new.png"))
+    known = {"r0.png", "r1.png", "r2.png", "new.png"}
+    assert manifest.refresh_manifest({"rings"}, known, 4, data_dir=data, index_dir=index)
+    assert hashed == ["new.png"] # Neither the old images nor the index files
+
+    refreshed = manifest.load_manifest()
+    # Same content hash a full scan would record, so the next build doesn't see a change
+    assert refreshed["directories"]["rings"] == manifest.directory_entry(os.path.join(data, "rings"))
+    assert refreshed["indexes"]["faiss_image.index"]["sha256"] is None
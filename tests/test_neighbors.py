@@ -0,0 +1,29 @@
+import faiss
+import numpy as np
+from backend.search import neighbors
+
+
+def _unit(n, dim=32, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(v)
+    return v
+
+
+def test_extend_matches_full_rebuild():
+    old, new = _unit(300, seed=1), _unit(40, seed=2)
+    ids = [f"item_{i}" for i in range(340)]
+    base = neighbors.build_graph(ids[:300], photo=old, k=8)
+    extended = neighbors.extend(base, ids, {"photo": old}, {"photo": new})
+    full = neighbors.build_graph(ids, photo=np.vstack([old, new]), k=8)
+    # Old rows' scores are kept as float16, so near-ties may swap places;
+    # the neighbour sets must still be the same
+    np.testing.assert_array_equal(np.sort(extended.spaces["photo"][0], axis=1), np.sort(full.spaces["photo"][0], axis=1))
+    np.testing.assert_allclose(extended.spaces["photo"][1], full.spaces["photo"][1], atol=1e-3)
+
+
+def test_neighbors_exclude_self_and_pad_small_catalogues():
+    graph = neighbors.build_graph(["a", "b", "c"], photo=_unit(3), k=5)
+    rows = graph.neighbors("b")
+    assert sorted(r for r, _ in rows) == [0, 2] # Never itself; the rest of k is -1 padding
+    assert graph.neighbors("missing") is None
+    assert graph.neighbors("a", space="sketch") is None
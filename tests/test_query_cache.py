@@ -0,0 +1,41 @@
+import io
+import numpy as np
+from PIL import Image
+from backend.config import QUERY_CACHE_MAX_DISTANCE
+from backend.utils.query_cache import PerceptualCache, phash, hamming
+
+
+def test_exact_match_only_by_default_for_sketches():
+    cache = PerceptualCache("test", max_entries=4, max_distance=0)
+    cache.put(0b1010, "hit")
+    assert cache.get(0b1010) == "hit"
+    assert cache.get(0b1011) is None # One bit off
+
+
+def test_near_duplicates_hit_within_distance():
+    cache = PerceptualCache("test", max_entries=4, max_distance=2)
+    cache.put(0b1010, "hit")
+    assert cache.get(0b1001) == "hit" # Two bits off
+    assert cache.get(0b0101) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = PerceptualCache("test", max_entries=2, max_distance=0)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    cache.get(1)
+    cache.put(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+
+
+def test_phash_survives_recompression_and_resize():
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 255, (16, 16, 3), dtype=np.uint8)).resize((400, 300), Image.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=60)
+    again = Image.open(io.BytesIO(buf.getvalue())).resize((200, 150))
+    other = Image.fromarray(rng.integers(0, 255, (16, 16, 3), dtype=np.uint8)).resize((400, 300), Image.BICUBIC)
+    assert hamming(phash(img), phash(again)) <= QUERY_CACHE_MAX_DISTANCE
+    assert hamming(phash(img), phash(other)) > QUERY_CACHE_MAX_DISTANCE
@@ -0,0 +1,56 @@
+import faiss
+import numpy as np
+import pytest
+from backend.search import image_search
+from backend.search.index_store import IndexBundle
+from backend.search.sharding import split_bundle
+
+
+def _unit(n, dim=64, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(v)
+    return v
+
+
+def _flat(v):
+    index = faiss.IndexFlatIP(v.shape[1])
+    index.add(v)
+    return index
+
+
+def _bundle(n):
+    meta = [{"id": f"item_{i:04d}.jpg", "image_path": f"rings/item_{i:04d}.jpg", "category": "rings",
+             "caption": ""} for i in range(n)]
+    return IndexBundle(_flat(_unit(n, seed=1)), _flat(_unit(n, seed=2)), _unit(n, seed=3), meta)
+
+
+@pytest.mark.parametrize("n, shards", [(1000, 4), (999, 7)])
+def test_sharded_search_matches_flat_index(n, shards):
+    bundle = _bundle(n)
+    sharded = split_bundle(bundle, shards)
+    q = _unit(5, seed=4)
+    for flat, fanned in ((bundle.index, sharded.index), (bundle.sketch_index, sharded.sketch_index)):
+        want_scores, want_ids = flat.search(q, 30)
+        scores, ids = fanned.search(q, 30)
+        np.testing.assert_array_equal(ids, want_ids)
+        np.testing.assert_allclose(scores, want_scores, rtol=1e-5)
+
+
+def test_k_past_ntotal_pads_like_faiss():
+    bundle = _bundle(10)
+    _, want_ids = bundle.index.search(_unit(1, seed=4), 25)
+    _, ids = split_bundle(bundle, 4).index.search(_unit(1, seed=4), 25)
+    np.testing.assert_array_equal(ids, want_ids)
+
+
+def test_caption_fusion_matches_unsharded():
+    bundle = _bundle(1000)
+    sharded = split_bundle(bundle, 4)
+    query = _unit(1, seed=5)[0]
+    v_scores, v_indices = bundle.index.search(query.reshape(1, -1), 50)
+
+    def ranked(b):
+        out = image_search.caption_fusion(query, v_scores[0], v_indices[0], bundle=b)
+        return sorted(((c["id"], round(c["initial_score"], 5)) for c in out), key=lambda x: (-x[1], x[0]))
+
+    assert ranked(sharded) == ranked(bundle)
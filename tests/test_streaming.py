@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+from backend.voice.streaming import VoiceStream
+
+
+@pytest.mark.parametrize("fmt, dtype, scale", [("pcm_s16", "<i2", 32768.0), ("pcm_f32", "<f4", 1.0)])
+def test_frames_split_mid_sample_are_reassembled(fmt, dtype, scale):
+    samples = (np.sin(np.arange(1600) / 10) * 0.5 * scale).astype(dtype)
+    data = samples.tobytes()
+    stream = VoiceStream(fmt)
+    for i in range(0, len(data), 3): # Never a multiple of the sample width
+        stream.feed(data[i:i + 3])
+    np.testing.assert_allclose(stream._samples(), samples.astype(np.float32) / scale, atol=1e-6)
+    assert stream.received_s == pytest.approx(1600 / 16000)
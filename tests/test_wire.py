@@ -0,0 +1,36 @@
+import base64
+import numpy as np
+import pytest
+from backend.config import EMBED_DIM
+from backend.utils.wire import decode_vector
+
+
+def _vector(seed=0):
+    return np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+
+
+def test_float32_bytes_come_back_normalized():
+    v = _vector()
+    out = decode_vector(v.astype("<f4").tobytes())
+    assert out.dtype == np.float32 and out.shape == (EMBED_DIM,)
+    np.testing.assert_allclose(out, v / np.linalg.norm(v), rtol=1e-6)
+
+
+def test_dtype_inferred_from_size_and_base64_accepted():
+    v = _vector()
+    out = decode_vector(base64.b64encode(v.astype("<f2").tobytes()).decode())
+    np.testing.assert_allclose(out, v / np.linalg.norm(v), atol=2e-3)
+
+
+@pytest.mark.parametrize("data, dtype, message", [
+    (b"\0" * 100, None, "got 100 bytes"),
+    (_vector().astype("<f4").tobytes(), "float16", "Expected 512 float16"),
+    (_vector().astype("<f4").tobytes(), "float64", "dtype must be one of"),
+    ("not base64!", None, "not valid base64"),
+    (np.zeros(EMBED_DIM, "<f4").tobytes(), None, "non-zero"),
+    (np.full(EMBED_DIM, np.nan, "<f4").tobytes(), None, "finite"),
+    (np.full(EMBED_DIM, np.inf, "<f4").tobytes(), None, "finite"),
+])
+def test_rejects_anything_but_one_finite_vector(data, dtype, message):
+    with pytest.raises(ValueError, match=message):
+        decode_vector(data, dtype)